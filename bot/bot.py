@@ -6,94 +6,206 @@ Dedicated to my late friend, Mas, who was the reason I started
 this. Rest in peace.
 """
 import os
+import atexit
 import platform
 import logging
 import random
-from json import load
-from pathlib import Path
+
+# First, so the import timer sees everything imported after it.
+from utils.profiler import profiler
 
 import discord
 from discord.ext import commands, tasks
 
-# Fetch bot token.
-with Path("../config.json").open() as f:
-    config = load(f)
+from utils.cluster import ClusterHealth
+from utils.config import config
+from utils.database import Database
+from utils.discord import close_session, load_color_cache, save_color_cache
+from utils.members import MemberDirectory
+from utils.outbound import OutboundScheduler
 
+# Fetch bot token.
 TOKEN = config["DISCORD_TOKEN"]
+# Optional file keeping avatar colors across restarts.
+COLOR_CACHE_PATH = config.get("COLOR_CACHE_PATH", "")
+# Don't keep every member of every guild in memory, fetch them when needed.
+LOW_MEMORY = config.get("LOW_MEMORY", False)
 
 # DO NOT TOUCH - for running on hosting platform.
 if TOKEN == "":
     TOKEN = os.environ.get("DISCORD_TOKEN")
 
-intents = discord.Intents.default()
-intents.members = True
-intents.message_content = True
-intents.presences = False
-
-bot = commands.AutoShardedBot(
-    # shard_count=5, remove to automatically calculate depending on guild count.
-    intents=intents,
-    owner_ids=(354783154126716938, 691896247052927006, 234248229426823168)
-)
-
-# Logging (DEBUG clogs my stdout).
-logger = logging.getLogger("discord")
-logger.setLevel(logging.INFO)
-handler = logging.FileHandler(
-    filename="discord.log", encoding="utf-8", mode="w")
-handler.setFormatter(logging.Formatter(
-    "%(asctime)s:%(levelname)s:%(name)s: %(message)s"))
-logger.addHandler(handler)
-
-# Load cogs
-for filename in os.listdir('./cogs'):
-    if filename.endswith('.py'):
+OWNER_IDS = (354783154126716938, 691896247052927006, 234248229426823168)
+
+
+class NWordCounterBot(commands.AutoShardedBot):
+    """Bot that shuts its own background work down cleanly"""
+
+    # Set when running as one worker of cluster.py.
+    cluster_id: int | None = None
+    cluster: ClusterHealth | None = None
+
+    async def close(self):
+        if self.cluster is not None:
+            self.cluster.stop()
+            await self.cluster.publish(self, status="stopped")
+        # Stop the gateway first so no new messages come in while draining.
+        await super().close()
         try:
-            bot.load_extension(f'cogs.{filename[:-3]}')
-            logging.info(f'Loaded {filename[:-3]}')
-        except discord.errors.ExtensionFailed as e:
-            logging.error(f'Failed to load {filename[:-3]}')
-            logging.error(e.with_traceback(e.__traceback__))
-
-
-@bot.event
-async def on_ready():
-    """Display successful startup status"""
-    logger.info(f"{bot.user.name} connected!")
-    logger.info(f"Using Discord.py version {discord.__version__}")
-    logger.info(f"Using Python version {platform.python_version()}")
-    logger.info(
-        f"Running on {platform.system()} {platform.release()} ({os.name})")
-    await bot.change_presence(activity=discord.Activity(type=discord.ActivityType.watching, name=f"over your messages"))
-    # status_loop.start()
-
-
-@bot.slash_command(name="ping", description="Pong back latency")
-async def ping(ctx: discord.ApplicationContext):
-    """Pong back latency"""
-    await bot.wait_until_ready()
-    await ctx.respond(
-        f"_Pong!_ ({round(bot.latency * 1000, 1)} ms)",
-        ephemeral=True,
-        delete_after=15)
-
-# Removed for now, possible reason for rate limit.
-# @tasks.loop(seconds=30)
-# async def status_loop():
-#     """This loop runs every 30 seconds and changes the bot's status"""
-#     await bot.wait_until_ready()
-#     status = random.randint(1, 4)
-#     if status == 1:
-#         await bot.change_presence(
-#             activity=discord.Activity(type=discord.ActivityType.watching, name=f"over {len(bot.guilds)} servers"))
-#     elif status == 2:
-#         await bot.change_presence(activity=discord.Game(name=f"with {random.choice(bot.guilds).name}"))
-#     elif status == 3:
-#         await bot.change_presence(
-#             activity=discord.Activity(type=discord.ActivityType.listening, name=f" your messages"))
-#     elif status == 4:
-#        await bot.change_presence(activity=discord.Activity(type=discord.ActivityType.watching, name=" your language"))
+            counter = self.get_cog("NWordCounter")
+            if counter is not None:
+                await counter.pipeline.close()
+            await self.outbound.close()
+        finally:
+            try:
+                await Database.close()  # Flushes buffered increments.
+            finally:
+                await close_session()
+
+
+def create_bot(shard_ids: list[int] | None = None, shard_count: int | None = None,
+               cluster_id: int | None = None, health=None) -> NWordCounterBot:
+    """Build the bot with every cog loaded
+
+    Without arguments it runs every shard, with shard_ids and shard_count
+    only those (cluster.py gives each worker process its own range).
+    """
+    intents = discord.Intents.default()
+    intents.members = True
+    intents.message_content = True
+    intents.presences = False
+
+    if LOW_MEMORY:
+        # Members still arrive with messages and interactions, they just
+        # aren't kept. The members intent is still needed for join/leave.
+        cache_options = {
+            "member_cache_flags": discord.MemberCacheFlags.none(),
+            "chunk_guilds_at_startup": False
+        }
+    else:
+        cache_options = {}
+
+    bot = NWordCounterBot(
+        # shard_count=5, remove to automatically calculate depending on guild count.
+        shard_ids=shard_ids,
+        shard_count=shard_count,
+        intents=intents,
+        owner_ids=OWNER_IDS,
+        **cache_options
+    )
+    bot.cluster_id = cluster_id
+    if health is not None:
+        bot.cluster = ClusterHealth(health, cluster_id, shard_ids)
+
+    # Every reply and presence change the bot makes on its own goes through here.
+    bot.outbound = OutboundScheduler(bot)
+    # Member counts and lookups for commands, works with or without LOW_MEMORY.
+    bot.members = MemberDirectory()
+
+    # Logging (DEBUG clogs my stdout).
+    logger = logging.getLogger("discord")
+    logger.setLevel(logging.INFO)
+    handler = logging.FileHandler(
+        filename="discord.log" if cluster_id is None else f"discord-{cluster_id}.log",
+        encoding="utf-8", mode="w")
+    handler.setFormatter(logging.Formatter(
+        "%(asctime)s:%(levelname)s:%(name)s: %(message)s"))
+    logger.addHandler(handler)
+
+    # Load cogs
+    with profiler.phase("load_extensions"):
+        for filename in os.listdir('./cogs'):
+            if filename.endswith('.py'):
+                try:
+                    with profiler.extension(f'cogs.{filename[:-3]}'):
+                        bot.load_extension(f'cogs.{filename[:-3]}')
+                    logging.info(f'Loaded {filename[:-3]}')
+                except discord.errors.ExtensionFailed as e:
+                    logging.error(f'Failed to load {filename[:-3]}')
+                    logging.error(e.with_traceback(e.__traceback__))
+
+    @bot.listen()
+    async def on_shard_connect(shard_id: int):
+        profiler.shard_event(shard_id, "connect")
+
+    @bot.listen()
+    async def on_shard_ready(shard_id: int):
+        profiler.shard_event(shard_id, "ready")
+
+    @bot.listen()
+    async def on_member_join(member: discord.Member):
+        bot.members.member_joined(member)
+
+    @bot.listen()
+    async def on_raw_member_remove(payload: discord.RawMemberRemoveEvent):
+        # Unlike on_member_remove, fires for members that weren't cached.
+        bot.members.member_left(payload.guild_id, payload.user)
+
+    @bot.listen()
+    async def on_guild_remove(guild: discord.Guild):
+        bot.members.forget_guild(guild.id)
+
+    @bot.event
+    async def on_ready():
+        """Display successful startup status"""
+        profiler.finish()  # Every shard is ready, no-op after reconnects.
+        logger.info(f"{bot.user.name} connected!")
+        logger.info(f"Using Discord.py version {discord.__version__}")
+        logger.info(f"Using Python version {platform.python_version()}")
+        logger.info(
+            f"Running on {platform.system()} {platform.release()} ({os.name})")
+        bot.outbound.set_presence(discord.Activity(type=discord.ActivityType.watching, name=f"over your messages"))
+        if not status_loop.is_running():
+            status_loop.start()
+        if bot.cluster is not None:
+            bot.cluster.start(bot)
+
+    @bot.slash_command(name="ping", description="Pong back latency")
+    async def ping(ctx: discord.ApplicationContext):
+        """Pong back latency"""
+        await bot.wait_until_ready()
+        await ctx.respond(
+            f"_Pong!_ ({round(bot.latency * 1000, 1)} ms)",
+            ephemeral=True,
+            delete_after=15)
+
+    @tasks.loop(seconds=30)
+    async def status_loop():
+        """This loop runs every 30 seconds and changes the bot's status"""
+        await bot.wait_until_ready()
+        status = random.randint(1, 4)
+        # Goes through the outbound scheduler, which rate limits presence updates.
+        if status == 1:
+            bot.outbound.set_presence(
+                discord.Activity(type=discord.ActivityType.watching, name=f"over {len(bot.guilds)} servers"))
+        elif status == 2:
+            bot.outbound.set_presence(discord.Game(name=f"with {random.choice(bot.guilds).name}"))
+        elif status == 3:
+            bot.outbound.set_presence(
+                discord.Activity(type=discord.ActivityType.listening, name=f" your messages"))
+        elif status == 4:
+            bot.outbound.set_presence(discord.Activity(type=discord.ActivityType.watching, name=" your language"))
+
+    return bot
+
+
+def run_bot(shard_ids: list[int] | None = None, shard_count: int | None = None,
+            cluster_id: int | None = None, health=None) -> None:
+    """Create the bot, start the database and block until the bot closes"""
+    if COLOR_CACHE_PATH:
+        # One file per worker, they'd overwrite each other's otherwise.
+        path = COLOR_CACHE_PATH if cluster_id is None else f"{COLOR_CACHE_PATH}.{cluster_id}"
+        load_color_cache(path)
+        atexit.register(save_color_cache, path)
+    if profiler.enabled and cluster_id is not None:
+        profiler.path = f"{profiler.path}.{cluster_id}"  # Same for the profile.
+
+    bot = create_bot(shard_ids, shard_count, cluster_id, health)
+    # Connect and warm up the database before the gateway delivers anything.
+    with profiler.phase("database_start"):
+        bot.loop.run_until_complete(Database.start())
+    bot.run(TOKEN, reconnect=True)
 
 
 if __name__ == "__main__":
-    bot.run(TOKEN, reconnect=True)
+    run_bot()
@@ -0,0 +1,185 @@
+"""Cluster launcher
+
+Runs the bot as several worker processes, each owning a contiguous range
+of shards, and restarts workers that die. Use it instead of bot.py once a
+single process can't keep up with every shard.
+
+USAGE: cd bot, then py cluster.py
+
+Config: CLUSTER_PROCESSES (default: CPU count) and SHARD_COUNT (default:
+Discord's recommendation for the bot).
+"""
+import os
+import time
+import signal
+import asyncio
+import logging
+import multiprocessing
+from multiprocessing.managers import SyncManager
+
+from utils.cluster import shard_ranges
+from utils.config import config
+
+CLUSTER_PROCESSES = config.get("CLUSTER_PROCESSES", os.cpu_count() or 1)
+SHARD_COUNT = config.get("SHARD_COUNT", 0)  # 0 to ask Discord.
+READY_TIMEOUT = 300  # Seconds to wait for a worker before starting the next.
+RESTART_BACKOFF_MAX = 300  # Cap on the wait before restarting a crashed worker.
+HEALTHY_UPTIME = 600  # A worker up this long is no longer "crash looping".
+STOP_TIMEOUT = 30  # Seconds a worker gets to close before it's killed.
+
+GATEWAY_URL = "https://discord.com/api/v10/gateway/bot"
+
+
+def get_token() -> str:
+    # Same lookup as bot.py.
+    return config["DISCORD_TOKEN"] or os.environ.get("DISCORD_TOKEN")
+
+
+async def recommended_shards(token: str) -> int:
+    """Ask Discord how many shards the bot should run"""
+    import aiohttp
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+                GATEWAY_URL, headers={"Authorization": f"Bot {token}"}) as resp:
+            resp.raise_for_status()
+            return (await resp.json())["shards"]
+
+
+def ignore_sigint() -> None:
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def run_worker(shard_ids: list[int], shard_count: int, cluster_id: int, health) -> None:
+    """Entry point of a worker process"""
+    from bot import run_bot  # Imported here so only workers load discord.
+    run_bot(shard_ids, shard_count, cluster_id, health)
+
+
+class Worker:
+    """One worker process and its restart bookkeeping"""
+
+    def __init__(self, cluster_id: int, shard_ids: list[int]):
+        self.cluster_id = cluster_id
+        self.shard_ids = shard_ids
+        self.process: multiprocessing.Process | None = None
+        self.started = 0.0
+        self.restarts = 0
+        self.restart_at = 0.0
+
+    def start(self, context, shard_count: int, health) -> None:
+        health.pop(self.cluster_id, None)  # Forget the last run's status.
+        self.process = context.Process(
+            target=run_worker,
+            args=(self.shard_ids, shard_count, self.cluster_id, health),
+            name=f"cluster-{self.cluster_id}"
+        )
+        self.process.start()
+        self.started = time.monotonic()
+        logging.info(
+            f"Started cluster {self.cluster_id} (shards {self.shard_ids[0]}-"
+            f"{self.shard_ids[-1]}, pid {self.process.pid})")
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def stop(self) -> None:
+        if self.is_alive():
+            self.process.terminate()  # SIGTERM, the bot closes gracefully.
+
+
+class Launcher:
+    """Start workers one after another and keep them running"""
+
+    def __init__(self, shard_count: int, processes: int):
+        self.shard_count = shard_count
+        self.context = multiprocessing.get_context("spawn")
+        # Ctrl+C reaches the whole process group, the health dict must outlive it.
+        self.manager = SyncManager(ctx=self.context)
+        self.manager.start(ignore_sigint)
+        self.health = self.manager.dict()
+        self.workers = [
+            Worker(cluster_id, shard_ids)
+            for cluster_id, shard_ids in enumerate(shard_ranges(shard_count, processes))
+        ]
+        self.stopping = False
+
+    def wait_ready(self, worker: Worker) -> None:
+        """Block until a worker reports ready, so identifies don't pile up"""
+        deadline = time.monotonic() + READY_TIMEOUT
+        while not self.stopping and worker.is_alive() and time.monotonic() < deadline:
+            if self.health.get(worker.cluster_id, {}).get("status") == "ready":
+                return
+            time.sleep(1)
+        if not self.stopping and worker.is_alive():
+            logging.warning(f"Cluster {worker.cluster_id} not ready after {READY_TIMEOUT}s")
+
+    def start_worker(self, worker: Worker) -> None:
+        worker.start(self.context, self.shard_count, self.health)
+        self.wait_ready(worker)
+
+    def supervise(self) -> None:
+        """Restart dead workers, backing off if they keep dying"""
+        while not self.stopping:
+            for worker in self.workers:
+                if self.stopping or worker.is_alive():
+                    continue
+                now = time.monotonic()
+                if not worker.restart_at:
+                    uptime = now - worker.started
+                    if uptime >= HEALTHY_UPTIME:
+                        worker.restarts = 0
+                    delay = min(2 ** worker.restarts, RESTART_BACKOFF_MAX)
+                    worker.restart_at = now + delay
+                    logging.error(
+                        f"Cluster {worker.cluster_id} exited with code "
+                        f"{worker.process.exitcode} after {uptime:.0f}s, "
+                        f"restarting in {delay}s")
+                elif now >= worker.restart_at:
+                    worker.restarts += 1
+                    worker.restart_at = 0.0
+                    self.start_worker(worker)
+            time.sleep(1)
+
+    def stop(self, *_) -> None:
+        self.stopping = True
+
+    def shutdown(self) -> None:
+        for worker in self.workers:
+            worker.stop()
+        deadline = time.monotonic() + STOP_TIMEOUT
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            worker.process.join(max(0.0, deadline - time.monotonic()))
+            if worker.process.is_alive():
+                logging.warning(f"Cluster {worker.cluster_id} didn't stop, killing it")
+                worker.process.kill()
+                worker.process.join()
+        self.manager.shutdown()
+
+    def run(self) -> None:
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        try:
+            for worker in self.workers:
+                if self.stopping:
+                    break
+                self.start_worker(worker)
+            self.supervise()
+        finally:
+            self.shutdown()
+
+
+def main() -> None:
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s:%(levelname)s:cluster: %(message)s")
+    shard_count = SHARD_COUNT or asyncio.run(recommended_shards(get_token()))
+    launcher = Launcher(shard_count, CLUSTER_PROCESSES)
+    logging.info(
+        f"Running {shard_count} shards in {len(launcher.workers)} processes")
+    launcher.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
 import os
+import time
 
 import discord
 import logging
+from discord.ext import commands
+from utils.database import Database
+from utils.metrics import metrics
 
 
 class Developer(discord.Cog):
@@ -104,6 +108,92 @@ class Developer(discord.Cog):
         await ctx.defer()
         await ctx.respond("Logs", file=discord.File("discord.log"))
 
+    @dev.command(
+        name="migrate",
+        description="(Bot dev only) Move embedded members into their own documents")
+    @commands.is_owner()
+    async def migrate(self, ctx):
+        """(Bot dev only) Move embedded members into their own documents"""
+        await ctx.defer(ephemeral=True)
+        migrated = await Database.migrate_members()
+        await Database.verify_totals(repair=True)  # Totals include migrated counts.
+        await ctx.respond(
+            f"Migrated {migrated['members']:,} members from "
+            f"{migrated['guilds']:,} guilds.", ephemeral=True)
+
+    @dev.command(
+        name="pipeline",
+        description="(Bot dev only) Show message pipeline and reply scheduler stats")
+    @commands.is_owner()
+    async def pipeline(self, ctx):
+        """(Bot dev only) Show message pipeline and reply scheduler stats"""
+        stats = self.bot.get_cog("NWordCounter").pipeline.stats()
+        outbound = self.bot.outbound.stats()
+        await ctx.respond(
+            "\n".join(f"{name}: {value}" for name, value in stats.items())
+            + "\n\n**Outbound**\n"
+            + "\n".join(f"{name}: {value}" for name, value in outbound.items()),
+            ephemeral=True, delete_after=30)
+
+    @dev.command(
+        name="stats",
+        description="(Bot dev only) Show hot path and database latencies")
+    @commands.is_owner()
+    async def stats(self, ctx):
+        """(Bot dev only) Show hot path and database latencies"""
+        def table(summary: dict) -> str:
+            return "\n".join(
+                f"{name}: n={row['count']:,} mean={row['mean_ms']}ms "
+                f"p50<={row['p50_ms']:g}ms p99<={row['p99_ms']:g}ms"
+                for name, row in sorted(summary.items())) or "none"
+
+        uptime = time.monotonic() - metrics.started
+        shards = "\n".join(
+            f"shard {labels[0][1]}: {count / uptime:.2f} msg/s"
+            for labels, count in sorted(metrics.counters.get("messages_total", {}).items())
+        ) or "none"
+        # Slowest database calls first, the full list is on /metrics.
+        db_calls = sorted(
+            metrics.summary("db_call_seconds").items(),
+            key=lambda item: item[1]["p99_ms"], reverse=True)[:10]
+        errors = sum(metrics.counters.get("db_call_errors_total", {}).values())
+        await ctx.respond(
+            f"**Stages**\n```{table(metrics.summary('nword_stage_seconds'))}```"
+            f"**Slowest database calls** ({errors:,} errors)\n```{table(dict(db_calls))}```"
+            f"**Messages per shard**\n```{shards}```",
+            ephemeral=True, delete_after=60)
+
+    @dev.command(
+        name="totals",
+        description="(Bot dev only) Verify running n-word totals against member counts")
+    @discord.option(name="repair", description="Write back recomputed totals",
+                    type=bool, required=False, default=False)
+    @commands.is_owner()
+    async def totals(self, ctx, repair: bool = False):
+        """(Bot dev only) Verify running n-word totals against member counts"""
+        await ctx.defer(ephemeral=True)
+        result = await Database.verify_totals(repair=repair)
+        global_totals = result["global"]
+        await ctx.respond(
+            f"{len(result['guilds']):,} guild totals drifted.\n"
+            f"Global total: stored {global_totals['stored']:,}, "
+            f"actual {global_totals['actual']:,}."
+            f"{' Repaired.' if repair else ''}",
+            ephemeral=True)
+
+    @dev.command(
+        name="indexes",
+        description="(Bot dev only) Report missing and unused database indexes")
+    @commands.is_owner()
+    async def indexes(self, ctx):
+        """(Bot dev only) Report missing and unused database indexes"""
+        await ctx.defer(ephemeral=True)
+        report = await Database.index_report()
+        await ctx.respond(
+            f"Missing: {', '.join(report['missing']) or 'none'}\n"
+            f"Unused since restart: {', '.join(report['unused']) or 'none'}",
+            ephemeral=True)
+
 
 
 def setup(bot):
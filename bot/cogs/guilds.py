@@ -0,0 +1,44 @@
+"""Cog for keeping guild records in sync with the guilds the bot is in"""
+import asyncio
+import discord
+from discord.ext import commands
+from utils.database import Database
+
+
+class GuildRegistry(commands.Cog):
+    """Listeners maintaining the in-process guild registry"""
+
+    def __init__(self, bot):
+        self.bot: commands.AutoShardedBot = bot
+
+        # Get singleton database connection.
+        self.db = Database()
+        self._index_task: asyncio.Task | None = None
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        """Reconcile every guild the bot is in with one bulk upsert"""
+        # Index builds can take a while, don't hold up the guild sync.
+        if self._index_task is None:
+            self._index_task = asyncio.create_task(self.db.ensure_indexes())
+        await self.db.sync_guilds(
+            [(guild.id, guild.name) for guild in self.bot.guilds])
+        await self.db.ensure_totals()
+        await self.db.migrate_settings()  # No-op once every guild is converted.
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild: discord.Guild):
+        await self.db.create_database(guild.id, guild.name)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        self.db.forget_guild(guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_update(self, before: discord.Guild, after: discord.Guild):
+        if before.name != after.name:
+            await self.db.update_guild_name(after.id, after.name)
+
+
+def setup(bot):
+    bot.add_cog(GuildRegistry(bot))
@@ -1,11 +1,12 @@
 """Cog for storing n-word count stats and bot meta stuff"""
+import logging
+from datetime import timezone
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import option
 from utils.database import Database
-from utils.paginator import paginator
+from utils.paginator import LazyPaginator, RankingPageSource
 from utils.discord import convert_color, generate_message_embed, generate_color
-from discord.ext.pages import Paginator
 from discord.ui import Button, View
 import platform
 import os
@@ -26,6 +27,47 @@ class Meta(commands.Cog):
         self.invite_url = "https://discord.com/oauth2/authorize?client_id=939483341684605018&permissions=412317244480" \
                           "&scope=bot"
 
+        # In-memory copy of the materialized global leaderboards.
+        self.leaderboards: dict[str, dict] = {}
+        self.refresh_leaderboards.change_interval(
+            seconds=self.db.LEADERBOARD_REFRESH_SECONDS)
+        self.refresh_leaderboards.start()
+
+    def cog_unload(self):
+        self.refresh_leaderboards.cancel()
+
+    @tasks.loop(seconds=300)
+    async def refresh_leaderboards(self):
+        """Recompute global leaderboard snapshots and keep a copy in memory"""
+        # With cluster.py, only the first worker recomputes, the rest just read.
+        if not getattr(self.bot, "cluster_id", None):
+            try:
+                await self.db.materialize_leaderboards(limit=100)
+            except Exception as e:
+                logging.error(f"Failed to materialize leaderboards: {e}")
+        self.leaderboards = await self.db.get_leaderboards()
+
+    @refresh_leaderboards.before_loop
+    async def before_refresh_leaderboards(self):
+        await self.bot.wait_until_ready()  # Database is started by then.
+
+    async def get_leaderboard(self, name: str) -> tuple[list, str]:
+        """Return snapshot entries and an "as of" line for a global leaderboard"""
+        if name not in self.leaderboards:  # First refresh hasn't finished yet.
+            self.leaderboards = await self.db.get_leaderboards()
+        snapshot = self.leaderboards.get(name)
+        if snapshot is None:
+            return [], ""
+        as_of = int(snapshot["as_of"].replace(tzinfo=timezone.utc).timestamp())
+        return snapshot["entries"], f"\n*As of <t:{as_of}:R>*"
+
+    @staticmethod
+    def snapshot_fetcher(entries: list):
+        """Return a page fetcher slicing an in-memory leaderboard"""
+        async def fetch(skip: int, count: int) -> list:
+            return entries[skip:skip + count]
+        return fetch
+
     top = discord.SlashCommandGroup(
         name="top", description="View scoreboards for the bot")
     top_global = top.create_subgroup(
@@ -49,20 +91,26 @@ class Meta(commands.Cog):
                 ephemeral=True, delete_after=5)
             return
 
-        top_members = await self.db.get_member_list(ctx.guild.id)
         server_nword_total = await self.db.get_nword_server_total(ctx.guild.id)
+        # 0 until the running totals exist or catch up with the buffer.
+        global_nword_total = await self.db.get_global_nword_count()
+        server_share = server_nword_total / global_nword_total * 100 if global_nword_total else 0
         embed_data = {
             "title": f"Top users in {ctx.guild.name}",
             "description": f"I have seen **{server_nword_total}** n-words in this server!\n"
-                           f"That's **{round(server_nword_total / await self.db.get_global_nword_count() * 100, 3)}%**"
+                           f"That's **{round(server_share, 3)}%**"
                            f" of all n-words!",
             "url": "https://bit.ly/3JmG6cD",
             "color": HEX_OG_BLURPLE
         }
         data_vals = {"type": "rankings"}
-        pages = paginator(limit, self.MAX_PER_PAGE, embed_data,
-                          top_members, data_vals)
-        page_iterator = Paginator(pages=pages, loop_pages=True)
+        guild_id = ctx.guild.id
+
+        async def fetch(skip: int, count: int) -> list:
+            return await self.db.get_member_page(guild_id, skip, count)
+
+        source = RankingPageSource(fetch, limit, self.MAX_PER_PAGE, embed_data, data_vals)
+        page_iterator = LazyPaginator(source, loop_pages=True)
         await page_iterator.respond(ctx.interaction)
 
     @top_global.command(name="user",
@@ -81,18 +129,18 @@ class Meta(commands.Cog):
                 ephemeral=True, delete_after=5)
             return
 
-        top_members = await self.db.get_all_time_counts(limit)
+        top_members, as_of = await self.get_leaderboard("users")
         embed_data = {
             "title": "Top users globally",
             "description": f"I have seen the N-word used **{await self.db.get_global_nword_count():,}** times"
-                           f" globally!",
+                           f" globally!{as_of}",
             "url": "https://bit.ly/3JmG6cD",
             "color": HEX_OG_BLURPLE
         }
         data_vals = {"type": "topcounts"}
-        pages = paginator(limit, self.MAX_PER_PAGE, embed_data,
-                          top_members, data_vals)
-        page_iterator = Paginator(pages=pages, loop_pages=True)
+        source = RankingPageSource(
+            self.snapshot_fetcher(top_members), limit, self.MAX_PER_PAGE, embed_data, data_vals)
+        page_iterator = LazyPaginator(source, loop_pages=True)
         await page_iterator.respond(ctx.interaction, ephemeral=True)
 
     @top_global.command(name="guild", description="View the top guilds.")
@@ -110,17 +158,17 @@ class Meta(commands.Cog):
                 ephemeral=True, delete_after=5)
             return
 
-        top_servers = await self.db.get_all_time_servers(limit)
+        top_servers, as_of = await self.get_leaderboard("guilds")
         embed_data = {
             "title": "Top guilds globally",
-            "description": f"",
+            "description": f"{as_of}",
             "url": "https://bit.ly/3JmG6cD",
             "color": HEX_OG_BLURPLE
         }
         data_vals = {"type": "topservers"}
-        pages = paginator(limit, self.MAX_PER_PAGE, embed_data,
-                          top_servers, data_vals)
-        page_iterator = Paginator(pages=pages, loop_pages=True)
+        source = RankingPageSource(
+            self.snapshot_fetcher(top_servers), limit, self.MAX_PER_PAGE, embed_data, data_vals)
+        page_iterator = LazyPaginator(source, loop_pages=True)
         await page_iterator.respond(ctx.interaction, ephemeral=True)
 
     @commands.slash_command(
@@ -134,7 +182,7 @@ class Meta(commands.Cog):
             title="N-Word Counter",
             description=f"A bot that counts n-word usage in your server\nFun fact: I have seen the n-word used "
                         f"{await self.db.get_nword_server_total(ctx.guild.id)} times!",
-            color=await generate_color(ctx.author.avatar.url)
+            color=await generate_color(ctx.author.display_avatar)
         )
         embed.add_field(
             name="Invite",
@@ -161,14 +209,16 @@ class Meta(commands.Cog):
             value=f"{await self.db.get_total_documents()} document{'s' if await self.db.get_total_documents() > 1 else ''}",
             inline=False
         )
+        cluster = getattr(self.bot, "cluster", None)
+        summary = await cluster.summary() if cluster is not None else None
         embed.add_field(
             name="Servers",
-            value=f"{len(self.bot.guilds)}",
+            value=f"{summary['guilds'] if summary else len(self.bot.guilds)}",
             inline=True
         )
         embed.add_field(
             name="Users",
-            value=f"{len(self.bot.users)}",
+            value=f"{summary['users'] if summary else len(self.bot.users)}",
             inline=True
         )
         embed.add_field(
@@ -191,6 +241,16 @@ class Meta(commands.Cog):
                   f"Total shards: {shard_count}",
             inline=True
         )
+        if summary:
+            embed.add_field(
+                name="Clusters",
+                value="\n".join(
+                    f"Cluster {c['cluster_id']}: {c['status']}, "
+                    f"{c['latency_ms'] if c['latency_ms'] is not None else '?'} ms, "
+                    f"{c['guilds']} guilds"
+                    for c in summary["clusters"]),
+                inline=False
+            )
         embed.add_field(
             name="Server Info",
             value=f"Python version: {platform.python_version()}\n"
@@ -200,7 +260,7 @@ class Meta(commands.Cog):
             inline=True)
         embed.set_footer(
             text=f"Command ran by {ctx.author.display_name} | {ctx.bot.user.name}",
-            icon_url=ctx.author.avatar.url)
+            icon_url=ctx.author.display_avatar.url)
         view = View()
         view.add_item(
             Button(
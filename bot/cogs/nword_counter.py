@@ -1,25 +1,20 @@
 """Cog for n-word counting and storing logic"""
 import re
 import random
-import string
+import asyncio
+from pathlib import Path
 import discord
 from discord import option
-from discord.ext import commands
+from discord.ext import commands, tasks
 from utils.database import Database
+from utils.config import config
 from utils.discord import convert_color, generate_message_embed
+from utils.ingest import Hit, IngestionPipeline
+from utils.metrics import metrics
+from utils.outbound import Priority
+from utils.matcher import NWORDS_LIST, HARD_RS_LIST, NWordMatcher
 
-# Create the n-word lists from ASCII, so I don't have to type it.
-NWORDS_LIST = [
-    (chr(110) + chr(105) + chr(103) + chr(103) + chr(97)),
-    (chr(47) + chr(92) + chr(47) + chr(105) + chr(103) + chr(103) + chr(97)),
-    (chr(124) + chr(92) + chr(47) + chr(105) + chr(103) + chr(103) + chr(97))
-]
-HARD_RS_LIST = [
-    (chr(110) + chr(105) + chr(103) + chr(103) + chr(101) + chr(114)),
-    (chr(47) + chr(92) + chr(47) + chr(105) + chr(103) + chr(103) + chr(101) +
-     chr(114)),
-    (chr(124) + chr(92) + chr(47) + chr(105) + chr(103) + chr(103) + chr(101) +
-     chr(114))]
+WHITELIST_PATH = Path(__file__).parent.parent / "whitelist.txt"
 
 
 class NWordCounter(commands.Cog):
@@ -34,23 +29,31 @@ class NWordCounter(commands.Cog):
         self.sacred_n_words = NWORDS_LIST
         self.sacred_hard_r_words = HARD_RS_LIST
 
+        # Compiled once, whitelist changes are swapped in by the watcher.
+        self.matcher = NWordMatcher(
+            self.sacred_n_words + self.sacred_hard_r_words, WHITELIST_PATH)
+        self.whitelist_watcher.start()
+
+        # Bounded hand-off from the listener to database workers.
+        self.pipeline = IngestionPipeline(
+            self.process_hit, self.shed_hit,
+            workers=config.get("INGEST_WORKERS", 4),
+            maxsize=config.get("INGEST_QUEUE_SIZE", 1000),
+            merge_key=lambda message: (message.guild.id, message.author.id))
+
+    def cog_unload(self):
+        self.whitelist_watcher.cancel()
+        asyncio.create_task(self.pipeline.close())
+
+    @tasks.loop(seconds=30)
+    async def whitelist_watcher(self):
+        """Hot-swap the matcher when whitelist.txt changes on disk"""
+        await asyncio.to_thread(self.matcher.reload_if_changed)
+
     def count_nwords(self, msg: str) -> int:
         """Return occurrences of n-words in a given message"""
-        count = 0
-        msg = msg.lower().strip().translate(
-            {ord(char): "" for char in string.whitespace})
         # I swear all the words in whitelist.txt are actual words
-        with open("whitelist.txt", "r") as f:
-            whitelist = f.read().splitlines()
-        for word in whitelist:
-            if word in msg:
-                count -= 1  # subtract 1 from count if word is in message
-        for n_word in self.sacred_n_words:
-            count += msg.count(n_word)
-        for hard_r in self.sacred_hard_r_words:
-            count += msg.count(hard_r)
-        # Return count if count is positive, else return 0
-        return count if count >= 0 else 0
+        return self.matcher.count(msg)
 
     async def is_black(self, guild_id, author_id) -> bool:
         """Check if user is verified to be black"""
@@ -126,44 +129,59 @@ class NWordCounter(commands.Cog):
         if message.author.bot:  # Ignore spammy bots.
             return
 
-        guild = message.guild
         msg = message.content
-        author = message.author  # Should fetch user by ID instead of name.
 
         # Add notice of migration to slash commands.
         if msg.startswith("n!") and has_message_perms:
-            await message.reply(embed=await generate_message_embed(
+            self.bot.outbound.reply(message, embed=await generate_message_embed(
                 f"**{message.author.display_name.title()}** we've moved to slash commands! Use `/` to get started.",
-                color=convert_color("#ff2222")), delete_after=10)
-
-        # Ensure guild has its own place in the database.
-        if not await self.db.guild_in_database(guild.id):
-            await self.db.create_database(guild.id, guild.name)
-
-        # Get settings for guild.
-        guild_settings = await self.db.get_guild_settings(guild.id)
+                color=convert_color("#ff2222")), delete_after=10, priority=Priority.NOTICE)
 
         # Bot reaction to any n-word occurrence.
-        num_nwords = self.count_nwords(msg)
+        with metrics.stage("match"):
+            num_nwords = self.count_nwords(msg)
 
         # No n-words found.
         if num_nwords <= 0:
             return
 
+        # Database work and the reply happen in the pipeline workers.
+        self.pipeline.submit(message, num_nwords)
+
+    async def process_hit(self, hit: Hit, reply: bool):
+        """Record a hit and reply to it (pipeline worker)"""
+        message = hit.message
+        num_nwords = hit.count
+        guild = message.guild
+        author = message.author
+        has_message_perms: bool = reply and message.channel.permissions_for(
+            guild.me).send_messages
+
+        # Get settings for guild.
+        with metrics.stage("settings"):
+            guild_settings = await self.db.get_guild_settings(guild.id)
+
+        # Ensure guild has its own place in the database.
+        with metrics.stage("guild_check"):
+            if not await self.db.guild_in_database(guild.id):
+                await self.db.create_database(guild.id, guild.name)
+
         if message.webhook_id and has_message_perms:  # Ignore webhooks.
-            await message.reply(
+            self.bot.outbound.reply(
+                message,
                 content="Not a person, I won't count this.",
-                delete_after=30
+                delete_after=30,
+                priority=Priority.NOTICE
             )
             return
 
-        if not await self.db.member_in_database(guild.id, author.id):
-            await self.db.create_member(guild.id, author.id, author.name)
-
-        await self.db.increment_nword_count(guild.id, author.id, num_nwords)
+        # Creates the member if needed and returns their updated state.
+        with metrics.stage("member_upsert"):
+            member = await self.db.record_occurrence(
+                guild.id, author.id, author.name, num_nwords)
 
         # Don't react to someone already verified.
-        if await self.is_black(guild.id, author.id):
+        if member and member["is_black"]:
             return
 
         # Mitigate ratelimiting, usually this amount is just spam.
@@ -179,7 +197,19 @@ class NWordCounter(commands.Cog):
         # if has_message_perms and guild_settings["send_message"]["value"]:
 
         if has_message_perms:
-            await message.reply(f"{message.author.mention} {response}")
+            # Scheduled, merged with other replies in the channel if backed up.
+            self.bot.outbound.reply(message, f"{message.author.mention} {response}")
+
+    async def shed_hit(self, hit: Hit):
+        """Only count a hit, for when the pipeline queue is full"""
+        message = hit.message
+        if message.webhook_id:
+            return
+        if not await self.db.guild_in_database(message.guild.id):
+            await self.db.create_database(message.guild.id, message.guild.name)
+        with metrics.stage("increment"):
+            await self.db.buffer_nword_count(
+                message.guild.id, message.author.id, hit.count)
 
     def get_id_from_mention(self, mention: str) -> int:
         """Extract user ID from mention string"""
@@ -188,17 +218,19 @@ class NWordCounter(commands.Cog):
         print(mention, re.sub("[^0-9]", "", mention))
         return int(re.sub("[^0-9]", "", mention))
 
-    def verify_mentions(self, mentions: discord.Member,
-                        ctx: discord.ApplicationContext) -> str:
+    async def verify_mentions(self, mentions: discord.Member,
+                              ctx: discord.ApplicationContext) -> str:
         """Check if mention being passed into command is valid. This is no longer needed as discord does this for us.
         With slash commands.
 
         This code now checks if the user is in the guild, and if not, returns an error message.
         """
 
+        # Slash command options resolve to a Member only for guild members.
+        if isinstance(mentions, discord.Member) and mentions.guild.id == ctx.guild.id:
+            return ""
         # Ensure user is part of guild.
-        guild = ctx.guild
-        if not guild.get_member(mentions.id):
+        if not await self.bot.members.resolve(ctx.guild, mentions.id):
             return "User not in server"
         else:
             return ""
@@ -212,7 +244,7 @@ class NWordCounter(commands.Cog):
         await ctx.defer()
         user = user if user else ctx.author
         # Validate mention.
-        invalid_mention_msg = self.verify_mentions(user, ctx)
+        invalid_mention_msg = await self.verify_mentions(user, ctx)
         if invalid_mention_msg:
             await ctx.respond(invalid_mention_msg)
             return
@@ -238,17 +270,6 @@ class NWordCounter(commands.Cog):
         else:
             return 10
 
-    def user_voted_for(self, voter_id: int, member: dict) -> bool:
-        """Return whether the user voted for the member"""
-        if member is None:
-            return False
-
-        voter_list = member["voters"]
-        if voter_id in voter_list:
-            return True
-
-        return False
-
     @commands.slash_command(
         name="vote",
         description="Vouch for someone's blackness")
@@ -301,12 +322,11 @@ class NWordCounter(commands.Cog):
                            user: discord.Member = None) -> tuple[str, str]:
         """Main logic for voting and unvoting
            user = user to vote for
-           user_d = user data from database
            type = vote or unvote"""
         user = user if user else ctx.author
 
         # Must mention someone.
-        invalid_mention_msg = self.verify_mentions(user, ctx)
+        invalid_mention_msg = await self.verify_mentions(user, ctx)
         if invalid_mention_msg:
             return invalid_mention_msg, "error"
 
@@ -314,38 +334,26 @@ class NWordCounter(commands.Cog):
         if user.id == ctx.author.id:
             return "You can't vote/unvote for yourself bozo", "error"
 
-        # Create member if not already in database.
-        user_d = await self.db.member_in_database(ctx.guild.id, user.id)
-        if not user_d:
-            await self.db.create_member(ctx.guild.id, user.id, user.name)
-
-        # Use ctx.guild.members to get a list of members in the server and remove any bots.
-        member_count = len(
-            [member for member in ctx.guild.members if not member.bot])
+        # Kept up to date from joins and leaves, no need to go through ctx.guild.members.
+        member_count = self.bot.members.human_count(ctx.guild)
         vote_threshold = self.get_vote_threshold(member_count)
-        votes = len(user_d["voters"])
-
-        # Check whether user has a vote casted on them already.
-        if type == "vote":
-            if self.user_voted_for(ctx.author.id, user_d):
-                msg = self.get_vote_return_msgs(type, votes, vote_threshold)
-                return msg["already_performed_msg"], "error"
-        else:
-            if not self.user_voted_for(ctx.author.id, user_d):
-                msg = self.get_vote_return_msgs(type, votes, vote_threshold)
-                return msg["already_performed_msg"], "error"
 
-        # Perform and let know result.
-        voted = await self.db.cast_vote(
+        # One atomic update, which also tells whether the vote was already there.
+        result = await self.db.cast_vote(
             type, ctx.guild.id, vote_threshold, ctx.author.id, user.id)
-        member = await self.db.member_in_database(ctx.guild.id, user.id)
-        votes = len(member["voters"])
-        if not voted:
-            msg = self.get_vote_return_msgs(type, votes, vote_threshold)
+        if result is None:  # Create member if not already in database.
+            await self.db.create_member(ctx.guild.id, user.id, user.name)
+            result = await self.db.cast_vote(
+                type, ctx.guild.id, vote_threshold, ctx.author.id, user.id)
+
+        # Let know result.
+        if result is None:
+            msg = self.get_vote_return_msgs(type, 0, vote_threshold)
             return msg["error_performed_msg"], "error"
-        else:
-            msg = self.get_vote_return_msgs(type, votes, vote_threshold)
-            return msg["success_performed_msg"], "success"
+        msg = self.get_vote_return_msgs(type, result["votes"], vote_threshold)
+        if not result["applied"]:
+            return msg["already_performed_msg"], "error"
+        return msg["success_performed_msg"], "success"
 
     @commands.slash_command(
         name="whoblack",
@@ -353,11 +361,7 @@ class NWordCounter(commands.Cog):
     async def whoblack(self, ctx):
         """See who's verified black in this server"""
         await ctx.defer()
-        member_list = [
-            member["name"]
-            for member in await self.db.get_member_list(ctx.guild.id)
-            if member["is_black"]
-        ]
+        member_list = await self.db.get_flagged_names(ctx.guild.id, "is_black")
         msg = "Verified black members in this server:\n"
         if len(member_list) == 0:
             msg += "`None`"
@@ -373,11 +377,7 @@ class NWordCounter(commands.Cog):
     async def whohaspass(self, ctx):
         """See who has an n-word pass in this server"""
         await ctx.defer()
-        member_list = [
-            member["name"]
-            for member in await self.db.get_member_list(ctx.guild.id)
-            if member["has_pass"]
-        ]
+        member_list = await self.db.get_flagged_names(ctx.guild.id, "has_pass")
         msg = "Verified pass holders in this server:\n"
         if len(member_list) == 0:
             await ctx.respond(embed=await generate_message_embed("No one in this server has any passes!", type="warning",
@@ -409,7 +409,7 @@ class NWordCounter(commands.Cog):
                 f"N-word passes for {ctx.author.display_name}: `{member['passes']}`", type="info", ctx=ctx),
                 delete_after=30)
         else:  # Passes for mentioned member.
-            invalid_mention_msg = self.verify_mentions(mention, ctx)
+            invalid_mention_msg = await self.verify_mentions(mention, ctx)
             if invalid_mention_msg:
                 await ctx.send(invalid_mention_msg)
                 return
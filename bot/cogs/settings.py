@@ -2,17 +2,7 @@ import discord
 from discord.ext import commands
 from utils.database import Database
 from utils.discord import generate_message_embed
-
-DEFAULT_SETTINGS = [
-    {
-        "name": "Send Message",
-        "int_name": "send_message",
-        "description": "Whether or not the bot should send messages in response to nwords",
-        "type": "bool",
-        "default": True,
-        "value": True
-    }
-]
+from utils.settings import DEFAULT_SETTINGS
 
 
 class SettingModal(discord.ui.Modal):
@@ -0,0 +1,92 @@
+"""Cog for collecting runtime metrics and serving them to Prometheus"""
+import time
+import logging
+import discord
+from discord.ext import commands, tasks
+from utils.config import config
+from utils.metrics import metrics, start_http_server
+
+# 0 keeps the /metrics endpoint off.
+METRICS_PORT = config.get("METRICS_PORT", 0)
+# Local only by default, per-guild stats shouldn't be public.
+METRICS_HOST = config.get("METRICS_HOST", "127.0.0.1")
+
+
+class Stats(commands.Cog):
+    """Listeners feeding the metrics registry"""
+
+    def __init__(self, bot):
+        self.bot: commands.AutoShardedBot = bot
+        self._runner = None
+        self._command_started: dict[int, float] = {}
+        self.shard_latency.start()
+
+    def cog_unload(self):
+        self.shard_latency.cancel()
+        if self._runner is not None:
+            self.bot.loop.create_task(self._runner.cleanup())
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        if METRICS_PORT and self._runner is None:
+            # One port per cluster worker, counting up from METRICS_PORT.
+            port = METRICS_PORT + (getattr(self.bot, "cluster_id", None) or 0)
+            try:
+                self._runner = await start_http_server(port, METRICS_HOST)
+            except OSError as e:  # Port taken, keep running without it.
+                logging.error(f"Failed to serve metrics on port {port}: {e}")
+
+    @tasks.loop(seconds=15)
+    async def shard_latency(self):
+        for shard_id, latency in self.bot.latencies:
+            metrics.set("gateway_latency_seconds", latency, shard=shard_id)
+
+    @shard_latency.before_loop
+    async def before_shard_latency(self):
+        await self.bot.wait_until_ready()
+
+    # Dispatched for every gateway event, unlike the raw socket events this
+    # doesn't need enable_debug_events (see DiscordWebSocket.received_message).
+    @commands.Cog.listener()
+    async def on_socket_event_type(self, event_type: str):
+        metrics.inc("gateway_events_total", type=event_type)
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        # Gateway events don't say which shard they came from, messages do.
+        shard = message.guild.shard_id if message.guild else 0
+        metrics.inc("messages_total", shard=shard)
+
+    @commands.Cog.listener()
+    async def on_shard_ready(self, shard_id: int):
+        metrics.inc("shard_ready_total", shard=shard_id)
+
+    @commands.Cog.listener()
+    async def on_shard_disconnect(self, shard_id: int):
+        metrics.inc("shard_disconnects_total", shard=shard_id)
+
+    @commands.Cog.listener()
+    async def on_application_command(self, ctx: discord.ApplicationContext):
+        self._command_started[ctx.interaction.id] = time.perf_counter()
+
+    def _command_done(self, ctx: discord.ApplicationContext, outcome: str) -> None:
+        start = self._command_started.pop(ctx.interaction.id, None)
+        if start is not None:
+            metrics.observe(
+                "command_seconds", time.perf_counter() - start,
+                command=ctx.command.qualified_name)
+        metrics.inc("commands_total", command=ctx.command.qualified_name, outcome=outcome)
+
+    @commands.Cog.listener()
+    async def on_application_command_completion(self, ctx: discord.ApplicationContext):
+        self._command_done(ctx, "ok")
+
+    @commands.Cog.listener()
+    async def on_application_command_error(self, ctx: discord.ApplicationContext, error):
+        self._command_done(ctx, "error")
+        # Pycord only prints the traceback itself when nothing listens for this.
+        logging.error(f"Ignoring exception in command {ctx.command}", exc_info=error)
+
+
+def setup(bot):
+    bot.add_cog(Stats(bot))
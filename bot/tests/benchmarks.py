@@ -0,0 +1,159 @@
+"""Micro-benchmarks for n-word counting and leaderboard page rendering.
+
+Not collected by the test runner. Results are printed as JSON so runs on
+different commits can be diffed; the corpus is seeded so every run sees the
+same messages. Both benchmarks go through the code the bot runs, so they
+need the bot's requirements installed.
+
+USAGE: cd bot, then py -m tests.benchmarks [--seed N] [--only matcher|paginator]
+       [--output results.json]
+"""
+import sys
+import json
+import asyncio
+import time
+import random
+import string
+import argparse
+import platform
+from pathlib import Path
+
+from utils.matcher import NWORDS_LIST, HARD_RS_LIST, NWordMatcher
+
+WHITELIST_PATH = Path(__file__).parent.parent / "whitelist.txt"
+
+WORDS = ["bro", "what", "the", "hell", "is", "this", "lmao", "ok", "nah",
+         "chill", "server", "vote", "count", "pass", "when", "game", "tonight"]
+UNICODE = ["ñ", "é", "ü", "ß", "漢字", "😂", "🔥", "👀", "ｗ", "ı"]
+
+
+def _whitelist() -> list[str]:
+    with open(WHITELIST_PATH) as f:
+        return [line.strip() for line in f.read().splitlines() if line.strip()]
+
+
+def generate_corpus(seed: int = 0, size: int = 2000) -> dict[str, list[str]]:
+    """Return `size` messages for each kind of text the matcher sees"""
+    rng = random.Random(seed)
+    nwords = NWORDS_LIST + HARD_RS_LIST
+    whitelist = _whitelist()
+
+    def sentence(length: int) -> str:
+        return " ".join(rng.choice(WORDS) for _ in range(length))
+
+    def sprinkle(words: list[str], pool: list[str], every: int) -> list[str]:
+        return [rng.choice(pool) if i % every == 0 else word
+                for i, word in enumerate(words, start=1)]
+
+    return {
+        "short": [sentence(rng.randint(1, 8)) for _ in range(size)],
+        "long": [sentence(rng.randint(150, 400)) for _ in range(size)],
+        "whitespace": [
+            "".join(rng.choice(string.whitespace) * rng.randint(1, 6) + char
+                    for char in sentence(rng.randint(5, 30)))
+            for _ in range(size)
+        ],
+        "unicode": [
+            " ".join(sprinkle(sentence(rng.randint(5, 40)).split(), UNICODE, 2))
+            for _ in range(size)
+        ],
+        "whitelist_collisions": [
+            " ".join(sprinkle(sentence(rng.randint(5, 40)).split(), whitelist, 3))
+            for _ in range(size)
+        ],
+        "dense": [
+            " ".join(sprinkle(sentence(rng.randint(5, 40)).split(), nwords, 2))
+            for _ in range(size)
+        ],
+    }
+
+
+def _best_of(repeat: int, func) -> float:
+    """Return the fastest of `repeat` runs, in seconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_matcher(corpus: dict[str, list[str]], repeat: int = 5) -> dict:
+    """Messages per second through NWordCounter.count_nwords"""
+    from cogs.nword_counter import NWordCounter
+
+    # Skip __init__, it needs a bot and starts the cog's tasks.
+    counter = NWordCounter.__new__(NWordCounter)
+    counter.matcher = NWordMatcher(NWORDS_LIST + HARD_RS_LIST, WHITELIST_PATH)
+    count_nwords = counter.count_nwords
+    results = {}
+    for kind, messages in corpus.items():
+        seconds = _best_of(repeat, lambda: [count_nwords(msg) for msg in messages])
+        results[kind] = {
+            "messages": len(messages),
+            "matches": sum(count_nwords(msg) for msg in messages),
+            "messages_per_second": round(len(messages) / seconds)
+        }
+    return results
+
+
+def bench_paginator(seed: int = 0, repeat: int = 20) -> dict:
+    """Milliseconds for RankingPageSource to render every page of a
+    leaderboard of 10-100 rows"""
+    from cogs.meta import Meta
+    from utils.paginator import RankingPageSource
+
+    async def render_all(source: RankingPageSource) -> None:
+        for index in range(source.page_count):
+            await source.get_page(index)
+
+    loop = asyncio.new_event_loop()
+    rng = random.Random(seed)
+    embed_data = {"title": "Rankings", "color": 0x7289DA}
+    data_vals = {"type": "rankings"}
+    results = {}
+    for rows in range(10, 101, 10):
+        data = [
+            {"name": f"member{i}", "nword_count": rng.randint(0, 100_000),
+             "is_black": rng.random() < 0.1, "has_pass": rng.random() < 0.1}
+            for i in range(rows)
+        ]
+        # A fresh source per run, a reused one would serve cached pages.
+        seconds = _best_of(repeat, lambda: loop.run_until_complete(render_all(
+            RankingPageSource(Meta.snapshot_fetcher(data), rows, 10, embed_data,
+                              data_vals))))
+        results[str(rows)] = {"render_ms": round(seconds * 1000, 4)}
+    loop.close()
+    return results
+
+
+def main(argv: list[str] | None = None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--size", type=int, default=2000,
+                        help="messages per corpus category")
+    parser.add_argument("--only", choices=["matcher", "paginator"])
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    results = {
+        "seed": args.seed,
+        "python": platform.python_version(),
+        "platform": platform.platform()
+    }
+    if args.only in (None, "matcher"):
+        results["matcher"] = bench_matcher(generate_corpus(args.seed, args.size))
+    if args.only in (None, "paginator"):
+        results["paginator"] = bench_paginator(args.seed)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return results
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
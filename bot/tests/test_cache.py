@@ -0,0 +1,48 @@
+"""Unit test the TTL/LRU cache.
+
+USAGE: cd bot, then py -m tests.test_cache
+"""
+import time
+import unittest
+
+from utils.cache import MISSING, TTLCache
+
+
+class TestTTLCache(unittest.TestCase):
+    """Ensure eviction, expiry and metrics behave"""
+
+    def test_hit_and_miss(self):
+        cache = TTLCache(maxsize=2)
+        self.assertIs(cache.get("a"), MISSING)
+        cache.set("a", None)  # None is a valid cached value.
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_evicts_least_recently_used(self):
+        cache = TTLCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_expires_after_ttl(self):
+        cache = TTLCache(maxsize=2, ttl=0.01)
+        cache.set("a", 1)
+        time.sleep(0.02)
+        self.assertIs(cache.get("a"), MISSING)
+        self.assertEqual(cache.stats()["expirations"], 1)
+
+    def test_invalidate(self):
+        cache = TTLCache(maxsize=2)
+        cache.set("a", 1)
+        cache.invalidate("a")
+        cache.invalidate("missing")
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+"""Unit test shard splitting and cluster health aggregation.
+
+USAGE: cd bot, then py -m tests.test_cluster
+"""
+import time
+import unittest
+from types import SimpleNamespace
+
+from utils.cluster import STALE_AFTER, ClusterHealth, shard_ranges
+
+
+class TestShardRanges(unittest.TestCase):
+    """Ensure every shard lands in exactly one contiguous range"""
+
+    def test_uneven_split(self):
+        self.assertEqual(shard_ranges(10, 3), [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9]])
+
+    def test_more_processes_than_shards(self):
+        self.assertEqual(shard_ranges(2, 8), [[0], [1]])
+
+
+class TestClusterHealth(unittest.IsolatedAsyncioTestCase):
+    """Ensure summaries add up clusters and notice stale ones"""
+
+    def bot(self, guilds: int, users: int, latencies: list):
+        return SimpleNamespace(guilds=[None] * guilds, users=[None] * users,
+                               latencies=latencies)
+
+    async def test_summary(self):
+        shared = {}
+        first = ClusterHealth(shared, 0, [0, 1])
+        second = ClusterHealth(shared, 1, [2, 3])
+        await first.publish(self.bot(3, 30, [(0, 0.1), (1, 0.3)]))
+        await second.publish(self.bot(2, 20, [(2, 0.05), (3, 0.05)]))
+        shared[1]["updated"] = time.time() - STALE_AFTER - 1
+
+        summary = await first.summary()
+        self.assertEqual((summary["guilds"], summary["users"]), (5, 50))
+        self.assertEqual(
+            [(c["cluster_id"], c["status"], c["latency_ms"]) for c in summary["clusters"]],
+            [(0, "ready", 200.0), (1, "stale", 50.0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+"""Unit test the Database facade against the in-memory backend.
+
+USAGE: cd bot, then py -m tests.test_database
+"""
+import unittest
+
+from utils.database import Database
+from utils.storage.memory import MemoryBackend
+
+
+class TestDatabase(unittest.IsolatedAsyncioTestCase):
+    """Ensure caching, buffered totals and the lifecycle hold together"""
+
+    async def asyncSetUp(self):
+        await Database.start(MemoryBackend())
+        await Database.sync_guilds([(1, "Guild1")])
+
+    async def asyncTearDown(self):
+        await Database.close()
+
+    async def test_record_and_flush_totals(self):
+        member = await Database.record_occurrence(1, 10, "alice", 3)
+        self.assertEqual(member["nword_count"], 3)
+        await Database.buffer_nword_count(1, 11, 2)
+        await Database.flush_increments()
+        self.assertEqual(await Database.get_nword_server_total(1), 5)
+        self.assertEqual(await Database.get_global_nword_count(), 5)
+        result = await Database.verify_totals()
+        self.assertEqual(result["guilds"], {})
+
+    async def test_member_cache_invalidated_on_vote(self):
+        await Database.create_member(1, 10, "alice")
+        self.assertEqual((await Database.member_in_database(1, 10))["voters"], [])
+        await Database.cast_vote("vote", 1, 1, 20, 10)
+        member = await Database.member_in_database(1, 10)
+        self.assertEqual(member["voters"], [20])
+        self.assertTrue(member["is_black"])
+
+    async def test_flagged_names_invalidated_on_vote(self):
+        await Database.create_member(1, 10, "alice")
+        self.assertEqual(await Database.get_flagged_names(1, "is_black"), [])
+        await Database.cast_vote("vote", 1, 1, 20, 10)
+        self.assertEqual(await Database.get_flagged_names(1, "is_black"), ["alice"])
+        await Database.cast_vote("unvote", 1, 1, 20, 10)
+        self.assertEqual(await Database.get_flagged_names(1, "is_black"), [])
+
+    async def test_settings_round_trip(self):
+        settings = await Database.get_internal_guild_settings(1)
+        settings[0]["value"] = False
+        await Database.update_guild_settings(1, settings)
+        self.assertFalse(
+            (await Database.get_guild_settings(1))["send_message"]["value"])
+
+    async def test_close_flushes_buffer(self):
+        backend = Database._backend
+        await Database.buffer_nword_count(1, 10, 4)
+        await Database.close()
+        self.assertEqual((await backend.get_member(1, 10))["nword_count"], 4)
+        await Database.close()  # Safe to call twice.
+
+
+if __name__ == "__main__":
+    unittest.main()
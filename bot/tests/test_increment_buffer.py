@@ -0,0 +1,98 @@
+"""Unit test the write-behind increment buffer.
+
+USAGE: cd bot, then py -m tests.test_increment_buffer
+"""
+import asyncio
+import unittest
+
+from utils.increment_buffer import BufferFullError, IncrementBuffer, PartialFlushError
+
+
+class TestIncrementBuffer(unittest.IsolatedAsyncioTestCase):
+    """Ensure increments are merged per member and flushed in bulk"""
+
+    async def asyncSetUp(self):
+        self.batches = []
+        self.fail_next = False
+        self.down = False
+        self.partial_next = False
+
+        async def flush_fn(batch):
+            if self.down or self.fail_next:
+                self.fail_next = False
+                raise RuntimeError("Mongo is down")
+            if self.partial_next:  # Members written, totals not.
+                self.partial_next = False
+                self.batches.append({key: delta for key, delta in batch.items() if key[1]})
+                raise PartialFlushError(
+                    {(guild_id, None): delta for (guild_id, _), delta in batch.items()},
+                    RuntimeError("Mongo went down halfway"))
+            self.batches.append(dict(batch))
+
+        self.buffer = IncrementBuffer(
+            flush_fn, interval_ms=10_000, max_batch=3, max_pending=4)
+
+    async def asyncTearDown(self):
+        await self.buffer.close()
+
+    async def test_merges_deltas_per_member(self):
+        await self.buffer.add(1, 10, 2)
+        await self.buffer.add(1, 10, 3)
+        await self.buffer.add(1, 11, 1)
+        self.assertEqual(await self.buffer.flush(), 2)
+        self.assertEqual(self.batches, [{(1, 10): 5, (1, 11): 1}])
+
+    async def test_flushes_when_batch_is_full(self):
+        for member_id in range(3):
+            await self.buffer.add(1, member_id, 1)
+        await asyncio.sleep(0.05)  # Let the flush task wake up.
+        self.assertEqual(len(self.batches), 1)
+        self.assertEqual(self.buffer.stats()["pending"], 0)
+
+    async def test_failed_flush_is_retried(self):
+        await self.buffer.add(1, 10, 4)
+        self.fail_next = True
+        self.assertEqual(await self.buffer.flush(), 0)
+        await self.buffer.add(1, 10, 1)
+        await self.buffer.flush()
+        self.assertEqual(self.batches, [{(1, 10): 5}])
+        self.assertEqual(self.buffer.stats()["failed_flushes"], 1)
+
+    async def test_partial_flush_only_retries_the_rest(self):
+        await self.buffer.add(1, 10, 4)
+        self.partial_next = True
+        await self.buffer.flush()
+        await self.buffer.flush()
+        self.assertEqual(self.batches, [{(1, 10): 4}, {(1, None): 4}])
+
+    async def test_rejects_new_keys_while_flushing_fails(self):
+        self.down = True
+        self.buffer.max_batch = 100  # Keep the flush task out of it.
+        for member_id in range(4):
+            await self.buffer.add(1, member_id, 1)
+        with self.assertRaises(BufferFullError):
+            await self.buffer.add(1, 99, 1)
+        await self.buffer.add(1, 0, 1)  # Merging doesn't grow the buffer.
+        self.assertEqual(self.buffer.stats()["pending"], 4)
+        self.assertEqual(self.buffer.stats()["rejected_increments"], 1)
+
+        self.down = False
+        await self.buffer.add(1, 99, 1)
+        self.assertEqual(self.batches[0][(1, 0)], 2)
+
+    async def test_close_writes_remaining(self):
+        await self.buffer.add(2, 20, 7)
+        await self.buffer.close()
+        self.assertEqual(self.batches, [{(2, 20): 7}])
+
+    async def test_close_after_timer_cancelled(self):
+        await self.buffer.add(2, 20, 7)
+        self.buffer._task.cancel()  # As Client.run does on SIGTERM.
+        await asyncio.sleep(0)
+        await self.buffer.close()
+        self.assertEqual(self.batches, [{(2, 20): 7}])
+        self.assertEqual(self.buffer.stats()["pending"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+"""Unit test the ingestion pipeline between on_message and the database.
+
+USAGE: cd bot, then py -m tests.test_ingest
+"""
+import asyncio
+import unittest
+
+from utils.ingest import Hit, IngestionPipeline
+
+
+class TestIngestionPipeline(unittest.IsolatedAsyncioTestCase):
+    """Ensure hits are handled in order, overflow instead of dropping and
+    drain on close"""
+
+    async def asyncSetUp(self):
+        self.handled: list[tuple[str, bool]] = []
+        self.overflowed: list[str] = []
+        self.overflow_counts: list[int] = []
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+        async def handle(hit: Hit, reply: bool):
+            await self.gate.wait()
+            if hit.message == "boom":
+                raise RuntimeError("Mongo is down")
+            self.handled.append((hit.message, reply))
+
+        async def overflow(hit: Hit):
+            self.overflowed.append(hit.message)
+            self.overflow_counts.append(hit.count)
+
+        self.pipeline = IngestionPipeline(
+            handle, overflow, workers=1, maxsize=4, shed_depth=1)
+
+    async def asyncTearDown(self):
+        self.gate.set()
+        await self.pipeline.close()
+
+    async def test_hits_handled_in_order(self):
+        for message in ("a", "b", "c"):
+            self.pipeline.submit(message, 1)
+        await self.pipeline.close()
+        self.assertEqual([message for message, _ in self.handled], ["a", "b", "c"])
+        self.assertEqual(self.pipeline.stats()["processed"], 3)
+
+    async def test_replies_shed_under_backlog(self):
+        self.gate.clear()  # Hold the worker so the queue backs up.
+        for message in ("a", "b", "c", "d"):
+            self.pipeline.submit(message, 1)
+        await asyncio.sleep(0)  # Worker takes "a", three left queued.
+        self.gate.set()
+        await self.pipeline.close()
+        # Deeper than shed_depth for "a" and "b", caught up by "c".
+        self.assertEqual(
+            self.handled, [("a", False), ("b", False), ("c", True), ("d", True)])
+        self.assertEqual(self.pipeline.stats()["replies_shed"], 2)
+
+    async def test_full_queue_overflows(self):
+        self.gate.clear()
+        for message in "abcdefg":
+            self.pipeline.submit(message, 1)
+        await asyncio.sleep(0)  # Worker takes "a", freeing a slot for "h".
+        self.pipeline.submit("h", 1)
+        self.gate.set()
+        await self.pipeline.close()
+        self.assertEqual(self.overflowed, ["e", "f", "g"])
+        self.assertEqual([message for message, _ in self.handled], list("abcdh"))
+        self.assertEqual(self.pipeline.stats()["overflowed"], 3)
+
+    async def test_overflow_merged_per_key(self):
+        self.gate.clear()
+        for message in "abcde":
+            self.pipeline.submit(message, 1)
+        for _ in range(100):
+            self.pipeline.submit("f", 2)
+        self.assertEqual(self.pipeline.stats()["overflow_pending"], 2)  # "e" and "f".
+        self.gate.set()
+        await self.pipeline.close()
+        self.assertEqual(self.overflowed, ["e", "f"])
+        self.assertEqual(self.overflow_counts, [1, 200])
+
+    async def test_close_drains_queue(self):
+        self.gate.clear()
+        for message in ("a", "b"):
+            self.pipeline.submit(message, 1)
+        close = asyncio.create_task(self.pipeline.close())
+        await asyncio.sleep(0.01)
+        self.assertFalse(close.done())  # Still waiting on queued hits.
+        self.gate.set()
+        await close
+        self.assertEqual(len(self.handled), 2)
+        self.assertEqual(self.pipeline.stats()["depth"], 0)
+
+    async def test_close_after_workers_cancelled(self):
+        self.gate.clear()
+        for message in ("a", "b", "c"):
+            self.pipeline.submit(message, 1)
+        await asyncio.sleep(0)  # Worker takes "a".
+        for worker in self.pipeline._workers:
+            worker.cancel()  # As Client.run does on SIGTERM.
+        await asyncio.wait_for(self.pipeline.close(), 1)
+        self.assertEqual(self.overflowed, ["b", "c"])
+        self.assertEqual(self.pipeline.stats()["depth"], 0)
+
+    async def test_errors_dont_stop_workers(self):
+        for message in ("a", "boom", "b"):
+            self.pipeline.submit(message, 1)
+        await self.pipeline.close()
+        self.assertEqual([message for message, _ in self.handled], ["a", "b"])
+        self.assertEqual(self.pipeline.stats()["errors"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+"""Unit test the compiled n-word matcher.
+
+USAGE: cd bot, then py -m tests.test_matcher
+"""
+import os
+import tempfile
+import unittest
+
+from utils.matcher import NWORDS_LIST, HARD_RS_LIST, NWordMatcher
+
+
+class TestNWordMatcher(unittest.TestCase):
+    """Ensure the single-pass matcher counts like the old per-word scans"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.whitelist_path = os.path.join(self.tmpdir.name, "whitelist.txt")
+        self.write_whitelist(["snigger", "sniggers", "niggard", "niggardly"])
+        self.matcher = NWordMatcher(NWORDS_LIST + HARD_RS_LIST, self.whitelist_path)
+        self.soft, self.hard = NWORDS_LIST[0], HARD_RS_LIST[0]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_whitelist(self, words):
+        with open(self.whitelist_path, "w") as f:
+            f.write("\n".join(words))
+
+    def test_no_match(self):
+        self.assertEqual(self.matcher.count("hello there"), 0)
+        self.assertEqual(self.matcher.count(""), 0)
+
+    def test_counts_every_variant(self):
+        msg = " ".join(NWORDS_LIST + HARD_RS_LIST)
+        self.assertEqual(self.matcher.count(msg), 6)
+
+    def test_ignores_case_and_whitespace(self):
+        spaced = " ".join(self.soft.upper())
+        self.assertEqual(self.matcher.count(f"{spaced}\n\t{self.hard.title()}"), 2)
+
+    def test_whitelisted_words_not_counted(self):
+        self.assertEqual(self.matcher.count("sniggers"), 0)
+        self.assertEqual(self.matcher.count("niggardly"), 0)
+        self.assertEqual(self.matcher.count(f"niggardly {self.soft}"), 1)
+
+    def test_reload_if_changed(self):
+        self.assertFalse(self.matcher.reload_if_changed())
+        self.write_whitelist([])
+        # Force a different mtime regardless of filesystem resolution.
+        stat = os.stat(self.whitelist_path)
+        os.utime(self.whitelist_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        self.assertTrue(self.matcher.reload_if_changed())
+        self.assertEqual(self.matcher.count("sniggers"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
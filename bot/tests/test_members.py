@@ -0,0 +1,68 @@
+"""Unit test member counts and lookups without the member cache.
+
+Needs Pycord installed, it's skipped otherwise.
+
+USAGE: cd bot, then py -m tests.test_members
+"""
+import importlib.util
+import unittest
+from types import SimpleNamespace
+
+HAS_DISCORD = importlib.util.find_spec("discord") is not None
+if HAS_DISCORD:
+    import discord
+
+    from utils.members import MemberDirectory
+
+
+class FakeGuild:
+    """Unchunked guild whose members are only reachable through fetch_member"""
+
+    def __init__(self, member_count: int, members: dict):
+        self.id = 1
+        self.chunked = False
+        self.member_count = member_count
+        self.remote = members
+        self.fetches = 0
+
+    def get_member(self, user_id: int):
+        return None
+
+    async def fetch_member(self, user_id: int):
+        self.fetches += 1
+        if user_id not in self.remote:
+            raise discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), "Unknown Member")
+        return self.remote[user_id]
+
+
+@unittest.skipUnless(HAS_DISCORD, "needs Pycord")
+class TestMemberDirectory(unittest.IsolatedAsyncioTestCase):
+    """Ensure counts follow joins and leaves and lookups are cached"""
+
+    def setUp(self):
+        self.alice = SimpleNamespace(id=10, bot=False)
+        self.guild = FakeGuild(member_count=100, members={10: self.alice})
+        self.members = MemberDirectory()
+
+    def test_count_follows_joins_and_leaves(self):
+        self.assertEqual(self.members.human_count(self.guild), 100)
+        self.members.member_joined(SimpleNamespace(id=11, bot=False, guild=self.guild))
+        self.members.member_joined(SimpleNamespace(id=12, bot=True, guild=self.guild))
+        self.members.member_left(1, SimpleNamespace(id=13, bot=False))
+        self.members.member_left(1, SimpleNamespace(id=11, bot=False))
+        self.assertEqual(self.members.human_count(self.guild), 99)
+
+    async def test_resolve_caches_hits_and_misses(self):
+        self.assertIs(await self.members.resolve(self.guild, 10), self.alice)
+        self.assertIs(await self.members.resolve(self.guild, 10), self.alice)
+        self.assertIsNone(await self.members.resolve(self.guild, 20))
+        self.assertIsNone(await self.members.resolve(self.guild, 20))
+        self.assertEqual(self.guild.fetches, 2)
+
+        self.members.member_left(1, SimpleNamespace(id=10, bot=False))
+        await self.members.resolve(self.guild, 10)
+        self.assertEqual(self.guild.fetches, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+"""Unit test the metrics registry and class instrumentation.
+
+USAGE: cd bot, then py -m tests.test_metrics
+"""
+import asyncio
+import unittest
+
+from utils.metrics import Histogram, Metrics, instrument_class, metrics
+
+
+class TestMetrics(unittest.TestCase):
+    """Ensure histograms, counters and exposition output line up"""
+
+    def test_histogram_quantile(self):
+        histogram = Histogram(buckets=(0.1, 1, 10))
+        for value in (0.05, 0.1, 0.5, 5):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [2, 1, 1, 0])
+        self.assertEqual(histogram.quantile(0.5), 0.1)
+        self.assertEqual(histogram.quantile(0.99), 10)
+
+    def test_render(self):
+        registry = Metrics()
+        registry.inc("hits_total", shard=0)
+        registry.inc("hits_total", 2, shard=0)
+        registry.observe("latency_seconds", 0.003, stage="match")
+        text = registry.render()
+        self.assertIn('hits_total{shard="0"} 3', text)
+        self.assertIn('latency_seconds_bucket{stage="match",le="0.005"} 1', text)
+        self.assertIn('latency_seconds_bucket{stage="match",le="+Inf"} 1', text)
+        self.assertIn('latency_seconds_count{stage="match"} 1', text)
+
+    def test_instrument_class(self):
+        class Store:
+            @classmethod
+            async def ok(cls):
+                return 1
+
+            @classmethod
+            async def broken(cls):
+                raise ValueError
+
+        instrument_class(Store, name="store_call_seconds")
+        self.assertEqual(asyncio.run(Store.ok()), 1)
+        with self.assertRaises(ValueError):
+            asyncio.run(Store.broken())
+        self.assertEqual(metrics.summary("store_call_seconds")["ok"]["count"], 1)
+        self.assertEqual(
+            metrics.counters["store_call_errors_total"][(("method", "broken"),)], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
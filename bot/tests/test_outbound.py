@@ -0,0 +1,107 @@
+"""Unit test the outbound reply scheduler.
+
+Needs Pycord installed, it's skipped otherwise.
+
+USAGE: cd bot, then py -m tests.test_outbound
+"""
+import asyncio
+import importlib.util
+import unittest
+from types import SimpleNamespace
+
+HAS_DISCORD = importlib.util.find_spec("discord") is not None
+if HAS_DISCORD:
+    from utils.outbound import OutboundScheduler, Priority
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int, sent: list):
+        self.id = channel_id
+        self.sent = sent
+
+    async def send(self, content: str):
+        self.sent.append((self.id, content))
+
+
+class FakeMessage:
+    def __init__(self, channel: FakeChannel):
+        self.channel = channel
+
+    async def reply(self, content: str | None = None, **kwargs):
+        self.channel.sent.append((self.channel.id, content))
+
+
+@unittest.skipUnless(HAS_DISCORD, "needs Pycord")
+class TestOutboundScheduler(unittest.IsolatedAsyncioTestCase):
+    """Ensure replies go out by priority, merged, rate limited and not stale"""
+
+    async def asyncSetUp(self):
+        self.sent: list[tuple[int, str]] = []
+        self.scheduler = self.make_scheduler()
+
+    def make_scheduler(self, **options) -> "OutboundScheduler":
+        return OutboundScheduler(SimpleNamespace(), **options)
+
+    def message(self, channel_id: int = 1) -> FakeMessage:
+        return FakeMessage(FakeChannel(channel_id, self.sent))
+
+    async def asyncTearDown(self):
+        await self.scheduler.close()
+
+    async def test_most_urgent_first(self):
+        self.scheduler = self.make_scheduler(channel_burst=1, channel_rate=100)
+        message = self.message()
+        self.scheduler.reply(message, "notice", priority=Priority.NOTICE, delete_after=5)
+        self.scheduler.reply(message, "reply", delete_after=5)
+        await asyncio.sleep(0.05)
+        self.assertEqual([content for _, content in self.sent], ["reply", "notice"])
+
+    async def test_count_replies_merged(self):
+        message = self.message()
+        for content in ("one", "two", "three"):
+            self.scheduler.reply(message, content)
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.sent, [(1, "one\ntwo\nthree")])
+        self.assertEqual(self.scheduler.stats()["coalesced"], 2)
+
+    async def test_merged_replies_fit_one_message(self):
+        message = self.message()
+        for i in range(30):
+            self.scheduler.reply(message, f"{i:02}" + "x" * 98)
+        await asyncio.sleep(0.01)
+        self.assertEqual(len(self.sent), 2)
+        self.assertTrue(all(len(content) <= 2000 for _, content in self.sent))
+        lines = "\n".join(content for _, content in self.sent).split("\n")
+        self.assertEqual([line[:2] for line in lines], [f"{i:02}" for i in range(30)])
+
+    async def test_rate_limited_per_channel(self):
+        self.scheduler = self.make_scheduler(channel_burst=2, channel_rate=0.1)
+        for content in ("a", "b", "c"):
+            self.scheduler.reply(self.message(1), content, delete_after=5)
+        self.scheduler.reply(self.message(2), "other", delete_after=5)
+        await asyncio.sleep(0.05)
+        self.assertEqual(sorted(self.sent), [(1, "a"), (1, "b"), (2, "other")])
+        self.assertEqual(self.scheduler.stats()["pending"], 1)
+
+    async def test_stale_replies_dropped(self):
+        self.scheduler = self.make_scheduler(
+            channel_burst=1, channel_rate=0.1, deadline=0.02)
+        for content in ("a", "b"):
+            self.scheduler.reply(self.message(), content, delete_after=5)
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.sent, [(1, "a")])
+        self.assertEqual(self.scheduler.stats()["dropped_stale"], 1)
+
+    async def test_idle_buckets_dropped_once_refilled(self):
+        self.scheduler = self.make_scheduler(channel_burst=1, channel_rate=50)
+        self.scheduler.reply(self.message(1), "a")
+        await asyncio.sleep(0.01)
+        self.assertIn(1, self.scheduler._buckets)  # Still limiting channel 1.
+        await asyncio.sleep(0.05)
+        self.scheduler.reply(self.message(2), "b")
+        await asyncio.sleep(0.01)
+        self.assertNotIn(1, self.scheduler._buckets)
+
+
+if __name__ == "__main__":
+    unittest.main()
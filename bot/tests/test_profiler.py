@@ -0,0 +1,55 @@
+"""Unit test the startup profiler.
+
+USAGE: cd bot, then py -m tests.test_profiler
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+from utils.profiler import StartupProfiler
+
+
+class TestStartupProfiler(unittest.TestCase):
+    """Ensure imports, extensions and shards end up in the report"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.tmpdir.name, "profiled_child.py"), "w") as f:
+            f.write("import time\ntime.sleep(0.01)\n")
+        with open(os.path.join(self.tmpdir.name, "profiled_parent.py"), "w") as f:
+            f.write("import profiled_child\n")
+        sys.path.insert(0, self.tmpdir.name)
+        self.profiler = StartupProfiler(enabled=False)
+        self.profiler.install_import_hook()
+
+    def tearDown(self):
+        self.profiler.remove_import_hook()
+        sys.path.remove(self.tmpdir.name)
+        for name in ("profiled_parent", "profiled_child"):
+            sys.modules.pop(name, None)
+        self.tmpdir.cleanup()
+
+    def test_import_times_split_self_and_children(self):
+        with self.profiler.extension("profiled_parent"):
+            import profiled_parent  # noqa: F401
+        imports = self.profiler.imports
+        self.assertGreaterEqual(imports["profiled_child"]["self_ms"], 10)
+        self.assertGreaterEqual(imports["profiled_parent"]["total_ms"], 10)
+        self.assertLess(imports["profiled_parent"]["self_ms"], 10)
+        extension = self.profiler.extensions["profiled_parent"]
+        self.assertIsNotNone(extension["setup_ms"])
+
+    def test_finish_only_once(self):
+        self.profiler.shard_event(0, "connect")
+        self.profiler.shard_event(0, "ready")
+        self.profiler.finish()
+        ready = self.profiler.ready
+        self.profiler.finish()
+        self.assertEqual(self.profiler.ready, ready)
+        report = self.profiler.report()
+        self.assertEqual(set(report["shards"]["0"]), {"connect", "ready"})
+
+
+if __name__ == "__main__":
+    unittest.main()
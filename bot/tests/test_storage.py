@@ -0,0 +1,345 @@
+"""Contract tests every storage backend has to pass.
+
+The Mongo run needs Motor and MONGO_URL in config.json, it's skipped
+otherwise and writes to its own throwaway database.
+
+USAGE: cd bot, then py -m tests.test_storage
+"""
+import os
+import json
+import asyncio
+import importlib.util
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+from utils.increment_buffer import IncrementBuffer
+from utils.storage import StorageBackend
+from utils.storage.import_mongo import run
+from utils.storage.memory import MemoryBackend
+from utils.storage.sqlite import SQLiteBackend
+
+
+class StorageContract:
+    """Shared cases, mixed into one TestCase per backend"""
+
+    async def make_backend(self) -> StorageBackend:
+        raise NotImplementedError
+
+    async def asyncSetUp(self):
+        self.backend = await self.make_backend()
+        await self.backend.start()
+        await self.backend.upsert_guilds([(1, "Guild1"), (2, "Guild2")])
+
+    async def asyncTearDown(self):
+        await self.backend.close()
+
+    async def test_guilds(self):
+        self.assertTrue(await self.backend.guild_exists(1))
+        self.assertFalse(await self.backend.guild_exists(3))
+        await self.backend.upsert_guilds([(1, "Renamed"), (3, "Guild3")])
+        self.assertEqual(await self.backend.count_guilds(), 3)
+        await self.backend.rename_guild(2, "Other")
+        servers = await self.backend.top_servers(10)
+        self.assertEqual(
+            sorted(server["_id"]["guild_name"] for server in servers),
+            ["Guild3", "Other", "Renamed"])
+
+    async def test_settings(self):
+        self.assertEqual(await self.backend.get_settings(1), {})
+        await self.backend.set_settings(1, {"send_message": False})
+        self.assertEqual(await self.backend.get_settings(1), {"send_message": False})
+        # Renaming the guild must not reset its settings.
+        await self.backend.upsert_guilds([(1, "Guild1")])
+        self.assertEqual(await self.backend.get_settings(1), {"send_message": False})
+        self.assertEqual(await self.backend.get_settings(99), {})
+
+    async def test_members(self):
+        self.assertIsNone(await self.backend.get_member(1, 10))
+        await self.backend.create_member(1, 10, "alice")
+        await self.backend.create_member(1, 10, "ignored")  # No-op.
+        await self.backend.increment_member(1, 10, "passes", 2)
+        await self.backend.increment_member(1, 11, "passes", 2)  # Missing, no-op.
+        member = await self.backend.get_member(1, 10)
+        self.assertEqual(member["name"], "alice")
+        self.assertEqual(member["passes"], 2)
+        self.assertEqual(member["voters"], [])
+        self.assertIsNone(await self.backend.get_member(1, 11))
+
+    async def test_record_occurrence(self):
+        member = await self.backend.record_occurrence(1, 10, "alice", 3)
+        self.assertEqual(member["nword_count"], 3)
+        member = await self.backend.record_occurrence(1, 10, "alicia", 2)
+        self.assertEqual(member["nword_count"], 5)
+        self.assertEqual(member["name"], "alicia")
+        self.assertFalse(member["is_black"])
+        # Returned objects are copies, not stored state.
+        member["nword_count"] = 0
+        self.assertEqual((await self.backend.get_member(1, 10))["nword_count"], 5)
+
+    async def test_apply_increments(self):
+        await self.backend.record_occurrence(1, 10, "alice", 1)
+        await self.backend.apply_increments({(1, 10): 2, (1, 11): 4, (2, None): 5})
+        self.assertEqual((await self.backend.get_member(1, 10))["nword_count"], 3)
+        self.assertIsNone((await self.backend.get_member(1, 11))["name"])
+        self.assertEqual(await self.backend.get_guild_total(1), 6)
+        self.assertEqual(await self.backend.get_guild_total(2), 5)
+        self.assertEqual(await self.backend.get_global_total(), 11)
+
+    async def test_totals(self):
+        self.assertIsNone(await self.backend.get_global_total())
+        await self.backend.record_occurrence(1, 10, "alice", 3)
+        await self.backend.record_occurrence(1, 11, "bob", 4)
+        await self.backend.record_occurrence(2, 10, "alice", 1)
+        self.assertEqual(await self.backend.member_totals(), {1: 7, 2: 1})
+        self.assertEqual(await self.backend.guild_totals(), {1: 0, 2: 0})
+        await self.backend.set_totals({1: 7, 2: 1}, 8)
+        self.assertEqual(await self.backend.guild_totals(), {1: 7, 2: 1})
+        self.assertEqual(await self.backend.get_global_total(), 8)
+
+    async def test_member_page(self):
+        for member_id, count in ((10, 5), (11, 9), (12, 1)):
+            await self.backend.record_occurrence(1, member_id, f"m{member_id}", count)
+        await self.backend.record_occurrence(2, 13, "elsewhere", 100)
+        ranked = await self.backend.member_page(1)
+        self.assertEqual([row["name"] for row in ranked], ["m11", "m10", "m12"])
+        self.assertEqual(
+            set(ranked[0]), {"name", "is_black", "has_pass", "nword_count"})
+        page = await self.backend.member_page(1, skip=1, limit=1)
+        self.assertEqual([row["name"] for row in page], ["m10"])
+
+    async def test_leaderboards(self):
+        await self.backend.record_occurrence(1, 10, "alice", 3)
+        await self.backend.record_occurrence(2, 11, "bob", 7)
+        await self.backend.set_totals({1: 3, 2: 7}, 10)
+        self.assertEqual(
+            await self.backend.top_counts(1), [{"member": "bob", "nword_count": 7}])
+        self.assertEqual(
+            await self.backend.top_servers(1),
+            [{"_id": {"guild_id": 2, "guild_name": "Guild2"}, "nword_count": 7}])
+
+        self.assertEqual(await self.backend.get_leaderboards(), {})
+        await self.backend.materialize_leaderboards(10)
+        snapshots = await self.backend.get_leaderboards()
+        self.assertEqual(set(snapshots), {"guilds", "users"})
+        self.assertEqual(
+            [entry["member"] for entry in snapshots["users"]["entries"]],
+            ["bob", "alice"])
+        self.assertIsInstance(snapshots["guilds"]["as_of"], datetime)
+
+    async def test_cast_vote(self):
+        self.assertIsNone(await self.backend.cast_vote("vote", 1, 2, 20, 10))
+        await self.backend.create_member(1, 10, "alice")
+
+        result = await self.backend.cast_vote("vote", 1, 2, 20, 10)
+        self.assertEqual(result, {"applied": True, "votes": 1, "is_black": False})
+        self.assertFalse((await self.backend.get_member(1, 10))["is_black"])
+
+        result = await self.backend.cast_vote("vote", 1, 2, 20, 10)
+        self.assertEqual(result, {"applied": False, "votes": 1, "is_black": False})
+
+        await self.backend.cast_vote("vote", 1, 2, 21, 10)
+        member = await self.backend.get_member(1, 10)
+        self.assertEqual(member["voters"], [20, 21])
+        self.assertTrue(member["is_black"])
+
+        result = await self.backend.cast_vote("unvote", 1, 2, 20, 10)
+        self.assertEqual(result, {"applied": True, "votes": 1, "is_black": False})
+        member = await self.backend.get_member(1, 10)
+        self.assertEqual(member["voters"], [21])
+        self.assertFalse(member["is_black"])
+
+        result = await self.backend.cast_vote("unvote", 1, 2, 20, 10)
+        self.assertFalse(result["applied"])
+
+    async def test_flagged_names(self):
+        for member_id, name, count in ((10, "alice", 1), (11, "bob", 5), (12, "carol", 3)):
+            await self.backend.record_occurrence(1, member_id, name, count)
+        await self.backend.record_occurrence(2, 13, "dave", 9)
+        for guild_id, votee_id in ((1, 10), (1, 11), (2, 13)):
+            await self.backend.cast_vote("vote", guild_id, 1, 20, votee_id)
+
+        self.assertEqual(await self.backend.flagged_names(1, "is_black"), ["bob", "alice"])
+        self.assertEqual(await self.backend.flagged_names(1, "has_pass"), [])
+        with self.assertRaises(ValueError):
+            await self.backend.flagged_names(1, "voters")
+
+    async def test_concurrent_votes(self):
+        await self.backend.create_member(1, 10, "alice")
+        await asyncio.gather(*(
+            self.backend.cast_vote("vote", 1, 5, voter_id, 10)
+            for voter_id in range(20, 25)))
+        member = await self.backend.get_member(1, 10)
+        self.assertEqual(sorted(member["voters"]), list(range(20, 25)))
+        self.assertTrue(member["is_black"])
+
+
+class TestMemoryBackend(StorageContract, unittest.IsolatedAsyncioTestCase):
+    async def make_backend(self):
+        return MemoryBackend()
+
+
+class TestSQLiteBackend(StorageContract, unittest.IsolatedAsyncioTestCase):
+    async def make_backend(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        return SQLiteBackend(os.path.join(self.tmpdir.name, "test.sqlite3"))
+
+    async def test_persists_across_connections(self):
+        await self.backend.record_occurrence(1, 10, "alice", 3)
+        await self.backend.close()
+        self.backend = SQLiteBackend(os.path.join(self.tmpdir.name, "test.sqlite3"))
+        await self.backend.start()
+        self.assertEqual((await self.backend.get_member(1, 10))["nword_count"], 3)
+
+    async def test_restart_after_close(self):
+        await self.backend.record_occurrence(1, 10, "alice", 3)
+        await self.backend.close()
+        await self.backend.start()
+        self.assertEqual((await self.backend.get_member(1, 10))["nword_count"], 3)
+
+
+class TestMongoImport(unittest.IsolatedAsyncioTestCase):
+    """Ensure mongoexport output lands in SQLite with totals recomputed"""
+
+    async def test_import(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            guilds_path = os.path.join(tmpdir, "guilds.json")
+            members_path = os.path.join(tmpdir, "members.json")
+            db_path = os.path.join(tmpdir, "import.sqlite3")
+            with open(guilds_path, "w") as f:
+                f.write(json.dumps({
+                    "_id": {"$oid": "0123456789abcdef01234567"},
+                    "guild_id": {"$numberLong": "1"}, "guild_name": "Guild1",
+                    "settings": '[{"int_name": "send_message", "value": false}]',
+                    # Left over from before members were split out.
+                    "members": [{"id": 10, "name": "alice", "nword_count": 2,
+                                 "voters": [20], "is_black": False}]
+                }) + "\n")
+            with open(members_path, "w") as f:
+                f.write(json.dumps([
+                    {"guild_id": 1, "id": 10, "name": "alice", "nword_count": 3,
+                     "voters": [21], "passes": 1},
+                    {"guild_id": 1, "id": 11, "name": "bob", "nword_count": 4}
+                ]))
+
+            self.assertEqual(
+                await run(guilds_path, members_path, db_path),
+                {"guilds": 1, "members": 2})
+
+            backend = SQLiteBackend(db_path)
+            await backend.start()
+            try:
+                alice = await backend.get_member(1, 10)
+                self.assertEqual(alice["nword_count"], 5)
+                self.assertEqual(alice["voters"], [20, 21])
+                self.assertEqual(alice["passes"], 1)
+                self.assertEqual(await backend.get_settings(1), {"send_message": False})
+                self.assertEqual(await backend.get_guild_total(1), 9)
+                self.assertEqual(await backend.get_global_total(), 9)
+            finally:
+                await backend.close()
+
+
+class FakeCollection:
+    """Applies the $inc of UpdateOne/update_one to dicts, failing on request"""
+
+    def __init__(self):
+        self.totals: dict[tuple, dict] = {}
+        self.fail_next: Exception | None = None
+        self.fail_indexes: set[int] = set()  # Failed once as writeErrors.
+
+    def _inc(self, query: dict, update: dict) -> None:
+        doc = self.totals.setdefault(tuple(sorted(query.items())), {})
+        for field, delta in update["$inc"].items():
+            doc[field] = doc.get(field, 0) + delta
+
+    async def bulk_write(self, ops: list, ordered: bool = True):
+        from pymongo.errors import BulkWriteError
+        if self.fail_next is not None:
+            error, self.fail_next = self.fail_next, None
+            raise error
+        failed, self.fail_indexes = self.fail_indexes, set()
+        for index, op in enumerate(ops):
+            if index not in failed:
+                self._inc(op._filter, op._doc)
+        if failed:
+            raise BulkWriteError({"writeErrors": [
+                {"index": index, "code": 1, "errmsg": "failed"} for index in failed]})
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False):
+        self._inc(query, update)
+
+
+@unittest.skipUnless(importlib.util.find_spec("motor"), "needs Motor")
+class TestMongoIncrementStages(unittest.IsolatedAsyncioTestCase):
+    """Ensure a failed stage of apply_increments never re-applies an earlier one"""
+
+    async def asyncSetUp(self):
+        from utils.storage.mongo import MongoBackend
+        self.backend = MongoBackend("mongodb://localhost")  # Never started.
+        self.backend._members = FakeCollection()
+        self.backend._collection = FakeCollection()
+        self.backend._stats = FakeCollection()
+        self.buffer = IncrementBuffer(self.backend.apply_increments, interval_ms=10_000)
+
+    def count(self, guild_id: int, member_id: int) -> int:
+        key = (("guild_id", guild_id), ("id", member_id))
+        return self.backend._members.totals[key]["nword_count"]
+
+    def totals(self) -> tuple[int, int]:
+        guild = self.backend._collection.totals[(("guild_id", 1),)]["nword_total"]
+        return guild, self.backend._stats.totals[(("_id", "global"),)]["nword_total"]
+
+    async def test_guild_total_failure_keeps_member_counts(self):
+        from pymongo.errors import AutoReconnect
+        await self.buffer.add(1, 10, 3)
+        await self.buffer.add(1, None, 2)  # A recorded hit, totals only.
+        self.backend._collection.fail_next = AutoReconnect("primary stepped down")
+        await self.buffer.flush()
+        self.assertEqual(self.buffer.stats()["pending"], 1)
+        await self.buffer.flush()
+        self.assertEqual(self.count(1, 10), 3)
+        self.assertEqual(self.totals(), (5, 5))
+
+    async def test_failed_member_update_retried_alone(self):
+        await self.buffer.add(1, 10, 3)
+        await self.buffer.add(1, 11, 4)
+        self.backend._members.fail_indexes = {1}
+        await self.buffer.flush()
+        await self.buffer.flush()
+        self.assertEqual((self.count(1, 10), self.count(1, 11)), (3, 4))
+        self.assertEqual(self.totals(), (7, 7))
+
+
+def _mongo_url() -> str | None:
+    try:
+        import motor  # noqa: F401
+        with Path("../config.json").open() as f:
+            return json.load(f).get("MONGO_URL") or None
+    except (ImportError, OSError, ValueError):
+        return None
+
+
+@unittest.skipUnless(_mongo_url(), "needs Motor and MONGO_URL in config.json")
+class TestMongoBackend(StorageContract, unittest.IsolatedAsyncioTestCase):
+    DB_NAME = "StorageContractTests"
+
+    async def make_backend(self):
+        from utils.storage.mongo import MongoBackend
+        return MongoBackend(_mongo_url(), db_name=self.DB_NAME, retries=1)
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        # Start from an empty database, then redo the shared setup.
+        await self.backend._cluster.drop_database(self.DB_NAME)
+        await self.backend.upsert_guilds([(1, "Guild1"), (2, "Guild2")])
+
+    async def asyncTearDown(self):
+        await self.backend._cluster.drop_database(self.DB_NAME)
+        await super().asyncTearDown()
+
+
+if __name__ == "__main__":
+    unittest.main()
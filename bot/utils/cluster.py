@@ -0,0 +1,89 @@
+"""Shard ranges and health sharing between cluster worker processes"""
+import time
+import asyncio
+import logging
+
+HEALTH_INTERVAL = 15  # Seconds between health reports of a worker.
+STALE_AFTER = HEALTH_INTERVAL * 3  # Worker presumed down after this long.
+
+
+def shard_ranges(shard_count: int, processes: int) -> list[list[int]]:
+    """Split shards 0..shard_count-1 into contiguous ranges, one per process"""
+    processes = max(1, min(processes, shard_count))
+    size, extra = divmod(shard_count, processes)
+    ranges, start = [], 0
+    for cluster_id in range(processes):
+        end = start + size + (1 if cluster_id < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+class ClusterHealth:
+    """Publish this worker's health to, and read everyone's from, a shared dict
+
+    `shared` is a multiprocessing Manager dict owned by cluster.py, keyed by
+    cluster id. Every access is an IPC round trip, so it's done in a thread.
+    """
+
+    def __init__(self, shared, cluster_id: int, shard_ids: list[int]):
+        self.shared = shared
+        self.cluster_id = cluster_id
+        self.shard_ids = shard_ids
+        self._task: asyncio.Task | None = None
+
+    def snapshot(self, bot, status: str) -> dict:
+        return {
+            "cluster_id": self.cluster_id,
+            "status": status,
+            "shards": self.shard_ids,
+            "guilds": len(bot.guilds),
+            "users": len(bot.users),
+            "latencies_ms": {
+                shard_id: round(latency * 1000, 1)
+                for shard_id, latency in bot.latencies
+            },
+            "updated": time.time()
+        }
+
+    async def publish(self, bot, status: str = "ready") -> None:
+        try:
+            await asyncio.to_thread(
+                self.shared.__setitem__, self.cluster_id, self.snapshot(bot, status))
+        except (OSError, EOFError) as e:  # Launcher is gone, nothing to report to.
+            logging.error(f"Failed to publish cluster health: {e}")
+
+    def start(self, bot) -> None:
+        """Keep publishing every HEALTH_INTERVAL seconds"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(bot))
+
+    async def _run(self, bot) -> None:
+        while not bot.is_closed():
+            await self.publish(bot)
+            await asyncio.sleep(HEALTH_INTERVAL)
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+    async def summary(self) -> dict:
+        """Return totals across clusters and each cluster's latency"""
+        clusters = await asyncio.to_thread(self.shared.copy)  # One round trip.
+        now = time.time()
+        per_cluster = []
+        for cluster_id, health in sorted(clusters.items()):
+            latencies = list(health["latencies_ms"].values())
+            per_cluster.append({
+                "cluster_id": cluster_id,
+                "status": "stale" if now - health["updated"] > STALE_AFTER else health["status"],
+                "shards": health["shards"],
+                "guilds": health["guilds"],
+                "latency_ms": round(sum(latencies) / len(latencies), 1) if latencies else None
+            })
+        return {
+            "guilds": sum(health["guilds"] for health in clusters.values()),
+            # Users in guilds on several clusters are counted once per cluster.
+            "users": sum(health["users"] for health in clusters.values()),
+            "clusters": per_cluster
+        }
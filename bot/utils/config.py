@@ -0,0 +1,9 @@
+"""Bot configuration shared by every module"""
+from json import load
+from pathlib import Path
+
+# Resolved from this file, so it's found whatever directory the bot runs from.
+CONFIG_PATH = Path(__file__).resolve().parent.parent.parent / "config.json"
+
+with CONFIG_PATH.open() as f:
+    config: dict = load(f)
@@ -1,28 +1,37 @@
 """~~Pymongo~~ Motor utility class with database commands"""
 import os
 import logging
-from json import load
-from pathlib import Path
-import os
-import json
-from pprint import pprint
 from typing import Dict, Any
 
-import motor.motor_asyncio as motor  # Asyncio version of pymongo.
-
-# In case people want to run this on different platforms.
-config_filepath: str = "\\config.json"
-if os.name == "posix":  # Linux or macOS.
-    config_filepath = config_filepath.replace("\\", "/")
+from utils.cache import MISSING, TTLCache
+from utils.config import config
+from utils.increment_buffer import IncrementBuffer, Batch
+from utils.metrics import instrument_class
+from utils.settings import merge_settings, settings_values
+from utils.storage import StorageBackend, create_backend
 
+# Where counts are stored: "mongo", "sqlite" or "memory" (nothing persisted).
+storage_backend = config.get("STORAGE_BACKEND", "mongo")
+# Database file of the sqlite backend, relative to the bot folder.
+sqlite_path = config.get("SQLITE_PATH", "nwordcounter.sqlite3")
 # Fetch MongoDB token for database access.
-# using OS module ensures that the path is relative to the file that is being executed.
-with Path(
-        os.path.abspath(
-            os.path.join(os.getcwd(), os.pardir)
-        ) + config_filepath).open() as f:
-    config = load(f)
-    mongo_url = config["MONGO_URL"]
+mongo_url = config.get("MONGO_URL", "")
+# Optional Mongo client tuning, see MongoBackend.
+mongo_options = {
+    "max_pool_size": config.get("MONGO_MAX_POOL_SIZE", 100),
+    "min_pool_size": config.get("MONGO_MIN_POOL_SIZE", 10),
+    "timeout_ms": config.get("MONGO_TIMEOUT_MS", 5000),
+    "compressors": config.get("MONGO_COMPRESSORS", "zlib"),
+    "retries": config.get("DB_CONNECT_RETRIES", 5),
+}
+# Optional tuning for the write-behind increment buffer.
+increment_flush_ms = config.get("INCREMENT_FLUSH_MS", 500)
+increment_max_batch = config.get("INCREMENT_MAX_BATCH", 500)
+# Optional tuning for the member-state cache.
+member_cache_size = config.get("MEMBER_CACHE_SIZE", 50_000)
+member_cache_ttl = config.get("MEMBER_CACHE_TTL", 300)
+# How often the global leaderboard snapshots are recomputed.
+leaderboard_refresh_seconds = config.get("LEADERBOARD_REFRESH_SECONDS", 300)
 
 # DO NOT TOUCH - for running on hosting platform:
 if mongo_url == "":
@@ -30,87 +39,120 @@ if mongo_url == "":
 
 
 class Database:
-    """MongoDB database"""
-    _cluster = motor.AsyncIOMotorClient(mongo_url)
+    """Database commands, backed by the configured storage backend
+
+    Caches, the increment buffer and metrics live here, the backend only
+    stores and queries (see utils.storage). Nothing connects on import,
+    await start() before the bot does and close() on shutdown.
+    """
+    _backend: StorageBackend | None = None
+    LEADERBOARD_REFRESH_SECONDS = leaderboard_refresh_seconds
+    _increment_buffer: IncrementBuffer  # Assigned below the class.
+    _guild_ids: set[int] = set()  # Guilds known to be in the database.
+    # Member objects (or None if untracked) keyed by (guild_id, member_id).
+    _member_cache = TTLCache(member_cache_size, member_cache_ttl)
+    # Names of flagged members keyed by (guild_id, flag), for /whoblack and
+    # /whohaspass. Dropped on votes and pass changes, the TTL covers changes
+    # made by other processes.
+    _flagged_cache = TTLCache(10_000, member_cache_ttl)
+    # Merged settings list per guild, replaced on update_guild_settings.
+    _settings_cache: dict[int, list[dict]] = {}
+
+    @classmethod
+    def use_backend(cls, backend: StorageBackend) -> None:
+        """Swap the storage backend, dropping everything cached from the old one"""
+        cls._backend = backend
+        cls._guild_ids = set()
+        cls._member_cache.clear()
+        cls._flagged_cache.clear()
+        cls._settings_cache = {}
+
+    @classmethod
+    async def start(cls, backend: StorageBackend | None = None) -> None:
+        """Connect the configured backend (or the one given) and warm it up
 
-    # _cluster.admin.command("enableSharding", "NWordCounter")
-    # _cluster.admin.command(
-    #     "shardCollection", "NWordCounter.guild_users_db", key=1)
+        Raises if it can't connect, so bad settings stop the bot at startup
+        instead of failing on the first message.
+        """
+        if backend is None:
+            backend = create_backend(
+                storage_backend,
+                mongo={"url": mongo_url, **mongo_options},
+                sqlite_path=sqlite_path)
+        await backend.start()
+        cls.use_backend(backend)
+        logging.info(f"Database started with {type(backend).__name__}")
 
-    _db = _cluster.NWordCounter
-    _collection = _db["guild_users_db"]
-    try:
-        _cluster.admin.command('ping')
-        logging.info(
-            "Pinged your deployment. You successfully connected to MongoDB!")
-        print("Pinged your deployment. You successfully connected to MongoDB!")
-    except Exception as e:
-        logging.error(
-            f"Failed to connect to MongoDB, please check settings! Error: {e}")
+    @classmethod
+    async def close(cls) -> None:
+        """Write out buffered increments, then disconnect"""
+        if cls._backend is None:  # Never started or already closed.
+            return
+        try:
+            await cls._increment_buffer.close()
+        finally:
+            await cls._backend.close()
+            cls._backend = None
 
     @classmethod
     async def guild_in_database(cls, guild_id: int) -> bool:
         """Return True if guild is already recorded in database"""
-        count = await cls._collection.count_documents(
-            {"guild_id": guild_id}
-        )
-        return count > 0
+        if guild_id in cls._guild_ids:  # Answered in-process after sync.
+            return True
+        exists = await cls._backend.guild_exists(guild_id)
+        if exists:
+            cls._guild_ids.add(guild_id)
+        return exists
 
     @classmethod
     async def create_database(cls, guild_id: int, guild_name: str) -> None:
         """Initialize guild template in database"""
-        await cls._collection.insert_one(
-            {
-                "guild_id": guild_id,
-                "guild_name": guild_name,
-                "members": [],
-                "settings": "[]"  # JSON string
-            }
-        )
+        await cls._backend.upsert_guilds([(guild_id, guild_name)])
+        cls._guild_ids.add(guild_id)
         logging.info(f"Guild added! {guild_name} with id {guild_id}")
 
     @classmethod
-    async def update_guilds(cls):
-        """Update all guilds in database to have a settings field if they don't already."""
-        async for doc in cls._collection.find({}):
-            if "settings" not in doc:
-                await cls._collection.update_one(
-                    {"guild_id": doc["guild_id"]}, {
-                        "$set": {
-                            "settings": "[]"
-                        }
-                    }
-                )
+    async def sync_guilds(cls, guilds: list[tuple[int, str]]) -> None:
+        """Ensure every (guild_id, guild_name) is recorded with one bulk upsert"""
+        await cls._backend.upsert_guilds(guilds)
+        cls._guild_ids = {guild_id for guild_id, _ in guilds}
+        logging.info(f"Synced {len(guilds)} guilds with the database")
+
+    @classmethod
+    def forget_guild(cls, guild_id: int) -> None:
+        """Drop guild from the in-process registry, its data is kept"""
+        cls._guild_ids.discard(guild_id)
+
+    @classmethod
+    async def update_guild_name(cls, guild_id: int, guild_name: str) -> None:
+        """Keep stored guild name in sync after a rename"""
+        await cls._backend.rename_guild(guild_id, guild_name)
+
+    @classmethod
+    async def migrate_settings(cls) -> int:
+        """Convert settings stored as JSON strings into native sub-documents"""
+        converted = await cls._backend.migrate_settings()
+        for guild_id in converted:
+            cls._settings_cache.pop(guild_id, None)
+        if converted:
+            logging.info(f"Converted settings of {len(converted)} guilds")
+        return len(converted)
 
     @classmethod
     async def get_internal_guild_settings(cls, guild_id: int) -> list:
         """Return guild settings as a list"""
-        async for doc in cls._collection.find(
-            {"guild_id": guild_id}
-        ):
-            try:
-                return json.loads(doc["settings"])
-            except KeyError:
-                # If the guild doesn't have a settings field, add it.
-                await cls._collection.update_one(
-                    {"guild_id": guild_id}, {
-                        "$set": {
-                            "settings": "[]"
-                        }
-                    }
-                )
-                return []
+        if guild_id not in cls._settings_cache:
+            values = await cls._backend.get_settings(guild_id)
+            cls._settings_cache[guild_id] = merge_settings(values)
+        # Copies, callers edit these before passing them back.
+        return [dict(setting) for setting in cls._settings_cache[guild_id]]
 
     @classmethod
     async def update_guild_settings(cls, guild_id: int, settings: list) -> None:
         """Update guild settings"""
-        await cls._collection.update_one(
-            {"guild_id": guild_id}, {
-                "$set": {
-                    "settings": json.dumps(settings)
-                }
-            }
-        )
+        values = settings_values(settings)
+        await cls._backend.set_settings(guild_id, values)
+        cls._settings_cache[guild_id] = merge_settings(values)
 
     @classmethod
     async def get_guild_settings(cls, guild_id: int):
@@ -124,270 +166,211 @@ class Database:
     async def member_in_database(
             cls, guild_id: int, member_id: int) -> object | None:
         """Return True if member is already recorded in guild database"""
-        async for doc in cls._collection.aggregate(
-            [
-                {
-                    "$match": {
-                        "guild_id": guild_id,
-                        # STORED AS AN INTEGER NOT STRING.
-                        "members.id": member_id
-                    }
-                },
-                {
-                    "$unwind": "$members"
-                },
-                {
-                    "$match": {
-                        "members.id": member_id
-                    }
-                },
-                {
-                    "$replaceWith": "$members"
-                }
-            ]
-        ):
-            return doc
+        cached = cls._member_cache.get((guild_id, member_id))
+        if cached is not MISSING:
+            return cached
+        member = await cls._backend.get_member(guild_id, member_id)
+        cls._member_cache.set((guild_id, member_id), member)
+        return member
 
     @classmethod
     async def create_member(cls, guild_id, member_id, member_name) -> None:
         """Initialize member data in guild database"""
-        await cls._collection.update_one(
-            {"guild_id": guild_id}, {
-                "$push": {
-                    "members": {
-                        "id": member_id,  # STORED AS AN INTEGER NOT STRING.
-                        "name": member_name,
-                        "nword_count": 0,
-                        "is_black": False,
-                        "has_pass": False,
-                        "passes": 0,
-                        "voters": []
-                    }
-                }
-            }
-        )
+        await cls._backend.create_member(guild_id, member_id, member_name)
+        cls._member_cache.invalidate((guild_id, member_id))
 
     @classmethod
     async def increment_nword_count(cls, guild_id, member_id, count) -> None:
         """Add to n-word count of person's data info in server"""
-        await cls._collection.update_one(
-            {
-                "guild_id": guild_id,
-                "members.id": member_id
-            },
-            {
-                "$inc": {
-                    "members.$.nword_count": count
-                }
-            },
-            upsert=False  # Don't create new document if not found.
-        )
+        await cls._backend.increment_member(guild_id, member_id, "nword_count", count)
+        cls._member_cache.invalidate((guild_id, member_id))
+        await cls._increment_buffer.add(guild_id, None, count)  # Totals only.
+
+    @classmethod
+    async def record_occurrence(
+            cls, guild_id: int, member_id: int, member_name: str,
+            count: int) -> object | None:
+        """Create member if missing and add to their n-word count in one call
+
+        Returns the member object after the update.
+        """
+        member = await cls._backend.record_occurrence(
+            guild_id, member_id, member_name, count)
+        cls._member_cache.set((guild_id, member_id), member)
+        # Guild and global totals ride along with the next bulk flush.
+        await cls._increment_buffer.add(guild_id, None, count)
+        return member
+
+    @classmethod
+    async def _flush_increments(cls, batch: Batch) -> None:
+        """Apply buffered increments and their totals in one backend call"""
+        try:
+            await cls._backend.apply_increments(batch)
+        finally:  # Even a partial write may have changed some members.
+            for key in batch:
+                cls._member_cache.invalidate(key)
+
+    @classmethod
+    async def buffer_nword_count(cls, guild_id, member_id, count) -> None:
+        """Queue an n-word count increment to be written in the next bulk flush"""
+        await cls._increment_buffer.add(guild_id, member_id, count)
+
+    @classmethod
+    async def flush_increments(cls) -> int:
+        """Write out all buffered increments now"""
+        return await cls._increment_buffer.flush()
+
+    @classmethod
+    def member_cache_stats(cls) -> dict:
+        """Return hit/miss metrics of the member-state cache"""
+        return cls._member_cache.stats()
+
+    @classmethod
+    def increment_buffer_stats(cls) -> dict:
+        """Return flush and backpressure stats of the increment buffer"""
+        return cls._increment_buffer.stats()
 
     @classmethod
     async def increment_passes(cls, guild_id, member_id, count) -> None:
         """Add to user's total available n-word passes in server"""
-        await cls._collection.update_one(
-            {
-                "guild_id": guild_id,
-                "members.id": member_id
-            },
-            {
-                "$inc": {
-                    "members.$.passes": count
-                }
-            },
-            upsert=False  # Don't create new document if not found.
-        )
+        await cls._backend.increment_member(guild_id, member_id, "passes", count)
+        cls._member_cache.invalidate((guild_id, member_id))
+        cls._flagged_cache.invalidate((guild_id, "has_pass"))
 
     @classmethod
     async def get_total_documents(cls) -> int:
         """Return total number of documents in database"""
-        return await cls._collection.count_documents({})
+        return await cls._backend.count_guilds()
 
     @classmethod
     async def get_nword_server_total(cls, guild_id) -> int:
         """Return integer sum of total n-words said in a server"""
-        async for doc in cls._collection.aggregate(
-            [
-                {
-                    "$match": {
-                        "guild_id": guild_id
-                    }
-                },
-                {
-                    "$unwind": "$members"
-                },
-                {
-                    "$group": {
-                        "_id": guild_id,
-                        "total_nwords": {
-                            "$sum": "$members.nword_count"
-                        }
-                    }
-                }
-            ]
-        ):
-            return doc["total_nwords"]
+        return await cls._backend.get_guild_total(guild_id)
 
     @classmethod
     async def get_all_time_servers(cls, limit: int):
         """Return the servers with the highest recorded n-word count out of all servers"""
-        out = []
-        async for doc in cls._collection.aggregate(
-            [
-                {
-                    "$unwind": "$members"
-                },
-                {
-                    "$group": {
-                        "_id": {
-                            "guild_id": "$guild_id",
-                            "guild_name": "$guild_name"
-                        },
-                        "nword_count": {"$sum": "$members.nword_count"}
-                    }
-                },
-                {
-                    "$sort": {"nword_count": -1}
-                },
-                {
-                    "$limit": limit
-                }
-            ]
-        ):
-            out.append(doc)
-        return out
+        return await cls._backend.top_servers(limit)
 
     @classmethod
     async def get_all_time_counts(cls, limit: int):
         """Return the member with the highest recorded n-word count out of all servers"""
-        out = []
-        async for doc in cls._collection.aggregate(
-            [
-                {
-                    "$unwind": "$members"
-                },
-                {
-                    "$sort": {"members.nword_count": -1}
-                },
-                {
-                    "$limit": limit
-                },
-                {
-                    "$project": {
-                        "_id": None,
-                        "member": "$members.name",
-                        "nword_count": "$members.nword_count"
-                    }
-                }
-            ]
-        ):
-            out.append(doc)
-        return out
-
-    @classmethod
-    async def get_member_list(cls, guild_id) -> list[object] | list[None]:
-        """Return sorted ranked list of member objects based on n-word frequency"""
-        async for doc in cls._collection.aggregate(
-            [
-                {
-                    "$match": {"guild_id": guild_id}  # Get guild document.
-                },
-                {
-                    "$unwind": "$members"  # Unravel array of member objects.
-                },
-                {
-                    "$sort": {  # Sort in descending order.
-                        "members.nword_count": -1
-                    }
-                },
-                {
-                    "$group": {  # Create custom group of member objects.
-                        "_id": None,
-                        "member_object_list": {  # To be included per member object.
-                            "$push": {
-                                "name": "$members.name",
-                                "is_black": "$members.is_black",
-                                "has_pass": "$members.has_pass",
-                                "nword_count": "$members.nword_count"
-                            }
-                        },
-                    }
-                },
-                {
-                    "$project": {  # Only include member array.
-                        "_id": False,
-                        "member_object_list": True
-                    }
-                }
-            ]
-        ):
-            return doc["member_object_list"]
+        return await cls._backend.top_counts(limit)
+
+    @classmethod
+    async def materialize_leaderboards(cls, limit: int = 100) -> None:
+        """Recompute global leaderboards into the snapshot collection"""
+        await cls._backend.materialize_leaderboards(limit)
+
+    @classmethod
+    async def get_leaderboards(cls) -> dict[str, dict]:
+        """Return leaderboard snapshots as {name: {"entries", "as_of"}}"""
+        return await cls._backend.get_leaderboards()
+
+    @classmethod
+    async def get_flagged_names(cls, guild_id: int, flag: str) -> list[str]:
+        """Return names of members with is_black or has_pass set, ranked by count"""
+        names = cls._flagged_cache.get((guild_id, flag))
+        if names is MISSING:
+            names = await cls._backend.flagged_names(guild_id, flag)
+            cls._flagged_cache.set((guild_id, flag), names)
+        return names
+
+    @classmethod
+    async def get_member_page(
+            cls, guild_id: int, skip: int, limit: int) -> list[object]:
+        """Return one slice of the guild's ranked member list"""
+        return await cls._backend.member_page(guild_id, skip, limit)
 
     @classmethod
     async def cast_vote(
         cls, type: str, guild_id: int, vote_threshold: int,
         voter_id: int, votee_id: int
-    ) -> None | object:
-        """Insert voter id into votee's voter list in database"""
-        action = None
-        if type == "vote":
-            action = {
-                # Add vote count to user's voters.
-                "$push": {"members.$.voters": voter_id}
-            }
-        else:
-            action = {
-                "$pull": {"members.$.voters": voter_id}  # Remove vote count.
-            }
-
-        # Update member object.
-        voted = await cls._collection.update_one(
-            {
-                "guild_id": guild_id,
-                "members.id": votee_id
-            },
-            action,
-            upsert=False
-        )
-
-        if not voted:  # User doesn't exist.
-            return None
-
-        # Check if enough votes to be verified black.
-        member = await cls.member_in_database(guild_id, votee_id)
-        set_black = None
-        if len(member["voters"]) >= vote_threshold:  # Enough votes.
-            set_black = {
-                "$set": {"members.$.is_black": True}
-            }
-        else:
-            set_black = {
-                "$set": {"members.$.is_black": False}
-            }
-
-        # Update member object.
-        cls._collection.update_one({"guild_id": guild_id, "members.id": votee_id}, set_black, upsert=False)
+    ) -> dict | None:
+        """Add or remove a vote in one atomic update
 
-        return member
+        Returns {"applied", "votes", "is_black"}, None if the votee isn't
+        in the database.
+        """
+        result = await cls._backend.cast_vote(
+            type, guild_id, vote_threshold, voter_id, votee_id)
+        cls._member_cache.invalidate((guild_id, votee_id))
+        if result is not None:
+            cls._flagged_cache.invalidate((guild_id, "is_black"))
+        return result
 
     # A function that returns a total count of all n-words said by everyone, everywhere.
     @classmethod
     async def get_global_nword_count(cls) -> int:
         """Return integer sum of total n-words said in all servers"""
-        async for doc in cls._collection.aggregate(
-            [
-                {
-                    "$unwind": "$members"
-                },
-                {
-                    "$group": {
-                        "_id": "global",
-                        "total_nwords": {
-                            "$sum": "$members.nword_count"
-                        }
-                    }
-                }
-            ]
-        ):
-            return doc["total_nwords"]
\ No newline at end of file
+        return await cls._backend.get_global_total() or 0
+
+    @classmethod
+    async def verify_totals(cls, repair: bool = False) -> dict:
+        """Recompute guild and global totals from member counts
+
+        Returns the guilds whose stored total drifted. With repair, the
+        recomputed totals are written back. Pending increments are flushed
+        first, counts arriving mid-run can still make the result drift by
+        those counts.
+        """
+        await cls.flush_increments()
+
+        actual = await cls._backend.member_totals()
+        drifted = {}
+        for guild_id, stored in (await cls._backend.guild_totals()).items():
+            expected = actual.get(guild_id, 0)
+            if stored != expected:
+                drifted[guild_id] = {"stored": stored, "actual": expected}
+
+        global_stored = await cls.get_global_nword_count()
+        global_actual = sum(actual.values())
+
+        if repair:
+            await cls._backend.set_totals(
+                {guild_id: totals["actual"] for guild_id, totals in drifted.items()},
+                global_actual)
+            logging.info(
+                f"Repaired totals of {len(drifted)} guilds, global total "
+                f"{global_stored} -> {global_actual}")
+
+        return {
+            "guilds": drifted,
+            "global": {"stored": global_stored, "actual": global_actual}
+        }
+
+    @classmethod
+    async def ensure_totals(cls) -> None:
+        """Compute running totals once if they were never stored"""
+        if await cls._backend.get_global_total() is None:
+            await cls.verify_totals(repair=True)
+
+    @classmethod
+    async def ensure_indexes(cls) -> list[str]:
+        """Create any missing required index, return names of those built"""
+        return await cls._backend.ensure_indexes()
+
+    @classmethod
+    async def index_report(cls) -> dict:
+        """Return missing required indexes and existing ones never used"""
+        return await cls._backend.index_report()
+
+    @classmethod
+    async def migrate_members(cls, batch_size: int = 500) -> dict:
+        """Move embedded members arrays into the per-member collection"""
+        migrated = await cls._backend.migrate_members(batch_size)
+        if migrated["members"]:
+            cls._member_cache.clear()
+            cls._flagged_cache.clear()
+        return migrated
+
+
+# Every query gets a latency histogram and error counter for /dev stats.
+instrument_class(Database)
+
+# Bound after class creation since the flush callback is a classmethod.
+Database._increment_buffer = IncrementBuffer(
+    Database._flush_increments,
+    interval_ms=increment_flush_ms,
+    max_batch=increment_max_batch
+)
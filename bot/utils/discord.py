@@ -1,7 +1,33 @@
 import io
+import json
+import asyncio
+import logging
+import importlib
+from concurrent.futures import ThreadPoolExecutor
 import aiohttp
 import discord
-from PIL import Image
+
+from utils.cache import MISSING, TTLCache
+from utils.config import config
+
+# Pillow and NumPy are only needed for the first avatar color, loading them
+# then instead of at startup gets the bot connected sooner. _dominant_rgb
+# imports them itself, this only warms sys.modules when not deferring.
+if not config.get("DEFER_HEAVY_IMPORTS", False):
+    importlib.import_module("numpy")
+    importlib.import_module("PIL.Image")
+
+AVATAR_SIZE = 64  # Plenty for a dominant color, a fraction of the download.
+MAX_AVATAR_BYTES = 2 * 1024 * 1024
+MAX_AVATAR_PIXELS = 4096 * 4096  # Refuse to decode anything bigger (decompression bombs).
+COLOR_TIMEOUT = 2  # Seconds before giving up and using blurple.
+
+# Image decoding stays off the event loop.
+_color_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="color")
+
+# Computed colors keyed by avatar hash (or url), evicted least-recently-used.
+_color_cache = TTLCache(maxsize=10_000)
+_session: aiohttp.ClientSession | None = None
 
 
 def convert_color(color: tuple | str | discord.Color) -> discord.Color:
@@ -16,31 +42,120 @@ def convert_color(color: tuple | str | discord.Color) -> discord.Color:
     raise TypeError("Invalid color type, must be tuple or hex string starting with #")
 
 
-async def generate_color(image_url: str):
+def get_session() -> aiohttp.ClientSession:
+    """Return the shared HTTP session, pooling connections across calls"""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=20, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=10))
+    return _session
+
+
+async def close_session() -> None:
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+def load_color_cache(path: str) -> None:
+    """Fill the color cache from a file written by save_color_cache"""
+    try:
+        with open(path, "r") as f:
+            for key, value in json.load(f).items():
+                _color_cache.set(key, value)
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError) as e:
+        logging.error(f"Failed to load color cache from {path}: {e}")
+        return
+    logging.info(f"Loaded {len(_color_cache)} cached colors from {path}")
+
+
+def save_color_cache(path: str) -> None:
+    """Write the color cache to a file so it survives restarts"""
+    try:
+        with open(path, "w") as f:
+            json.dump(dict(_color_cache.items()), f)
+    except OSError as e:
+        logging.error(f"Failed to save color cache to {path}: {e}")
+
+
+def color_cache_stats() -> dict:
+    return _color_cache.stats()
+
+
+async def generate_color(image: discord.Asset | str) -> discord.Color:
     """Generate a similar color to the album cover of the song.
-    :param image_url: The url of the album cover.
+    :param image: The avatar asset, or url of the album cover.
     :return discord.Color: A discord color.
     """
+    if isinstance(image, discord.Asset):
+        # Same hash means same image, whatever size is requested.
+        key = image.key
+        image_url = image.with_static_format("png").with_size(AVATAR_SIZE).url
+    else:
+        key = image_url = image
+
+    cached = _color_cache.get(key)
+    if cached is not MISSING:
+        return discord.Color(cached)
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(image_url) as resp:
-            if resp.status != 200:
-                return discord.Color.blurple()
-            f = io.BytesIO(await resp.read())
-    image = Image.open(f)
-    # Get average color of the image
-    colors = image.getcolors(image.size[0] * image.size[1])
-    # Sort the colors by the amount of pixels and get the most common color
-    colors.sort(key=lambda x: x[0], reverse=True)
-    # Get the color of the most common color
-    color = colors[0][1]
     try:
-        if len(color) < 3:
-            return discord.Color.blurple()
-    except TypeError:
+        rgb = await asyncio.wait_for(_fetch_dominant_rgb(image_url), COLOR_TIMEOUT)
+    except (aiohttp.ClientError, asyncio.TimeoutError):
         return discord.Color.blurple()
-    # Convert the color to a discord color
-    return discord.Color.from_rgb(color[0], color[1], color[2])
+    if rgb is None:
+        return discord.Color.blurple()
+    color = discord.Color.from_rgb(*rgb)
+    _color_cache.set(key, color.value)
+    return color
+
+
+async def _fetch_dominant_rgb(image_url: str) -> tuple[int, int, int] | None:
+    """Download an image and find its dominant color in the worker pool"""
+    async with get_session().get(image_url) as resp:
+        if resp.status != 200:
+            return None
+        if (resp.content_length or 0) > MAX_AVATAR_BYTES:
+            return None
+        data = await resp.read()
+    if len(data) > MAX_AVATAR_BYTES:
+        return None
+    return await asyncio.get_running_loop().run_in_executor(
+        _color_executor, _dominant_rgb, data)
+
+
+def _dominant_rgb(data: bytes) -> tuple[int, int, int] | None:
+    """Return the most common color of an image, None if it can't be read
+
+    Runs in a worker thread. The image is shrunk to AVATAR_SIZE first and
+    colors are bucketed to 5 bits per channel, so near-identical shades of
+    a gradient count as one color. The bucket's average color is returned.
+    """
+    import numpy as np  # Already loaded unless DEFER_HEAVY_IMPORTS is set.
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            # Only the header is read so far, check before decoding.
+            if image.width * image.height > MAX_AVATAR_PIXELS:
+                return None
+            image.draft("RGB", (AVATAR_SIZE, AVATAR_SIZE))  # Cheap JPEG downscale.
+            image.thumbnail((AVATAR_SIZE, AVATAR_SIZE))  # First frame if animated.
+            pixels = np.asarray(image.convert("RGBA")).reshape(-1, 4)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+    pixels = pixels[pixels[:, 3] > 0, :3]  # Ignore transparent pixels.
+    if not len(pixels):
+        return None
+    buckets = pixels.astype(np.int32) >> 3
+    bucket_ids = (buckets[:, 0] << 10) | (buckets[:, 1] << 5) | buckets[:, 2]
+    top = np.bincount(bucket_ids, minlength=1 << 15).argmax()
+    r, g, b = pixels[bucket_ids == top].mean(axis=0)
+    return int(r), int(g), int(b)
 
 
 async def generate_message_embed(text: str,
@@ -59,7 +174,7 @@ async def generate_message_embed(text: str,
         color = color or discord.Color.orange()
         title = ":orange_circle: Warning"
     elif type is None and color is None:
-        color = await generate_color(ctx.author.avatar.url)
+        color = await generate_color(ctx.author.display_avatar)
     elif type is None and color is not None:
         color = convert_color(color)
     else:
@@ -67,5 +182,5 @@ async def generate_message_embed(text: str,
     embed = discord.Embed(description=text, color=color, title=title)
     if ctx is not None:
         embed.set_footer(text=f"Command ran by {ctx.author.display_name} | {ctx.bot.user.name}",
-                         icon_url=ctx.author.avatar.url)
+                         icon_url=ctx.author.display_avatar.url)
     return embed
@@ -0,0 +1,153 @@
+"""Write-behind buffer that batches n-word count increments"""
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+# Pending deltas keyed by (guild_id, member_id). A member_id of None marks
+# a delta whose member was already written and only totals are pending,
+# (None, None) one that only still has to reach the global total.
+Batch = dict[tuple[int | None, int | None], int]
+
+
+class PartialFlushError(Exception):
+    """Raised by a flush function that wrote only part of a batch
+
+    `remaining` holds the deltas still to be written, only those are put
+    back for the next flush.
+    """
+
+    def __init__(self, remaining: Batch, cause: Exception):
+        super().__init__(str(cause))
+        self.remaining = remaining
+
+
+class BufferFullError(Exception):
+    """Raised by IncrementBuffer.add when flushing can't make room"""
+
+
+class IncrementBuffer:
+    """Collect count deltas in memory and flush them in bulk.
+
+    Deltas for the same (guild_id, member_id) are merged, so a flood in one
+    channel collapses into a single update per member. The batch is handed to
+    `flush_fn` every `interval_ms` or as soon as `max_batch` members are
+    pending, whichever comes first. Once `max_pending` members are waiting,
+    callers block on a flush instead of growing the buffer (backpressure),
+    and get BufferFullError if that flush fails.
+
+    `flush_fn` either writes the whole batch or nothing, or raises
+    PartialFlushError saying what's left. Anything it raises is retried.
+    """
+
+    def __init__(self, flush_fn: Callable[[Batch], Awaitable[None]],
+                 interval_ms: int = 500, max_batch: int = 500,
+                 max_pending: int = 10_000):
+        self._flush_fn = flush_fn
+        self.interval = interval_ms / 1000
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+
+        self._pending: Batch = {}
+        self._lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._closing = False
+
+        self._stats = {
+            "increments": 0,
+            "flushes": 0,
+            "flushed_updates": 0,
+            "failed_flushes": 0,
+            "backpressure_waits": 0,
+            "rejected_increments": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0
+        }
+
+    def _ensure_task(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def add(self, guild_id: int, member_id: int | None, count: int) -> None:
+        """Buffer an increment of `count` for a member"""
+        key = (guild_id, member_id)
+        if key not in self._pending and len(self._pending) >= self.max_pending:
+            self._stats["backpressure_waits"] += 1
+            await self.flush()
+            # Flushing failed, don't grow without bound while the database is down.
+            if len(self._pending) >= self.max_pending:
+                self._stats["rejected_increments"] += 1
+                raise BufferFullError(
+                    f"{len(self._pending)} increments pending and flushing failed")
+
+        self._pending[key] = self._pending.get(key, 0) + count
+        self._stats["increments"] += 1
+
+        self._ensure_task()
+        if len(self._pending) >= self.max_batch:
+            self._wake.set()
+
+    async def flush(self) -> int:
+        """Write out everything pending, return number of updates flushed"""
+        async with self._lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+
+            start = time.perf_counter()
+            try:
+                await self._flush_fn(batch)
+            except asyncio.CancelledError:
+                # Cancelled mid-write, keep the batch for close() to flush.
+                for key, delta in batch.items():
+                    self._pending[key] = self._pending.get(key, 0) + delta
+                raise
+            except Exception as e:
+                # Put back what wasn't written so the next flush retries it.
+                remaining = e.remaining if isinstance(e, PartialFlushError) else batch
+                for key, delta in remaining.items():
+                    self._pending[key] = self._pending.get(key, 0) + delta
+                self._stats["failed_flushes"] += 1
+                logging.error(
+                    f"Failed to flush {len(remaining)} of {len(batch)} increments: {e}")
+                return 0
+            elapsed_ms = (time.perf_counter() - start) * 1000
+
+            self._stats["flushes"] += 1
+            self._stats["flushed_updates"] += len(batch)
+            self._stats["last_flush_ms"] = round(elapsed_ms, 2)
+            self._stats["max_flush_ms"] = round(
+                max(self._stats["max_flush_ms"], elapsed_ms), 2)
+            return len(batch)
+
+    async def close(self) -> None:
+        """Stop the flush timer and write out whatever is left"""
+        self._closing = True
+        self._wake.set()
+        task, self._task = self._task, None
+        if task is not None:
+            try:
+                await task
+            except asyncio.CancelledError:
+                # Client.run cancels every task on shutdown before the bot
+                # closes, the timer's gone but the pending increments aren't.
+                if not task.cancelled():
+                    raise
+        try:
+            await self.flush()
+        finally:
+            self._closing = False
+
+    def stats(self) -> dict:
+        """Return flush and backpressure counters"""
+        return {**self._stats, "pending": len(self._pending)}
@@ -0,0 +1,156 @@
+"""Declared MongoDB indexes, created and checked at startup"""
+import asyncio
+import logging
+from typing import NamedTuple
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import AutoReconnect, PyMongoError
+
+
+class IndexSpec(NamedTuple):
+    """Index required by a query in utils.database"""
+    collection: str
+    keys: list[tuple[str, int]]
+    options: dict | None = None  # Not {}, one dict would be shared by every spec.
+
+    @property
+    def name(self) -> str:
+        return (self.options or {}).get(
+            "name", "_".join(f"{field}_{direction}" for field, direction in self.keys))
+
+
+REQUIRED_INDEXES = [
+    # guild_in_database, settings lookups and the guild registry upserts.
+    IndexSpec("guild_users_db", [("guild_id", ASCENDING)], {"unique": True}),
+    # Global guild leaderboard.
+    IndexSpec("guild_users_db", [("nword_total", DESCENDING)]),
+    # Member point lookups and upserts.
+    IndexSpec("guild_members", [("guild_id", ASCENDING), ("id", ASCENDING)],
+              {"unique": True}),
+    # Guild leaderboards.
+    IndexSpec("guild_members", [("guild_id", ASCENDING), ("nword_count", DESCENDING)]),
+    # Global leaderboard.
+    IndexSpec("guild_members", [("nword_count", DESCENDING)]),
+    # /whoblack and /whohaspass, partial so only flagged members are indexed.
+    IndexSpec("guild_members", [("guild_id", ASCENDING), ("is_black", ASCENDING)],
+              {"partialFilterExpression": {"is_black": True}}),
+    IndexSpec("guild_members", [("guild_id", ASCENDING), ("has_pass", ASCENDING)],
+              {"partialFilterExpression": {"has_pass": True}}),
+]
+
+
+class IndexManager:
+    """Create missing indexes and report on the ones that exist"""
+
+    PROGRESS_INTERVAL = 5  # Seconds between build progress log lines.
+    RETRIES = 3  # Attempts per collection if the connection drops mid-build.
+    RETRY_DELAY = 30
+
+    def __init__(self, db, specs: list[IndexSpec] = REQUIRED_INDEXES):
+        self.db = db
+        self.specs = specs
+
+    async def _existing(self, collection: str) -> dict[tuple, str]:
+        """Return existing indexes of a collection as {key pattern: name}"""
+        existing = {}
+        async for index in self.db[collection].list_indexes():
+            existing[tuple(index["key"].items())] = index["name"]
+        return existing
+
+    async def missing(self) -> list[IndexSpec]:
+        """Return declared indexes not present on their collection"""
+        missing = []
+        for collection in {spec.collection for spec in self.specs}:
+            existing = await self._existing(collection)
+            missing += [
+                spec for spec in self.specs
+                if spec.collection == collection
+                and tuple(spec.keys) not in existing
+            ]
+        return missing
+
+    async def ensure(self) -> list[str]:
+        """Build every missing index in the background, return their names"""
+        try:
+            missing = await self.missing()
+        except PyMongoError as e:
+            logging.error(f"Failed to check indexes: {e}")
+            return []
+        if not missing:
+            logging.info("All required indexes are present")
+            return []
+
+        by_collection: dict[str, list[IndexSpec]] = {}
+        for spec in missing:
+            by_collection.setdefault(spec.collection, []).append(spec)
+
+        created = []
+        for collection, specs in by_collection.items():
+            logging.info(
+                f"Building indexes on {collection}: "
+                f"{', '.join(spec.name for spec in specs)}")
+            for attempt in range(1, self.RETRIES + 1):
+                try:
+                    created += await self._build(collection, specs)
+                except AutoReconnect as e:  # Also NetworkTimeout.
+                    if attempt < self.RETRIES:
+                        # createIndexes joins a build still running on the server.
+                        logging.warning(
+                            f"Lost connection building indexes on {collection} "
+                            f"({attempt}/{self.RETRIES}), retrying in {self.RETRY_DELAY}s: {e}")
+                        await asyncio.sleep(self.RETRY_DELAY)
+                        continue
+                    logging.error(f"Failed to build indexes on {collection}: {e}")
+                except PyMongoError as e:
+                    # e.g. duplicate guild_id documents blocking a unique index.
+                    logging.error(f"Failed to build indexes on {collection}: {e}")
+                else:
+                    logging.info(f"Finished building indexes on {collection}")
+                break
+        return created
+
+    async def _build(self, collection: str, specs: list[IndexSpec]) -> list[str]:
+        """Create indexes on one collection, logging progress until done"""
+        build = asyncio.create_task(self.db[collection].create_indexes(
+            [IndexModel(spec.keys, background=True, **(spec.options or {}))
+             for spec in specs]
+        ))
+        while not build.done():
+            await asyncio.wait({build}, timeout=self.PROGRESS_INTERVAL)
+            if not build.done():
+                await self._log_progress(collection)
+        return build.result()
+
+    async def _log_progress(self, collection: str) -> None:
+        """Log progress of index builds currently running on a collection"""
+        try:
+            async for op in self.db.client.admin.aggregate(
+                [
+                    {"$currentOp": {}},
+                    {"$match": {
+                        "command.createIndexes": collection,
+                        "ns": f"{self.db.name}.{collection}"
+                    }}
+                ]
+            ):
+                progress = op.get("progress", {})
+                logging.info(
+                    f"Index build on {collection}: {op.get('msg', 'running')} "
+                    f"({progress.get('done', '?')}/{progress.get('total', '?')})")
+        except PyMongoError as e:  # Missing inprog privilege, connection blips.
+            logging.info(f"Index build on {collection} still running ({e})")
+
+    async def report(self) -> dict:
+        """Return missing declared indexes and existing ones never used
+
+        Usage counts come from $indexStats and reset on server restart.
+        """
+        unused = []
+        for collection in {spec.collection for spec in self.specs}:
+            async for stats in self.db[collection].aggregate([{"$indexStats": {}}]):
+                if stats["name"] != "_id_" and stats["accesses"]["ops"] == 0:
+                    unused.append(f"{collection}.{stats['name']}")
+        return {
+            "missing": [f"{spec.collection}.{spec.name}" for spec in await self.missing()],
+            "unused": sorted(unused)
+        }
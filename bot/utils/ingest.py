@@ -0,0 +1,136 @@
+"""Bounded queue between the message listener and database workers"""
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Hashable, NamedTuple
+
+from utils.metrics import metrics
+
+
+class Hit(NamedTuple):
+    """A message with n-words in it, waiting to be recorded"""
+    message: Any  # discord.Message
+    count: int
+    enqueued_at: float
+
+
+class IngestionPipeline:
+    """Hand n-word hits from the gateway listener to a pool of workers.
+
+    The listener only matches and calls `submit`, so slow database calls
+    never hold up gateway event dispatch. Workers call `handle(hit, reply)`.
+    Under backlog replies are shed first: `reply` is False once the queue
+    is deeper than `shed_depth` or the hit waited longer than
+    `reply_deadline` seconds. Only when the queue is full is the hit handed
+    to `overflow`, which should record the count as cheaply as possible.
+    Overflowed hits with the same `merge_key(message)` are merged and all
+    of them are recorded one at a time by a single task.
+    """
+
+    def __init__(self, handle: Callable[[Hit, bool], Awaitable[None]],
+                 overflow: Callable[[Hit], Awaitable[None]],
+                 workers: int = 4, maxsize: int = 1000,
+                 shed_depth: int | None = None, reply_deadline: float = 10,
+                 merge_key: Callable[[Any], Hashable] = lambda message: message):
+        self._handle = handle
+        self._overflow = overflow
+        self._merge_key = merge_key
+        self.num_workers = workers
+        self.shed_depth = maxsize // 2 if shed_depth is None else shed_depth
+        self.reply_deadline = reply_deadline
+
+        self._queue: asyncio.Queue[Hit] = asyncio.Queue(maxsize)
+        self._workers: list[asyncio.Task] = []
+        self._overflowed: dict[Hashable, Hit] = {}
+        self._overflow_task: asyncio.Task | None = None
+
+        self._stats = {
+            "submitted": 0,
+            "processed": 0,
+            "errors": 0,
+            "replies_shed": 0,
+            "overflowed": 0,
+            "max_depth": 0,
+            "last_lag_ms": 0.0,
+            "max_lag_ms": 0.0
+        }
+
+    def _ensure_workers(self) -> None:
+        if not self._workers:
+            loop = asyncio.get_running_loop()
+            self._workers = [
+                loop.create_task(self._work()) for _ in range(self.num_workers)]
+
+    def submit(self, message, count: int) -> None:
+        """Queue a hit without waiting, overflowing if the queue is full"""
+        self._ensure_workers()
+        hit = Hit(message, count, time.monotonic())
+        self._stats["submitted"] += 1
+        try:
+            self._queue.put_nowait(hit)
+        except asyncio.QueueFull:
+            # Counts are never dropped, only the reply and the full path.
+            # Merging keeps a raid from piling up one task per hit.
+            self._stats["overflowed"] += 1
+            key = self._merge_key(message)
+            merged = self._overflowed.get(key)
+            self._overflowed[key] = hit if merged is None else merged._replace(
+                count=merged.count + count)
+            if self._overflow_task is None or self._overflow_task.done():
+                self._overflow_task = asyncio.get_running_loop().create_task(
+                    self._drain_overflow())
+            return
+        self._stats["max_depth"] = max(self._stats["max_depth"], self._queue.qsize())
+
+    async def _drain_overflow(self) -> None:
+        while self._overflowed:
+            key = next(iter(self._overflowed))
+            await self._run_overflow(self._overflowed.pop(key))
+
+    async def _run_overflow(self, hit: Hit) -> None:
+        try:
+            await self._overflow(hit)
+        except Exception as e:
+            self._stats["errors"] += 1
+            logging.error(f"Failed to record overflowed hit: {e}")
+
+    async def _work(self) -> None:
+        while True:
+            hit = await self._queue.get()
+            lag = time.monotonic() - hit.enqueued_at
+            self._stats["last_lag_ms"] = round(lag * 1000, 2)
+            self._stats["max_lag_ms"] = max(self._stats["max_lag_ms"], self._stats["last_lag_ms"])
+            metrics.observe("nword_stage_seconds", lag, stage="queue_wait")
+
+            reply = lag <= self.reply_deadline and self._queue.qsize() <= self.shed_depth
+            if not reply:
+                self._stats["replies_shed"] += 1
+            try:
+                await self._handle(hit, reply)
+                self._stats["processed"] += 1
+            except Exception as e:
+                self._stats["errors"] += 1
+                logging.error(f"Failed to process hit: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def close(self) -> None:
+        """Finish queued hits, then stop the workers"""
+        # Shutdown may have cancelled the workers already, nobody would join.
+        if any(not worker.done() for worker in self._workers):
+            await self._queue.join()
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+        # Left behind by cancelled workers, count them without replying.
+        while not self._queue.empty():
+            await self._run_overflow(self._queue.get_nowait())
+            self._queue.task_done()
+        if self._overflow_task is not None:
+            await self._overflow_task
+            self._overflow_task = None
+
+    def stats(self) -> dict:
+        """Return queue depth, lag and shedding counters"""
+        return {**self._stats, "depth": self._queue.qsize(),
+                "overflow_pending": len(self._overflowed)}
@@ -0,0 +1,114 @@
+"""Compiled n-word matcher built once and shared by the counter cog"""
+import os
+import re
+import string
+import logging
+from pathlib import Path
+from typing import Iterable, NamedTuple
+
+# Create the n-word lists from ASCII, so I don't have to type it.
+NWORDS_LIST = [
+    (chr(110) + chr(105) + chr(103) + chr(103) + chr(97)),
+    (chr(47) + chr(92) + chr(47) + chr(105) + chr(103) + chr(103) + chr(97)),
+    (chr(124) + chr(92) + chr(47) + chr(105) + chr(103) + chr(103) + chr(97))
+]
+HARD_RS_LIST = [
+    (chr(110) + chr(105) + chr(103) + chr(103) + chr(101) + chr(114)),
+    (chr(47) + chr(92) + chr(47) + chr(105) + chr(103) + chr(103) + chr(101) +
+     chr(114)),
+    (chr(124) + chr(92) + chr(47) + chr(105) + chr(103) + chr(103) + chr(101) +
+     chr(114))]
+
+# Built once instead of a fresh dict per message.
+_STRIP_WHITESPACE = str.maketrans("", "", string.whitespace)
+
+
+def normalize(msg: str) -> str:
+    """Lowercase a message and drop every whitespace character"""
+    return msg.lower().translate(_STRIP_WHITESPACE)
+
+
+def _common_substring(words: list[str]) -> str:
+    """Return the longest substring shared by every word (used as prefilter)"""
+    if not words:
+        return ""
+    shortest = min(words, key=len)
+    for size in range(len(shortest), 0, -1):
+        for start in range(len(shortest) - size + 1):
+            candidate = shortest[start:start + size]
+            if all(candidate in word for word in words):
+                return candidate
+    return ""
+
+
+class _Compiled(NamedTuple):
+    """Immutable matcher state, swapped as a whole on whitelist reloads"""
+    pattern: re.Pattern
+    needle: str
+    whitelist_mtime: int | None
+
+
+class NWordMatcher:
+    """Count n-words in a single pass over the normalized message.
+
+    Counted words and whitelisted words share one compiled alternation.
+    Whitelisted words are listed first (longest first), so a whitelisted
+    word swallows the n-word inside it instead of being subtracted later.
+    """
+
+    def __init__(self, words: Iterable[str], whitelist_path: str | Path):
+        self.words = [word.lower() for word in words]
+        self.whitelist_path = Path(whitelist_path)
+        self._compiled = self._build()
+
+    def _read_whitelist(self) -> tuple[list[str], int | None]:
+        try:
+            mtime = os.stat(self.whitelist_path).st_mtime_ns
+            with open(self.whitelist_path, "r") as f:
+                whitelist = [
+                    line.strip().lower() for line in f.read().splitlines()
+                    if line.strip()
+                ]
+        except FileNotFoundError:
+            logging.warning(f"Whitelist not found at {self.whitelist_path}")
+            return [], None
+        return whitelist, mtime
+
+    def _build(self) -> _Compiled:
+        whitelist, mtime = self._read_whitelist()
+        whitelist_alt = "|".join(
+            re.escape(word) for word in sorted(set(whitelist), key=len, reverse=True))
+        words_alt = "|".join(
+            re.escape(word) for word in sorted(set(self.words), key=len, reverse=True))
+        if whitelist_alt:
+            pattern = re.compile(f"(?P<white>{whitelist_alt})|(?P<hit>{words_alt})")
+        else:
+            pattern = re.compile(f"(?P<hit>{words_alt})")
+        return _Compiled(pattern, _common_substring(self.words), mtime)
+
+    def count(self, msg: str) -> int:
+        """Return occurrences of n-words in a given message"""
+        compiled = self._compiled  # Single read, safe against a concurrent swap.
+        text = normalize(msg)
+        if compiled.needle not in text:  # Most messages stop here.
+            return 0
+        return sum(
+            1 for match in compiled.pattern.finditer(text)
+            if match.lastgroup == "hit"
+        )
+
+    def reload(self) -> None:
+        """Rebuild from the whitelist on disk and swap it in atomically"""
+        self._compiled = self._build()
+        logging.info(f"Reloaded whitelist from {self.whitelist_path}")
+
+    def reload_if_changed(self) -> bool:
+        """Reload the whitelist if it was modified since the last build"""
+        try:
+            mtime = os.stat(self.whitelist_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._compiled.whitelist_mtime:
+            return False
+        self.reload()
+        return True
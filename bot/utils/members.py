@@ -0,0 +1,57 @@
+"""Guild member counts and lookups that don't need the member cache"""
+import discord
+
+from utils.cache import MISSING, TTLCache
+
+
+class MemberDirectory:
+    """Per-guild human member counts and on-demand member lookups
+
+    Counts start from the guild when first asked for and then follow joins
+    and leaves, so nothing iterates a guild's member list per command.
+    Members the cache doesn't hold are fetched once and kept for `ttl`.
+    """
+
+    def __init__(self, maxsize: int = 10_000, ttl: float = 300):
+        self._humans: dict[int, int] = {}
+        self._members = TTLCache(maxsize, ttl)
+
+    def human_count(self, guild: discord.Guild) -> int:
+        """Return the number of members in a guild that aren't bots"""
+        count = self._humans.get(guild.id)
+        if count is None:
+            if guild.chunked:
+                count = sum(1 for member in guild.members if not member.bot)
+            else:
+                # Bots can't be told apart without the member list. They're a
+                # handful per guild, close enough for vote thresholds.
+                count = guild.member_count or 0
+            self._humans[guild.id] = count
+        return count
+
+    def member_joined(self, member: discord.Member) -> None:
+        self._members.invalidate((member.guild.id, member.id))  # Cached as gone.
+        if not member.bot and member.guild.id in self._humans:
+            self._humans[member.guild.id] += 1
+
+    def member_left(self, guild_id: int, user: discord.User) -> None:
+        self._members.invalidate((guild_id, user.id))
+        if not user.bot and guild_id in self._humans:
+            self._humans[guild_id] = max(0, self._humans[guild_id] - 1)
+
+    def forget_guild(self, guild_id: int) -> None:
+        self._humans.pop(guild_id, None)
+
+    async def resolve(self, guild: discord.Guild, user_id: int) -> discord.Member | None:
+        """Return a guild member, or None if the user isn't in the guild"""
+        member = guild.get_member(user_id)
+        if member is not None:
+            return member
+        member = self._members.get((guild.id, user_id))
+        if member is MISSING:
+            try:
+                member = await guild.fetch_member(user_id)
+            except discord.NotFound:
+                member = None
+            self._members.set((guild.id, user_id), member)
+        return member
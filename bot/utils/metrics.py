@@ -0,0 +1,166 @@
+"""In-process latency histograms and counters, exported in Prometheus format"""
+import time
+import functools
+import inspect
+import logging
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Seconds, from sub-millisecond matching up to slow database calls.
+BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+           0.25, 0.5, 1, 2.5, 5, 10)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class Histogram:
+    """Cumulative-bucket histogram like Prometheus uses"""
+
+    def __init__(self, buckets: tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last one is +Inf.
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Return the upper bound of the bucket holding the q-th quantile"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    """Registry of every histogram and counter in the process"""
+
+    def __init__(self):
+        self.histograms: dict[str, dict[Labels, Histogram]] = {}
+        self.counters: dict[str, dict[Labels, float]] = {}
+        self.gauges: dict[str, dict[Labels, float]] = {}
+        self.started = time.monotonic()
+
+    @staticmethod
+    def _labels(labels: dict) -> Labels:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        series = self.histograms.setdefault(name, {})
+        key = self._labels(labels)
+        if key not in series:
+            series[key] = Histogram()
+        series[key].observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        series = self.counters.setdefault(name, {})
+        key = self._labels(labels)
+        series[key] = series.get(key, 0) + amount
+
+    def set(self, name: str, value: float, **labels) -> None:
+        self.gauges.setdefault(name, {})[self._labels(labels)] = value
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Observe how long the block took, in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def stage(self, stage: str):
+        """Time one stage of the message hot path"""
+        return self.timer("nword_stage_seconds", stage=stage)
+
+    def summary(self, name: str) -> dict[str, dict]:
+        """Return count, mean and approximate p50/p99 per label set, in ms"""
+        summary = {}
+        for labels, histogram in self.histograms.get(name, {}).items():
+            summary[",".join(value for _, value in labels)] = {
+                "count": histogram.count,
+                "mean_ms": round(histogram.sum / histogram.count * 1000, 2) if histogram.count else 0,
+                "p50_ms": histogram.quantile(0.5) * 1000,
+                "p99_ms": histogram.quantile(0.99) * 1000
+            }
+        return summary
+
+    def render(self) -> str:
+        """Return every series in the Prometheus text exposition format"""
+        def fmt(labels: Labels, extra: str = "") -> str:
+            parts = [f'{key}="{value}"' for key, value in labels] + ([extra] if extra else [])
+            return "{" + ",".join(parts) + "}" if parts else ""
+
+        lines = []
+        for kind, family in (("counter", self.counters), ("gauge", self.gauges)):
+            for name, series in sorted(family.items()):
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in series.items():
+                    lines.append(f"{name}{fmt(labels)} {value}")
+        for name, series in sorted(self.histograms.items()):
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    le = fmt(labels, f'le="{bound}"')
+                    lines.append(f"{name}_bucket{le} {cumulative}")
+                le = fmt(labels, 'le="+Inf"')
+                lines.append(f"{name}_bucket{le} {histogram.count}")
+                lines.append(f"{name}_sum{fmt(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{fmt(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+# Shared by every module.
+metrics = Metrics()
+
+
+def instrument_class(cls, name: str = "db_call_seconds") -> None:
+    """Wrap every async classmethod of `cls` with a latency histogram and
+    an error counter, labelled by method name"""
+    for attr, value in list(vars(cls).items()):
+        if not isinstance(value, classmethod):
+            continue
+        func = value.__func__
+        if not inspect.iscoroutinefunction(func):
+            continue
+
+        def wrap(func, method=attr):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                except Exception:
+                    metrics.inc(f"{name.removesuffix('_seconds')}_errors_total", method=method)
+                    raise
+                finally:
+                    metrics.observe(name, time.perf_counter() - start, method=method)
+            return wrapper
+
+        setattr(cls, attr, classmethod(wrap(func)))
+
+
+async def start_http_server(port: int, host: str = "127.0.0.1"):
+    """Serve /metrics for Prometheus to scrape, return the aiohttp runner"""
+    from aiohttp import web  # Only needed when METRICS_PORT is set.
+
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render(), content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Serving metrics on {host}:{port}/metrics")
+    return runner
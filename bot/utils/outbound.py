@@ -0,0 +1,257 @@
+"""Rate-limit-aware scheduler for everything the bot sends on its own"""
+import time
+import asyncio
+import logging
+from enum import IntEnum
+from typing import Any, NamedTuple
+
+import discord
+
+from utils.metrics import metrics
+
+MAX_MESSAGE_LENGTH = 2000  # Discord rejects longer messages.
+
+
+class Priority(IntEnum):
+    """Lower values are sent first"""
+    REPLY = 0  # Replies to counted n-words.
+    NOTICE = 1  # Webhook and slash command migration notices.
+    PRESENCE = 2
+
+
+class TokenBucket:
+    """Allow `rate` sends per second with bursts of up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready_in(self) -> float:
+        """Return seconds until a token is available"""
+        self._refill()
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+    def take(self) -> bool:
+        if self.ready_in() > 0:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class Outbound(NamedTuple):
+    """A reply waiting for its channel's turn"""
+    priority: Priority
+    deadline: float
+    message: discord.Message
+    content: str | None
+    kwargs: dict[str, Any]
+
+
+class OutboundScheduler:
+    """Send replies through per-channel and global token buckets.
+
+    Discord allows roughly 5 messages per 5 seconds per channel and 50
+    requests per second per bot, so replies wait here instead of running
+    into 429s. Pending count replies in the same channel are merged into a
+    single message, and anything still unsent after `deadline` seconds is
+    dropped since it's no longer relevant. Presence updates go through their
+    own bucket and only the latest one is kept.
+    """
+
+    def __init__(self, bot, channel_rate: float = 1, channel_burst: int = 5,
+                 global_rate: float = 40, deadline: float = 15,
+                 presence_interval: float = 30):
+        self.bot = bot
+        self.channel_rate = channel_rate
+        self.channel_burst = channel_burst
+        self.deadline = deadline
+
+        self._global = TokenBucket(global_rate, global_rate)
+        self._presence_bucket = TokenBucket(1 / presence_interval, 1)
+        self._channels: dict[int, list[Outbound]] = {}
+        self._buckets: dict[int, TokenBucket] = {}
+        self._presence: discord.BaseActivity | None = None
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._sends: set[asyncio.Task] = set()
+
+        self._stats = {
+            "sent": 0,
+            "coalesced": 0,
+            "dropped_stale": 0,
+            "errors": 0,
+            "presence_updates": 0
+        }
+
+    def _ensure_task(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def reply(self, message: discord.Message, content: str | None = None,
+              priority: Priority = Priority.REPLY, **kwargs) -> None:
+        """Queue a reply to a message, returns immediately"""
+        item = Outbound(
+            priority, time.monotonic() + self.deadline, message, content, kwargs)
+        self._channels.setdefault(message.channel.id, []).append(item)
+        self._ensure_task()
+        self._wake.set()
+
+    def set_presence(self, activity: discord.BaseActivity) -> None:
+        """Queue a presence change, replacing any not yet applied"""
+        self._presence = activity
+        self._ensure_task()
+        self._wake.set()
+
+    def _bucket(self, channel_id: int) -> TokenBucket:
+        if channel_id not in self._buckets:
+            self._buckets[channel_id] = TokenBucket(self.channel_rate, self.channel_burst)
+        return self._buckets[channel_id]
+
+    def _drop_stale(self) -> None:
+        now = time.monotonic()
+        for channel_id in list(self._channels):
+            fresh = [item for item in self._channels[channel_id] if item.deadline >= now]
+            self._stats["dropped_stale"] += len(self._channels[channel_id]) - len(fresh)
+            if fresh:
+                self._channels[channel_id] = fresh
+            else:
+                del self._channels[channel_id]
+
+    def _drop_idle_buckets(self) -> None:
+        # A refilled bucket is the same as a new one, so channels with nothing
+        # queued don't need theirs kept. Dropping one early would reset the limit.
+        for channel_id in [channel_id for channel_id in self._buckets
+                           if channel_id not in self._channels]:
+            if self._buckets[channel_id].is_full():
+                del self._buckets[channel_id]
+
+    def _next_channel(self) -> tuple[int | None, float]:
+        """Return the ready channel with the most urgent item, or the wait"""
+        best, best_key, wait = None, None, self.deadline
+        for channel_id, items in self._channels.items():
+            ready_in = self._bucket(channel_id).ready_in()
+            if ready_in > 0:
+                wait = min(wait, ready_in)
+                continue
+            head = min(items, key=lambda item: (item.priority, item.deadline))
+            key = (head.priority, head.deadline)
+            if best_key is None or key < best_key:
+                best, best_key = channel_id, key
+        return best, wait
+
+    def _take_batch(self, channel_id: int) -> list[Outbound]:
+        """Pop the most urgent item, plus every count reply it merges with"""
+        items = self._channels[channel_id]
+        head = min(items, key=lambda item: (item.priority, item.deadline))
+        if head.priority == Priority.REPLY and not head.kwargs:
+            # Merged up to one message's worth, the rest go in the next one.
+            batch, length = [], -1
+            for item in items:
+                if item.priority != Priority.REPLY or item.kwargs:
+                    continue
+                length += len(item.content) + 1
+                if batch and length > MAX_MESSAGE_LENGTH:
+                    break
+                batch.append(item)
+        else:
+            batch = [head]
+        remaining = [item for item in items if item not in batch]
+        if remaining:
+            self._channels[channel_id] = remaining
+        else:
+            del self._channels[channel_id]
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            self._wake.clear()
+            self._drop_stale()
+            self._drop_idle_buckets()
+            wait = self.deadline
+
+            if self._presence is not None:
+                presence_wait = self._presence_bucket.ready_in()
+                if presence_wait == 0:
+                    self._presence_bucket.take()
+                    activity, self._presence = self._presence, None
+                    self._spawn(self._change_presence(activity))
+                else:
+                    wait = min(wait, presence_wait)
+
+            while self._channels:
+                global_wait = self._global.ready_in()
+                if global_wait > 0:
+                    wait = min(wait, global_wait)
+                    break
+                channel_id, channel_wait = self._next_channel()
+                if channel_id is None:
+                    wait = min(wait, channel_wait)
+                    break
+                self._global.take()
+                self._bucket(channel_id).take()
+                self._spawn(self._send(self._take_batch(channel_id)))
+
+            if not self._channels and self._presence is None:
+                wait = None  # Nothing to do until the next reply.
+            try:
+                await asyncio.wait_for(self._wake.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def _spawn(self, coro) -> None:
+        # Don't hold up the scheduler on HTTP round trips.
+        task = asyncio.get_running_loop().create_task(coro)
+        self._sends.add(task)
+        task.add_done_callback(self._sends.discard)
+
+    async def _send(self, batch: list[Outbound]) -> None:
+        start = time.perf_counter()
+        try:
+            if len(batch) == 1:
+                item = batch[0]
+                await item.message.reply(item.content, **item.kwargs)
+            else:
+                # One message instead of one per caught n-word.
+                self._stats["coalesced"] += len(batch) - 1
+                await batch[-1].message.channel.send(
+                    "\n".join(item.content for item in batch))
+            self._stats["sent"] += 1
+        except discord.HTTPException as e:
+            self._stats["errors"] += 1
+            logging.error(f"Failed to send reply: {e}")
+        finally:
+            metrics.observe("nword_stage_seconds", time.perf_counter() - start, stage="reply")
+
+    async def _change_presence(self, activity: discord.BaseActivity) -> None:
+        try:
+            await self.bot.change_presence(activity=activity)
+            self._stats["presence_updates"] += 1
+        except Exception as e:
+            self._stats["errors"] += 1
+            logging.error(f"Failed to change presence: {e}")
+
+    async def close(self) -> None:
+        """Stop scheduling, replies still queued are dropped"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._sends:
+            await asyncio.gather(*self._sends, return_exceptions=True)
+
+    def stats(self) -> dict:
+        """Return send, merge and drop counters"""
+        return {
+            **self._stats,
+            "pending": sum(len(items) for items in self._channels.values())
+        }
@@ -1,79 +1,97 @@
 """Discord pagination mold for ranks"""
-from typing import Any
+from math import ceil
+from typing import Any, Awaitable, Callable
 
 import discord
 from discord import Embed
+from discord.ext.pages import Paginator
 
+RANK_EMOJIS = ["🥇", "🥈", "🥉"]  # Top 3 have medal emojis lmao
 
-def paginator(
-    limit: int, max_per_page: int, embed_data: dict[Any],
-    data: list[Any], data_vals: dict[str]
-) -> list[Embed]:
-    """Return filled paginator structure with data"""
-    RANK_EMOJIS = ["🥇", "🥈", "🥉"]  # Top 3 have medal emojis lmao
-
-    embeds = []
-    limit_temp = limit
-
-    # Maximum of <limit> number of rankings per embed page.
-    rank_counter = 0
-    while limit_temp > 0:
-        curr_embed = discord.embeds.Embed.from_dict(embed_data)
-
-        current_page = f"**Showing top {limit}**\n"
-        num_per_page = 0
-        if limit_temp >= max_per_page:
-            num_per_page = max_per_page
-        else:
-            num_per_page = max_per_page - limit_temp
-
-        # Append a line for the current page.
-        for i in range(num_per_page):
-            emoji = None
-            match rank_counter + 1:
-                case 1:
-                    emoji = RANK_EMOJIS[0]
-                case 2:
-                    emoji = RANK_EMOJIS[1]
-                case 3:
-                    emoji = RANK_EMOJIS[2]
-
-            object = None
-            try:
-                object = data[rank_counter]
-            except IndexError:
-                pass
-
-            if object is None:
-                current_page += f"**{rank_counter + 1}**) N/A\n"
-            else:
-                # Choosing what to put for each line based on command.
-                command = data_vals["type"]
-                if command == "topservers":
-                    line_with_emoji = f"**{emoji}** {object['_id']['guild_name']} - **{object['nword_count']:,}** n-words\n"
-                    line_without_emoji = f"**{rank_counter + 1}**) {object['_id']['guild_name']} - **{object['nword_count']:,}** n-words\n"
-                elif command == "topcounts":
-                    line_with_emoji = f"**{emoji}** {object['member']} - **{object['nword_count']:,}** n-words\n"
-                    line_without_emoji = f"**{rank_counter + 1}**) {object['member']} - **{object['nword_count']:,}** n-words\n"
-                elif command == "rankings":
-                    # * next to name signifies they are black.
-                    signifier = ""
-                    if object["name"] is not None:
-                        if object["is_black"]:
-                            signifier += "*"
-                        elif object["has_pass"]:
-                            signifier += "~"
-                    line_with_emoji = f"**{emoji}** {signifier}{object['name']} - **{object['nword_count']:,}** n-words\n"
-                    line_without_emoji = f"**{rank_counter + 1}**) {signifier}{object['name']} - **{object['nword_count']:,}** n-words\n"
-
-                if emoji:
-                    current_page += f"{line_with_emoji}"
-                else:
-                    current_page += f"{line_without_emoji}"
-
-            rank_counter += 1
-
-        curr_embed.add_field(name="", value=current_page, inline=False)
-        embeds.append(curr_embed)
-        limit_temp -= 10
-    return embeds
+
+def render_line(rank: int, object: dict | None, command: str) -> str:
+    """Return the leaderboard line for a 1-indexed rank"""
+    if object is None:
+        return f"**{rank}**) N/A\n"
+
+    # Top 3 get their medal instead of the rank number.
+    prefix = f"**{RANK_EMOJIS[rank - 1]}**" if rank <= len(RANK_EMOJIS) else f"**{rank}**)"
+
+    # Choosing what to put for each line based on command.
+    if command == "topservers":
+        name = object["_id"]["guild_name"]
+    elif command == "topcounts":
+        name = object["member"]
+    elif command == "rankings":
+        # * next to name signifies they are black.
+        signifier = ""
+        if object["name"] is not None:
+            if object["is_black"]:
+                signifier += "*"
+            elif object["has_pass"]:
+                signifier += "~"
+        name = f"{signifier}{object['name']}"
+    return f"{prefix} {name} - **{object['nword_count']:,}** n-words\n"
+
+
+def render_page(
+    limit: int, first_rank: int, num_rows: int, embed_data: dict[Any],
+    rows: list[Any], data_vals: dict[str]
+) -> Embed:
+    """Return one embed page with rows starting at a 0-indexed rank"""
+    curr_embed = discord.embeds.Embed.from_dict(embed_data)
+    lines = [f"**Showing top {limit}**\n"]
+    for i in range(num_rows):
+        object = rows[i] if i < len(rows) else None
+        lines.append(render_line(first_rank + i + 1, object, data_vals["type"]))
+    curr_embed.add_field(name="", value="".join(lines), inline=False)
+    return curr_embed
+
+
+class RankingPageSource:
+    """Fetch and render leaderboard pages only when they are viewed
+
+    `fetch(skip, count)` returns the rows for one page, so only that slice
+    of the leaderboard is ever pulled from the database. Rendered pages are
+    kept for when the user flips back.
+    """
+
+    def __init__(
+        self, fetch: Callable[[int, int], Awaitable[list[Any]]], limit: int,
+        max_per_page: int, embed_data: dict[Any], data_vals: dict[str]
+    ):
+        self.fetch = fetch
+        self.limit = limit
+        self.max_per_page = max_per_page
+        self.embed_data = embed_data
+        self.data_vals = data_vals
+        self.page_count = ceil(limit / max_per_page)
+        self._rendered: dict[int, Embed] = {}
+
+    async def get_page(self, index: int) -> Embed:
+        if index not in self._rendered:
+            first_rank = index * self.max_per_page
+            num_rows = min(self.max_per_page, self.limit - first_rank)
+            rows = await self.fetch(first_rank, num_rows)
+            self._rendered[index] = render_page(
+                self.limit, first_rank, num_rows, self.embed_data, rows,
+                self.data_vals)
+        return self._rendered[index]
+
+
+class LazyPaginator(Paginator):
+    """Paginator rendering each page from a RankingPageSource on demand"""
+
+    def __init__(self, source: RankingPageSource, **kwargs):
+        self.source = source
+        # Placeholders, swapped for the rendered page right before it's shown.
+        super().__init__(
+            pages=[Embed() for _ in range(source.page_count)], **kwargs)
+
+    async def goto_page(self, page_number: int = 0, *, interaction=None) -> None:
+        self.pages[page_number] = await self.source.get_page(page_number)
+        await super().goto_page(page_number, interaction=interaction)
+
+    async def respond(self, *args, **kwargs):
+        self.pages[self.current_page] = await self.source.get_page(self.current_page)
+        return await super().respond(*args, **kwargs)
@@ -0,0 +1,143 @@
+"""Startup profiling: import times, extension setup, database and shard timings"""
+import sys
+import json
+import time
+import logging
+from contextlib import contextmanager
+from importlib.machinery import ExtensionFileLoader, SourceFileLoader, SourcelessFileLoader
+
+from utils.config import config
+
+# Where to write the JSON report once every shard is ready, "" to skip it.
+PROFILE_PATH = config.get("STARTUP_PROFILE", "")
+
+# Loaders created per module, so patching an instance only times that module.
+_TIMED_LOADERS = (SourceFileLoader, SourcelessFileLoader, ExtensionFileLoader)
+
+
+class _ImportTimer:
+    """Meta path finder timing each module body as it executes
+
+    It resolves specs through the finders after it and only wraps the
+    loader's exec_module, so imports behave exactly as without it.
+    """
+
+    def __init__(self, profiler: "StartupProfiler"):
+        self.profiler = profiler
+        self._stack: list[list[float]] = []  # [start, time spent in children]
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if isinstance(spec.loader, _TIMED_LOADERS):
+            spec.loader.exec_module = self._timed(name, spec.loader.exec_module)
+        return spec
+
+    def _timed(self, name: str, exec_module):
+        def exec_timed(module):
+            frame = [time.perf_counter(), 0.0]
+            self._stack.append(frame)
+            try:
+                exec_module(module)
+            finally:
+                self._stack.pop()
+                total = time.perf_counter() - frame[0]
+                if self._stack:
+                    self._stack[-1][1] += total
+                self.profiler.imports[name] = {
+                    "total_ms": round(total * 1000, 3),
+                    "self_ms": round((total - frame[1]) * 1000, 3)
+                }
+        return exec_timed
+
+
+class StartupProfiler:
+    """Collects startup timings, relative to when this module was imported"""
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.path = PROFILE_PATH  # run_bot gives each cluster worker its own.
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.imports: dict[str, dict] = {}
+        self.phases: dict[str, float] = {}
+        self.extensions: dict[str, dict] = {}
+        self.shards: dict[int, dict[str, float]] = {}
+        self.ready: float | None = None
+        self._timer: _ImportTimer | None = None
+
+    def elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self.started) * 1000, 3)
+
+    def install_import_hook(self) -> None:
+        if self._timer is None:
+            self._timer = _ImportTimer(self)
+            sys.meta_path.insert(0, self._timer)
+
+    def remove_import_hook(self) -> None:
+        if self._timer is not None:
+            sys.meta_path.remove(self._timer)
+            self._timer = None
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time a startup step, e.g. connecting the database"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round((time.perf_counter() - start) * 1000, 3)
+
+    @contextmanager
+    def extension(self, name: str):
+        """Time loading an extension, split into import and setup if hooked"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            total = round((time.perf_counter() - start) * 1000, 3)
+            imported = self.imports.get(name, {}).get("total_ms")
+            self.extensions[name] = {
+                "total_ms": total,
+                "import_ms": imported,
+                "setup_ms": None if imported is None else round(total - imported, 3)
+            }
+
+    def shard_event(self, shard_id: int, event: str) -> None:
+        """Record when a shard connected, became ready or resumed"""
+        self.shards.setdefault(shard_id, {})[event] = self.elapsed_ms()
+
+    def report(self) -> dict:
+        return {
+            "started_at": self.started_at,
+            "ready_ms": self.ready,
+            "phases": self.phases,
+            "extensions": self.extensions,
+            "shards": {str(shard_id): events for shard_id, events in sorted(self.shards.items())},
+            # Slowest first, only modules imported after the hook went in.
+            "imports": dict(sorted(
+                self.imports.items(), key=lambda item: item[1]["total_ms"], reverse=True))
+        }
+
+    def finish(self) -> None:
+        """Mark the bot ready and write the report, only the first call counts"""
+        if self.ready is not None:
+            return
+        self.ready = self.elapsed_ms()
+        self.remove_import_hook()
+        logging.info(f"Ready {self.ready / 1000:.2f}s after startup")
+        if self.enabled:
+            with open(self.path, "w") as f:
+                json.dump(self.report(), f, indent=2)
+            logging.info(f"Wrote startup profile to {self.path}")
+
+
+profiler = StartupProfiler(enabled=bool(PROFILE_PATH))
+if profiler.enabled:
+    profiler.install_import_hook()
@@ -0,0 +1,35 @@
+"""Guild settings schema and helpers to convert stored values"""
+import json
+from typing import Any
+
+DEFAULT_SETTINGS = [
+    {
+        "name": "Send Message",
+        "int_name": "send_message",
+        "description": "Whether or not the bot should send messages in response to nwords",
+        "type": "bool",
+        "default": True,
+        "value": True
+    }
+]
+
+
+def merge_settings(values: dict[str, Any]) -> list[dict]:
+    """Return the full settings list with stored values over the defaults"""
+    return [
+        {**setting, "value": values.get(setting["int_name"], setting["default"])}
+        for setting in DEFAULT_SETTINGS
+    ]
+
+
+def settings_values(settings: list[dict]) -> dict[str, Any]:
+    """Return only what gets stored: {int_name: value}"""
+    return {setting["int_name"]: setting["value"] for setting in settings}
+
+
+def parse_legacy_settings(settings: str) -> dict[str, Any]:
+    """Convert settings stored as a JSON string of the full list"""
+    try:
+        return settings_values(json.loads(settings))
+    except (ValueError, TypeError, KeyError):
+        return {}
@@ -0,0 +1,22 @@
+"""Storage backends behind utils.database.Database"""
+from utils.storage.base import StorageBackend, member_template
+
+BACKENDS = ("mongo", "sqlite", "memory")
+
+
+def create_backend(name: str, **options) -> StorageBackend:
+    """Return the backend for the STORAGE_BACKEND config value
+
+    Backends are imported here so Motor is only needed when Mongo is used.
+    Nothing connects until the backend's start() is awaited.
+    """
+    if name == "mongo":
+        from utils.storage.mongo import MongoBackend
+        return MongoBackend(**options["mongo"])
+    if name == "sqlite":
+        from utils.storage.sqlite import SQLiteBackend
+        return SQLiteBackend(options["sqlite_path"])
+    if name == "memory":
+        from utils.storage.memory import MemoryBackend
+        return MemoryBackend()
+    raise ValueError(f"Unknown storage backend {name!r}, expected one of {BACKENDS}")
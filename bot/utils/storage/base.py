@@ -0,0 +1,205 @@
+"""Operations every storage backend provides to utils.database"""
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any
+
+from utils.increment_buffer import Batch
+
+
+def member_template(member_id: int, member_name: str | None) -> dict:
+    """Return a fresh member object"""
+    return {
+        "id": member_id,  # STORED AS AN INTEGER NOT STRING.
+        "name": member_name,
+        "nword_count": 0,
+        "is_black": False,
+        "has_pass": False,
+        "passes": 0,
+        "voters": []
+    }
+
+
+# Member flags that can be listed with flagged_names.
+MEMBER_FLAGS = ("is_black", "has_pass")
+
+
+def vote_result(type: str, voters_before: list[int], voter_id: int,
+                vote_threshold: int) -> dict:
+    """Return the outcome of a vote given the voters it was applied to
+
+    {"applied": False} means the vote was already there (or the unvote
+    wasn't), voters are unchanged then.
+    """
+    voted_before = voter_id in voters_before
+    applied = voted_before != (type == "vote")
+    votes = len(voters_before)
+    if applied:
+        votes += 1 if type == "vote" else -1
+    return {"applied": applied, "votes": votes, "is_black": votes >= vote_threshold}
+
+
+class StorageBackend(ABC):
+    """Persistence behind the Database facade.
+
+    Backends only store and query, caching, buffering and instrumentation
+    stay in Database so every backend gets them. Members are returned as
+    plain dicts shaped like `member_template` plus their guild_id, guild
+    leaderboard entries as {"_id": {"guild_id", "guild_name"}, "nword_count"}
+    and member leaderboard entries as {"member", "nword_count"}.
+    """
+
+    async def start(self) -> None:
+        """Connect and warm up, raise if the backend is unusable"""
+
+    # Guilds.
+
+    @abstractmethod
+    async def guild_exists(self, guild_id: int) -> bool:
+        ...
+
+    @abstractmethod
+    async def upsert_guilds(self, guilds: list[tuple[int, str]]) -> None:
+        """Create each (guild_id, guild_name) or refresh its name"""
+
+    @abstractmethod
+    async def rename_guild(self, guild_id: int, guild_name: str) -> None:
+        ...
+
+    @abstractmethod
+    async def count_guilds(self) -> int:
+        ...
+
+    # Settings.
+
+    @abstractmethod
+    async def get_settings(self, guild_id: int) -> dict[str, Any]:
+        """Return stored {int_name: value} settings, empty if none"""
+
+    @abstractmethod
+    async def set_settings(self, guild_id: int, values: dict[str, Any]) -> None:
+        ...
+
+    async def migrate_settings(self) -> list[int]:
+        """Convert legacy settings, return the guild ids converted"""
+        return []
+
+    # Members.
+
+    @abstractmethod
+    async def get_member(self, guild_id: int, member_id: int) -> dict | None:
+        ...
+
+    @abstractmethod
+    async def create_member(
+            self, guild_id: int, member_id: int, member_name: str) -> None:
+        """Insert a fresh member, no-op if they already exist"""
+
+    @abstractmethod
+    async def increment_member(
+            self, guild_id: int, member_id: int, field: str, count: int) -> None:
+        """Add to a counter of an existing member, no-op if they don't exist"""
+
+    @abstractmethod
+    async def record_occurrence(
+            self, guild_id: int, member_id: int, member_name: str,
+            count: int) -> dict:
+        """Create member if missing, add to their count and set their name
+
+        Returns the member after the update.
+        """
+
+    @abstractmethod
+    async def apply_increments(self, batch: Batch) -> None:
+        """Apply buffered deltas to members, guild totals and the global total
+
+        Missing members are created with no name. Deltas with a member_id of
+        None only count towards the totals, (None, None) only towards the
+        global total. Either everything is written or nothing, or
+        PartialFlushError is raised with the deltas that weren't, so the
+        buffer never writes a delta twice.
+        """
+
+    @abstractmethod
+    async def member_page(
+            self, guild_id: int, skip: int = 0,
+            limit: int | None = None) -> list[dict]:
+        """Return guild members ranked by count, as {name, is_black,
+        has_pass, nword_count}"""
+
+    @abstractmethod
+    async def flagged_names(self, guild_id: int, flag: str) -> list[str]:
+        """Return names of guild members with a MEMBER_FLAGS flag set, ranked
+        by count
+
+        Raises ValueError for any other field.
+        """
+
+    @abstractmethod
+    async def cast_vote(
+            self, type: str, guild_id: int, vote_threshold: int,
+            voter_id: int, votee_id: int) -> dict | None:
+        """Add or remove a voter and recompute is_black, atomically
+
+        Adding an existing voter or removing a missing one changes nothing
+        but is_black. Returns `vote_result`, None if the member doesn't exist.
+        """
+
+    # Totals.
+
+    @abstractmethod
+    async def get_guild_total(self, guild_id: int) -> int:
+        ...
+
+    @abstractmethod
+    async def get_global_total(self) -> int | None:
+        """Return the running global total, None if never stored"""
+
+    @abstractmethod
+    async def guild_totals(self) -> dict[int, int]:
+        """Return the stored running total of every guild"""
+
+    @abstractmethod
+    async def member_totals(self) -> dict[int, int]:
+        """Return the sum of member counts per guild"""
+
+    @abstractmethod
+    async def set_totals(
+            self, guild_totals: dict[int, int], global_total: int) -> None:
+        """Overwrite running totals of the given guilds and the global total"""
+
+    # Leaderboards.
+
+    @abstractmethod
+    async def top_servers(self, limit: int) -> list[dict]:
+        ...
+
+    @abstractmethod
+    async def top_counts(self, limit: int) -> list[dict]:
+        ...
+
+    @abstractmethod
+    async def materialize_leaderboards(self, limit: int) -> None:
+        """Store top_servers as "guilds" and top_counts as "users" snapshots"""
+
+    @abstractmethod
+    async def get_leaderboards(self) -> dict[str, dict]:
+        """Return snapshots as {name: {"entries", "as_of"}}, as_of naive UTC"""
+
+    # Maintenance, only meaningful for some backends.
+
+    async def ensure_indexes(self) -> list[str]:
+        return []
+
+    async def index_report(self) -> dict:
+        return {"missing": [], "unused": []}
+
+    async def migrate_members(self, batch_size: int = 500) -> dict:
+        return {"guilds": 0, "members": 0}
+
+    async def close(self) -> None:
+        pass
+
+
+def utcnow() -> datetime:
+    """Naive UTC timestamp, what Mongo hands back for $$NOW"""
+    return datetime.utcnow()
@@ -0,0 +1,126 @@
+"""Load a mongoexport of the bot's collections into a SQLite database.
+
+Export each collection with mongoexport (JSON lines or --jsonArray), e.g.
+    mongoexport --uri <MONGO_URL> --db NWordCounter -c guild_users_db -o guilds.json
+    mongoexport --uri <MONGO_URL> --db NWordCounter -c guild_members -o members.json
+
+USAGE: cd bot, then
+    py -m utils.storage.import_mongo --guilds guilds.json [--members members.json]
+    [--db nwordcounter.sqlite3]
+
+Members still embedded in guild documents are imported too, folded into
+their per-member row if both exist. Running totals are recomputed from the
+imported member counts.
+"""
+import sys
+import json
+import asyncio
+import argparse
+from typing import Any, Iterator
+
+from utils.settings import parse_legacy_settings
+from utils.storage.base import member_template
+from utils.storage.sqlite import SQLiteBackend
+
+
+def plain(value: Any) -> Any:
+    """Convert Extended JSON wrappers ($numberLong, $oid, ...) to plain values"""
+    if isinstance(value, list):
+        return [plain(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if len(value) == 1:
+        key, inner = next(iter(value.items()))
+        if key in ("$numberLong", "$numberInt"):
+            return int(inner)
+        if key == "$numberDouble":
+            return float(inner)
+        if key in ("$oid", "$date"):
+            return inner
+    return {key: plain(inner) for key, inner in value.items()}
+
+
+def read_export(path: str) -> Iterator[dict]:
+    """Yield documents of a mongoexport file in either output format"""
+    with open(path, encoding="utf-8") as f:
+        text = f.read().strip()
+    if text.startswith("["):  # --jsonArray
+        docs = json.loads(text)
+    else:
+        docs = (json.loads(line) for line in text.splitlines() if line.strip())
+    for doc in docs:
+        yield plain(doc)
+
+
+def merge_member(into: dict, member: dict) -> None:
+    """Fold a second copy of a member into the first, like migrate_members"""
+    into["nword_count"] += member.get("nword_count", 0)
+    into["passes"] += member.get("passes", 0)
+    into["voters"] = list(dict.fromkeys(into["voters"] + member.get("voters", [])))
+    into["is_black"] = into["is_black"] or member.get("is_black", False)
+    into["has_pass"] = into["has_pass"] or member.get("has_pass", False)
+    into["name"] = into["name"] or member.get("name")
+
+
+def convert(guild_docs: Iterator[dict], member_docs: Iterator[dict]) -> tuple[list, list]:
+    """Return (guild rows, member rows) ready for SQLiteBackend.import_data"""
+    guilds, members = {}, {}
+
+    def add_member(guild_id: int, doc: dict) -> None:
+        key = (guild_id, doc["id"])
+        if key in members:
+            merge_member(members[key], doc)
+            return
+        member = {**member_template(doc["id"], None), "guild_id": guild_id}
+        member.update({field: doc[field] for field in member if field in doc})
+        members[key] = member
+
+    for doc in guild_docs:
+        settings = doc.get("settings", {})
+        if isinstance(settings, str):  # Never migrated.
+            settings = parse_legacy_settings(settings)
+        guilds[doc["guild_id"]] = {
+            "guild_id": doc["guild_id"],
+            "guild_name": doc.get("guild_name"),
+            "settings": settings,
+            "nword_total": 0
+        }
+        for member in doc.get("members", []):  # Pre-split documents.
+            add_member(doc["guild_id"], member)
+    for doc in member_docs:
+        add_member(doc["guild_id"], doc)
+
+    for member in members.values():
+        if member["guild_id"] in guilds:
+            guilds[member["guild_id"]]["nword_total"] += member["nword_count"]
+    return list(guilds.values()), list(members.values())
+
+
+async def run(guilds_path: str, members_path: str | None, db_path: str) -> dict:
+    guilds, members = convert(
+        read_export(guilds_path),
+        read_export(members_path) if members_path else iter(()))
+    backend = SQLiteBackend(db_path)
+    await backend.start()
+    try:
+        await backend.import_data(
+            guilds, members, sum(member["nword_count"] for member in members))
+    finally:
+        await backend.close()
+    return {"guilds": len(guilds), "members": len(members)}
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--guilds", required=True, help="export of guild_users_db")
+    parser.add_argument("--members", help="export of guild_members")
+    parser.add_argument("--db", default="nwordcounter.sqlite3", help="SQLite file to write")
+    args = parser.parse_args(argv)
+
+    imported = asyncio.run(run(args.guilds, args.members, args.db))
+    print(f"Imported {imported['guilds']:,} guilds and {imported['members']:,} "
+          f"members into {args.db}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
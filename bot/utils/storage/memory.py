@@ -0,0 +1,177 @@
+"""In-process storage backend for tests, benchmarks and local development"""
+import copy
+from typing import Any
+
+from utils.increment_buffer import Batch
+from utils.storage.base import MEMBER_FLAGS, StorageBackend, member_template, utcnow, vote_result
+
+
+class MemoryBackend(StorageBackend):
+    """Same semantics as MongoBackend, kept in dicts and gone on exit"""
+
+    def __init__(self):
+        # guild_id: {"guild_id", "guild_name", "settings", "nword_total"}
+        self._guilds: dict[int, dict] = {}
+        self._members: dict[tuple[int, int], dict] = {}
+        self._global_total: int | None = None
+        self._leaderboards: dict[str, dict] = {}
+
+    # Handing out copies keeps callers from editing stored state in place,
+    # like they can't with documents fetched from Mongo.
+
+    async def guild_exists(self, guild_id: int) -> bool:
+        return guild_id in self._guilds
+
+    async def upsert_guilds(self, guilds: list[tuple[int, str]]) -> None:
+        for guild_id, name in guilds:
+            guild = self._guilds.setdefault(
+                guild_id, {"guild_id": guild_id, "settings": {}, "nword_total": 0})
+            guild["guild_name"] = name
+
+    async def rename_guild(self, guild_id: int, guild_name: str) -> None:
+        if guild_id in self._guilds:
+            self._guilds[guild_id]["guild_name"] = guild_name
+
+    async def count_guilds(self) -> int:
+        return len(self._guilds)
+
+    async def get_settings(self, guild_id: int) -> dict[str, Any]:
+        guild = self._guilds.get(guild_id)
+        return dict(guild["settings"]) if guild else {}
+
+    async def set_settings(self, guild_id: int, values: dict[str, Any]) -> None:
+        if guild_id in self._guilds:
+            self._guilds[guild_id]["settings"] = dict(values)
+
+    async def get_member(self, guild_id: int, member_id: int) -> dict | None:
+        return copy.deepcopy(self._members.get((guild_id, member_id)))
+
+    def _insert_member(self, guild_id: int, member_id: int,
+                       member_name: str | None) -> dict:
+        key = (guild_id, member_id)
+        if key not in self._members:
+            self._members[key] = {
+                "guild_id": guild_id, **member_template(member_id, member_name)}
+        return self._members[key]
+
+    async def create_member(
+            self, guild_id: int, member_id: int, member_name: str) -> None:
+        self._insert_member(guild_id, member_id, member_name)
+
+    async def increment_member(
+            self, guild_id: int, member_id: int, field: str, count: int) -> None:
+        member = self._members.get((guild_id, member_id))
+        if member is not None:
+            member[field] += count
+
+    async def record_occurrence(
+            self, guild_id: int, member_id: int, member_name: str,
+            count: int) -> dict:
+        member = self._insert_member(guild_id, member_id, member_name)
+        member["nword_count"] += count
+        member["name"] = member_name
+        return copy.deepcopy(member)
+
+    async def apply_increments(self, batch: Batch) -> None:
+        for (guild_id, member_id), count in batch.items():
+            if member_id is not None:
+                self._insert_member(guild_id, member_id, None)["nword_count"] += count
+            if guild_id in self._guilds:
+                self._guilds[guild_id]["nword_total"] += count
+        if batch:
+            self._global_total = (self._global_total or 0) + sum(batch.values())
+
+    def _ranked(self, members) -> list[dict]:
+        # Stable, so ties keep insertion order like an unindexed Mongo sort.
+        return sorted(members, key=lambda member: member["nword_count"], reverse=True)
+
+    async def member_page(
+            self, guild_id: int, skip: int = 0,
+            limit: int | None = None) -> list[dict]:
+        ranked = self._ranked(
+            member for member in self._members.values()
+            if member["guild_id"] == guild_id)
+        end = None if limit is None else skip + limit
+        return [
+            {field: member[field]
+             for field in ("name", "is_black", "has_pass", "nword_count")}
+            for member in ranked[skip:end]
+        ]
+
+    async def flagged_names(self, guild_id: int, flag: str) -> list[str]:
+        if flag not in MEMBER_FLAGS:
+            raise ValueError(f"{flag} is not a member flag")
+        flagged = [
+            member for member in self._members.values()
+            if member["guild_id"] == guild_id and member[flag]
+        ]
+        flagged.sort(key=lambda member: member["nword_count"], reverse=True)
+        return [member["name"] for member in flagged]
+
+    async def cast_vote(
+            self, type: str, guild_id: int, vote_threshold: int,
+            voter_id: int, votee_id: int) -> dict | None:
+        member = self._members.get((guild_id, votee_id))
+        if member is None:  # User doesn't exist.
+            return None
+        result = vote_result(type, member["voters"], voter_id, vote_threshold)
+        if result["applied"] and type == "vote":
+            member["voters"].append(voter_id)
+        elif result["applied"]:
+            member["voters"].remove(voter_id)
+        member["is_black"] = result["is_black"]
+        return result
+
+    async def get_guild_total(self, guild_id: int) -> int:
+        guild = self._guilds.get(guild_id)
+        return guild["nword_total"] if guild else 0
+
+    async def get_global_total(self) -> int | None:
+        return self._global_total
+
+    async def guild_totals(self) -> dict[int, int]:
+        return {
+            guild_id: guild["nword_total"] for guild_id, guild in self._guilds.items()}
+
+    async def member_totals(self) -> dict[int, int]:
+        totals: dict[int, int] = {}
+        for member in self._members.values():
+            totals[member["guild_id"]] = totals.get(member["guild_id"], 0) + member["nword_count"]
+        return totals
+
+    async def set_totals(
+            self, guild_totals: dict[int, int], global_total: int) -> None:
+        for guild_id, total in guild_totals.items():
+            if guild_id in self._guilds:
+                self._guilds[guild_id]["nword_total"] = total
+        self._global_total = global_total
+
+    async def top_servers(self, limit: int) -> list[dict]:
+        ranked = sorted(
+            self._guilds.values(), key=lambda guild: guild["nword_total"], reverse=True)
+        return [
+            {
+                "_id": {"guild_id": guild["guild_id"], "guild_name": guild["guild_name"]},
+                "nword_count": guild["nword_total"]
+            }
+            for guild in ranked[:limit]
+        ]
+
+    async def top_counts(self, limit: int) -> list[dict]:
+        return [
+            {"member": member["name"], "nword_count": member["nword_count"]}
+            for member in self._ranked(self._members.values())[:limit]
+        ]
+
+    async def materialize_leaderboards(self, limit: int) -> None:
+        as_of = utcnow()
+        for name, entries in (
+            ("guilds", await self.top_servers(limit)),
+            ("users", await self.top_counts(limit))
+        ):
+            if entries:  # $group outputs nothing for an empty collection.
+                self._leaderboards[name] = {
+                    "_id": name, "entries": entries, "as_of": as_of}
+
+    async def get_leaderboards(self) -> dict[str, dict]:
+        return copy.deepcopy(self._leaderboards)
@@ -0,0 +1,584 @@
+"""MongoDB storage backend through Motor"""
+import asyncio
+import logging
+from typing import Any
+
+import motor.motor_asyncio as motor  # Asyncio version of pymongo.
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure
+
+from utils.increment_buffer import Batch, PartialFlushError
+from utils.indexes import IndexManager
+from utils.settings import parse_legacy_settings
+from utils.storage.base import MEMBER_FLAGS, StorageBackend, member_template, vote_result
+
+# Server-side limit for aggregations over whole collections (verifying
+# totals, leaderboard snapshots), well above how long they should take.
+LONG_JOB_MS = 10 * 60 * 1000
+
+# Fields returned for ranked member lists.
+RANK_PROJECTION = {
+    "_id": False,
+    "name": True,
+    "is_black": True,
+    "has_pass": True,
+    "nword_count": True
+}
+
+
+class MongoBackend(StorageBackend):
+    """MongoDB database"""
+
+    def __init__(self, url: str, db_name: str = "NWordCounter",
+                 max_pool_size: int = 100, min_pool_size: int = 0,
+                 timeout_ms: int = 5000, compressors: str = "",
+                 retries: int = 5, backoff: float = 1):
+        if not url:
+            raise ValueError("MONGO_URL is not set in config.json or the environment")
+        self.url = url
+        self.db_name = db_name
+        self.client_options = {
+            "maxPoolSize": max_pool_size,
+            # Opened in the background after connecting, ready for the first burst.
+            "minPoolSize": min_pool_size,
+            "serverSelectionTimeoutMS": timeout_ms,
+            "connectTimeoutMS": timeout_ms,
+            # No socketTimeoutMS: it would apply to every operation, index
+            # builds and the aggregations below included. Those get maxTimeMS.
+        }
+        if compressors:  # e.g. "zstd,snappy,zlib", zlib needs no extra package.
+            self.client_options["compressors"] = compressors
+        self.retries = retries
+        self.backoff = backoff
+        self._cluster: motor.AsyncIOMotorClient | None = None
+
+    async def start(self) -> None:
+        """Create the client on the running loop, ping it and warm it up
+
+        Unreachable servers are retried with exponential backoff, anything
+        else (bad credentials, bad URL options) raises straight away.
+        """
+        self._cluster = motor.AsyncIOMotorClient(self.url, **self.client_options)
+
+        # _cluster.admin.command("enableSharding", "NWordCounter")
+        # _cluster.admin.command(
+        #     "shardCollection", "NWordCounter.guild_users_db", key=1)
+
+        self._db = self._cluster[self.db_name]
+        self._collection = self._db["guild_users_db"]
+        # One document per (guild_id, id) member, split out of guild documents.
+        self._members = self._db["guild_members"]
+        # Running totals that aren't tied to one guild, e.g. the global count.
+        self._stats = self._db["bot_stats"]
+        # Global leaderboards materialized in the background.
+        self._leaderboards = self._db["leaderboards"]
+
+        for attempt in range(1, self.retries + 1):
+            try:
+                await self._cluster.admin.command("ping")
+                break
+            except ConnectionFailure as e:
+                if attempt == self.retries:
+                    logging.error(
+                        f"Failed to connect to MongoDB, please check settings! Error: {e}")
+                    raise
+                delay = self.backoff * 2 ** (attempt - 1)
+                logging.warning(
+                    f"MongoDB ping failed ({attempt}/{self.retries}), "
+                    f"retrying in {delay}s: {e}")
+                await asyncio.sleep(delay)
+        logging.info(
+            "Pinged your deployment. You successfully connected to MongoDB!")
+
+        # Touch the hot collections so the first message doesn't pay for
+        # authentication on a fresh socket and cold index pages.
+        await asyncio.gather(
+            self._collection.find_one({}, {"_id": True}),
+            self._members.find_one({}, {"_id": True}),
+            self._stats.find_one({"_id": "global"}))
+
+    @staticmethod
+    def _guild_template(guild_name: str) -> dict:
+        """Return upsert creating the guild template or refreshing its name"""
+        return {
+            "$set": {"guild_name": guild_name},
+            "$setOnInsert": {
+                "settings": {}  # {int_name: value}, defaults fill the rest.
+            }
+        }
+
+    @staticmethod
+    def _new_member_fields(member_id: int) -> dict:
+        """Return template fields an upsert sets besides count and name"""
+        fields = member_template(member_id, None)
+        del fields["nword_count"], fields["name"]  # Set by $inc and $set.
+        return fields
+
+    async def guild_exists(self, guild_id: int) -> bool:
+        return await self._collection.count_documents({"guild_id": guild_id}) > 0
+
+    async def upsert_guilds(self, guilds: list[tuple[int, str]]) -> None:
+        if not guilds:
+            return
+        # Upsert so concurrent messages can't insert the same guild twice.
+        await self._collection.bulk_write(
+            [
+                UpdateOne(
+                    {"guild_id": guild_id}, self._guild_template(name),
+                    upsert=True)
+                for guild_id, name in guilds
+            ],
+            ordered=False
+        )
+
+    async def rename_guild(self, guild_id: int, guild_name: str) -> None:
+        await self._collection.update_one(
+            {"guild_id": guild_id}, {
+                "$set": {
+                    "guild_name": guild_name
+                }
+            }
+        )
+
+    async def count_guilds(self) -> int:
+        return await self._collection.count_documents({})
+
+    async def get_settings(self, guild_id: int) -> dict[str, Any]:
+        doc = await self._collection.find_one(
+            {"guild_id": guild_id}, {"_id": False, "settings": True})
+        values = (doc or {}).get("settings", {})
+        if isinstance(values, str):  # Not migrated yet.
+            values = parse_legacy_settings(values)
+        return values
+
+    async def set_settings(self, guild_id: int, values: dict[str, Any]) -> None:
+        await self._collection.update_one(
+            {"guild_id": guild_id}, {
+                "$set": {
+                    "settings": values
+                }
+            }
+        )
+
+    async def migrate_settings(self) -> list[int]:
+        """Convert settings stored as JSON strings into native sub-documents"""
+        converted = []
+        async for doc in self._collection.find(
+            {"$or": [
+                {"settings": {"$type": "string"}},
+                {"settings": {"$exists": False}}
+            ]},
+            {"guild_id": True, "settings": True}
+        ):
+            values = parse_legacy_settings(doc.get("settings", "[]"))
+            await self._collection.update_one(
+                {"_id": doc["_id"]}, {"$set": {"settings": values}})
+            converted.append(doc["guild_id"])
+        return converted
+
+    async def get_member(self, guild_id: int, member_id: int) -> dict | None:
+        return await self._members.find_one(
+            {
+                "guild_id": guild_id,
+                "id": member_id  # STORED AS AN INTEGER NOT STRING.
+            },
+            {"_id": False}
+        )
+
+    async def create_member(
+            self, guild_id: int, member_id: int, member_name: str) -> None:
+        await self._members.update_one(
+            {"guild_id": guild_id, "id": member_id}, {
+                "$setOnInsert": member_template(member_id, member_name)
+            },
+            upsert=True  # No-op if the member already exists.
+        )
+
+    async def increment_member(
+            self, guild_id: int, member_id: int, field: str, count: int) -> None:
+        await self._members.update_one(
+            {
+                "guild_id": guild_id,
+                "id": member_id
+            },
+            {
+                "$inc": {
+                    field: count
+                }
+            },
+            upsert=False  # Don't create new document if not found.
+        )
+
+    async def record_occurrence(
+            self, guild_id: int, member_id: int, member_name: str,
+            count: int) -> dict:
+        return await self._members.find_one_and_update(
+            {"guild_id": guild_id, "id": member_id},
+            {
+                "$inc": {"nword_count": count},
+                "$set": {"name": member_name},  # Also fills in buffered upserts.
+                "$setOnInsert": self._new_member_fields(member_id)
+            },
+            projection={"_id": False},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def apply_increments(self, batch: Batch) -> None:
+        """Apply buffered increments, then guild totals, then the global total
+
+        Three writes that can't share a transaction on a standalone server.
+        Each one moves what it wrote on to the next stage's key (member ->
+        (guild_id, None) -> (None, None)), so if one fails PartialFlushError
+        only carries what's left and no member is counted twice.
+        """
+        remaining = dict(batch)
+        try:
+            await self._increment_members(remaining)
+            await self._increment_guild_totals(remaining)
+            total = remaining.get((None, None), 0)
+            if total:
+                await self._stats.update_one(
+                    {"_id": "global"}, {"$inc": {"nword_total": total}}, upsert=True)
+            remaining.pop((None, None), None)
+        except Exception as e:
+            raise PartialFlushError(remaining, e) from e
+
+    @staticmethod
+    def _move_on(remaining: Batch, written: list[tuple], failed: set[tuple],
+                 next_key) -> None:
+        """Re-key written deltas for the next stage, keep failed ones as they are"""
+        for key in written:
+            if key in failed:
+                continue
+            count = remaining.pop(key)
+            remaining[next_key(key)] = remaining.get(next_key(key), 0) + count
+
+    async def _bulk_stage(self, collection, keys: list[tuple], ops: list[UpdateOne],
+                          remaining: Batch, next_key) -> None:
+        """Run one unordered bulk write and move its successes on"""
+        if not ops:
+            return
+        try:
+            await collection.bulk_write(
+                ops,
+                ordered=False  # Keep going past a bad update, order is irrelevant.
+            )
+        except BulkWriteError as e:
+            # Only writeErrors were not applied, the rest of the batch was.
+            failed = {keys[error["index"]] for error in e.details.get("writeErrors", [])}
+            self._move_on(remaining, keys, failed, next_key)
+            if failed:
+                raise
+            return
+        self._move_on(remaining, keys, set(), next_key)
+
+    async def _increment_members(self, remaining: Batch) -> None:
+        keys = [key for key in remaining if key[1] is not None]
+        ops = [
+            UpdateOne(
+                {
+                    "guild_id": guild_id,
+                    "id": member_id
+                },
+                {
+                    "$inc": {
+                        "nword_count": remaining[(guild_id, member_id)]
+                    },
+                    # Name is unknown here, the next recorded hit sets it.
+                    "$setOnInsert": {
+                        **self._new_member_fields(member_id), "name": None}
+                },
+                upsert=True
+            )
+            for guild_id, member_id in keys
+        ]
+        await self._bulk_stage(
+            self._members, keys, ops, remaining, lambda key: (key[0], None))
+
+    async def _increment_guild_totals(self, remaining: Batch) -> None:
+        # Every delta counts towards its guild and then the global total.
+        keys = [key for key in remaining if key[0] is not None and key[1] is None]
+        ops = [
+            UpdateOne({"guild_id": guild_id}, {"$inc": {"nword_total": remaining[(guild_id, None)]}})
+            for guild_id, _ in keys
+        ]
+        await self._bulk_stage(
+            self._collection, keys, ops, remaining, lambda key: (None, None))
+
+    async def member_page(
+            self, guild_id: int, skip: int = 0,
+            limit: int | None = None) -> list[dict]:
+        cursor = self._members.find(
+            {"guild_id": guild_id}, RANK_PROJECTION
+        ).sort("nword_count", -1).skip(skip)
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list(length=None)
+
+    async def flagged_names(self, guild_id: int, flag: str) -> list[str]:
+        if flag not in MEMBER_FLAGS:
+            raise ValueError(f"{flag} is not a member flag")
+        # {flag: True} lets the partial index in REQUIRED_INDEXES serve it.
+        cursor = self._members.find(
+            {"guild_id": guild_id, flag: True}, {"_id": False, "name": True}
+        ).sort("nword_count", -1)
+        return [member["name"] async for member in cursor]
+
+    async def cast_vote(
+            self, type: str, guild_id: int, vote_threshold: int,
+            voter_id: int, votee_id: int) -> dict | None:
+        if type == "vote":
+            # $addToSet, without reordering voters like $setUnion would.
+            voters = {"$cond": [
+                {"$in": [voter_id, "$voters"]},
+                "$voters",
+                {"$concatArrays": ["$voters", [voter_id]]}
+            ]}
+        else:
+            # $pull.
+            voters = {"$filter": {
+                "input": "$voters", "cond": {"$ne": ["$$this", voter_id]}}}
+
+        # One update pipeline, so is_black can't go stale between votes.
+        before = await self._members.find_one_and_update(
+            {"guild_id": guild_id, "id": votee_id},
+            [
+                {"$set": {"voters": voters}},
+                {"$set": {"is_black": {"$gte": [{"$size": "$voters"}, vote_threshold]}}}
+            ],
+            projection={"_id": False, "voters": True},
+            return_document=ReturnDocument.BEFORE
+        )
+        if before is None:  # User doesn't exist.
+            return None
+        return vote_result(type, before["voters"], voter_id, vote_threshold)
+
+    async def get_guild_total(self, guild_id: int) -> int:
+        doc = await self._collection.find_one(
+            {"guild_id": guild_id}, {"_id": False, "nword_total": True})
+        return doc.get("nword_total", 0) if doc else 0
+
+    async def get_global_total(self) -> int | None:
+        doc = await self._stats.find_one({"_id": "global"})
+        return doc["nword_total"] if doc else None
+
+    async def guild_totals(self) -> dict[int, int]:
+        return {
+            doc["guild_id"]: doc.get("nword_total", 0)
+            async for doc in self._collection.find(
+                {}, {"_id": False, "guild_id": True, "nword_total": True})
+        }
+
+    async def member_totals(self) -> dict[int, int]:
+        return {
+            doc["_id"]: doc["total_nwords"]
+            async for doc in self._members.aggregate(
+                [
+                    {
+                        "$group": {
+                            "_id": "$guild_id",
+                            "total_nwords": {"$sum": "$nword_count"}
+                        }
+                    }
+                ],
+                maxTimeMS=LONG_JOB_MS
+            )
+        }
+
+    async def set_totals(
+            self, guild_totals: dict[int, int], global_total: int) -> None:
+        if guild_totals:
+            await self._collection.bulk_write(
+                [
+                    UpdateOne(
+                        {"guild_id": guild_id},
+                        {"$set": {"nword_total": total}})
+                    for guild_id, total in guild_totals.items()
+                ],
+                ordered=False
+            )
+        await self._stats.update_one(
+            {"_id": "global"}, {"$set": {"nword_total": global_total}},
+            upsert=True)
+
+    @staticmethod
+    def _top_servers_pipeline(limit: int) -> list[dict]:
+        """Return pipeline ranking guild documents by their running total"""
+        return [
+            {
+                "$sort": {"nword_total": -1}
+            },
+            {
+                "$limit": limit
+            },
+            {
+                "$project": {
+                    "_id": {
+                        "guild_id": "$guild_id",
+                        "guild_name": "$guild_name"
+                    },
+                    "nword_count": {"$ifNull": ["$nword_total", 0]}
+                }
+            }
+        ]
+
+    @staticmethod
+    def _top_counts_pipeline(limit: int) -> list[dict]:
+        """Return pipeline ranking member documents across all guilds"""
+        return [
+            {
+                "$sort": {"nword_count": -1}
+            },
+            {
+                "$limit": limit
+            },
+            {
+                "$project": {
+                    "_id": False,
+                    "member": "$name",
+                    "nword_count": True
+                }
+            }
+        ]
+
+    async def top_servers(self, limit: int) -> list[dict]:
+        return await self._collection.aggregate(
+            self._top_servers_pipeline(limit)).to_list(length=None)
+
+    async def top_counts(self, limit: int) -> list[dict]:
+        return await self._members.aggregate(
+            self._top_counts_pipeline(limit)).to_list(length=None)
+
+    async def materialize_leaderboards(self, limit: int) -> None:
+        for name, collection, pipeline in (
+            ("guilds", self._collection, self._top_servers_pipeline(limit)),
+            ("users", self._members, self._top_counts_pipeline(limit))
+        ):
+            await collection.aggregate(
+                pipeline + [
+                    {
+                        "$group": {  # Keeps the sorted order.
+                            "_id": name,
+                            "entries": {"$push": "$$ROOT"}
+                        }
+                    },
+                    {
+                        "$set": {"as_of": "$$NOW"}
+                    },
+                    {
+                        "$merge": {
+                            "into": self._leaderboards.name,
+                            "on": "_id",
+                            "whenMatched": "replace",
+                            "whenNotMatched": "insert"
+                        }
+                    }
+                ],
+                maxTimeMS=LONG_JOB_MS
+            ).to_list(length=None)
+
+    async def get_leaderboards(self) -> dict[str, dict]:
+        return {
+            doc["_id"]: doc
+            async for doc in self._leaderboards.find({})
+        }
+
+    async def ensure_indexes(self) -> list[str]:
+        return await IndexManager(self._db).ensure()
+
+    async def index_report(self) -> dict:
+        return await IndexManager(self._db).report()
+
+    async def migrate_members(self, batch_size: int = 500) -> dict:
+        """Move embedded members arrays into the per-member collection
+
+        Safe to interrupt and re-run: a guild's members array is only unset
+        once all of its members are written, and members already migrated
+        are skipped. A member who already got a document in the new
+        collection keeps it, with the old counts added on top.
+        """
+        migrated = {"guilds": 0, "members": 0}
+        async for doc in self._collection.find(
+            {"members": {"$exists": True}},
+            {"guild_id": True, "guild_name": True, "members": True}
+        ):
+            guild_id = doc["guild_id"]
+            members = self._merge_duplicate_members(doc["members"])
+            for start in range(0, len(members), batch_size):
+                await self._members.bulk_write(
+                    [
+                        UpdateOne(
+                            {"guild_id": guild_id, "id": member["id"]},
+                            self._migrate_member_pipeline(member),
+                            upsert=True
+                        )
+                        for member in members[start:start + batch_size]
+                    ],
+                    ordered=False
+                )
+            await self._collection.update_one(
+                {"_id": doc["_id"]}, {"$unset": {"members": ""}})
+
+            migrated["guilds"] += 1
+            migrated["members"] += len(members)
+            logging.info(
+                f"Migrated {len(members)} members of {doc.get('guild_name')} "
+                f"({guild_id}), {migrated['guilds']} guilds done")
+        return migrated
+
+    @staticmethod
+    def _merge_duplicate_members(members: list[dict]) -> list[dict]:
+        """Fold members pushed twice into the same array into one object"""
+        merged = {}
+        for member in members:
+            if member["id"] not in merged:
+                merged[member["id"]] = dict(member)
+                continue
+            first = merged[member["id"]]
+            first["nword_count"] = first.get("nword_count", 0) + member.get("nword_count", 0)
+            first["passes"] = first.get("passes", 0) + member.get("passes", 0)
+            first["voters"] = list(set(first.get("voters", [])) | set(member.get("voters", [])))
+            first["is_black"] = first.get("is_black", False) or member.get("is_black", False)
+            first["has_pass"] = first.get("has_pass", False) or member.get("has_pass", False)
+        return list(merged.values())
+
+    @staticmethod
+    def _migrate_member_pipeline(member: dict) -> list[dict]:
+        """Return update merging an embedded member into its own document"""
+        def merged(field, combine):
+            # Leave members already migrated by an earlier run untouched.
+            return {
+                "$cond": [
+                    {"$eq": ["$migrated", True]},
+                    f"${field}",
+                    combine
+                ]
+            }
+
+        voters = member.get("voters", [])
+        return [
+            {
+                "$set": {
+                    "name": {"$ifNull": ["$name", {"$literal": member.get("name")}]},
+                    "nword_count": merged("nword_count", {
+                        "$add": [{"$ifNull": ["$nword_count", 0]}, member.get("nword_count", 0)]}),
+                    "passes": merged("passes", {
+                        "$add": [{"$ifNull": ["$passes", 0]}, member.get("passes", 0)]}),
+                    "voters": merged("voters", {
+                        "$setUnion": [{"$ifNull": ["$voters", []]}, {"$literal": voters}]}),
+                    "is_black": merged("is_black", {
+                        "$or": [{"$ifNull": ["$is_black", False]}, member.get("is_black", False)]}),
+                    "has_pass": merged("has_pass", {
+                        "$or": [{"$ifNull": ["$has_pass", False]}, member.get("has_pass", False)]}),
+                }
+            },
+            {
+                "$set": {"migrated": True}
+            }
+        ]
+
+    async def close(self) -> None:
+        if self._cluster is not None:
+            self._cluster.close()
+            self._cluster = None
@@ -0,0 +1,370 @@
+"""Embedded SQLite storage backend for single-machine deployments"""
+import json
+import asyncio
+import sqlite3
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from typing import Any, Callable
+
+from utils.increment_buffer import Batch
+from utils.storage.base import MEMBER_FLAGS, StorageBackend, utcnow, vote_result
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS guilds (
+    guild_id INTEGER PRIMARY KEY,
+    guild_name TEXT,
+    settings TEXT NOT NULL DEFAULT '{}',
+    nword_total INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS members (
+    guild_id INTEGER NOT NULL,
+    id INTEGER NOT NULL,
+    name TEXT,
+    nword_count INTEGER NOT NULL DEFAULT 0,
+    is_black INTEGER NOT NULL DEFAULT 0,
+    has_pass INTEGER NOT NULL DEFAULT 0,
+    passes INTEGER NOT NULL DEFAULT 0,
+    voters TEXT NOT NULL DEFAULT '[]',
+    PRIMARY KEY (guild_id, id)
+);
+CREATE INDEX IF NOT EXISTS members_guild_rank ON members (guild_id, nword_count DESC);
+CREATE INDEX IF NOT EXISTS members_rank ON members (nword_count DESC);
+CREATE INDEX IF NOT EXISTS guilds_rank ON guilds (nword_total DESC);
+CREATE INDEX IF NOT EXISTS members_black ON members (guild_id, nword_count DESC) WHERE is_black = 1;
+CREATE INDEX IF NOT EXISTS members_pass ON members (guild_id, nword_count DESC) WHERE has_pass = 1;
+CREATE TABLE IF NOT EXISTS stats (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leaderboards (
+    name TEXT PRIMARY KEY,
+    entries TEXT NOT NULL,
+    as_of TEXT NOT NULL
+);
+"""
+
+# Statements are module constants so sqlite3's statement cache reuses the
+# prepared version instead of compiling them on every call.
+UPSERT_GUILD = """
+INSERT INTO guilds (guild_id, guild_name) VALUES (?, ?)
+ON CONFLICT (guild_id) DO UPDATE SET guild_name = excluded.guild_name
+"""
+INSERT_MEMBER = """
+INSERT INTO members (guild_id, id, name) VALUES (?, ?, ?)
+ON CONFLICT (guild_id, id) DO NOTHING
+"""
+RECORD_OCCURRENCE = """
+INSERT INTO members (guild_id, id, name, nword_count) VALUES (?, ?, ?, ?)
+ON CONFLICT (guild_id, id) DO UPDATE SET
+    nword_count = nword_count + excluded.nword_count,
+    name = excluded.name
+"""
+INCREMENT_MEMBER = """
+INSERT INTO members (guild_id, id, nword_count) VALUES (?, ?, ?)
+ON CONFLICT (guild_id, id) DO UPDATE SET
+    nword_count = nword_count + excluded.nword_count
+"""
+INCREMENT_GUILD = "UPDATE guilds SET nword_total = nword_total + ? WHERE guild_id = ?"
+INCREMENT_GLOBAL = """
+INSERT INTO stats (key, value) VALUES ('global', ?)
+ON CONFLICT (key) DO UPDATE SET value = value + excluded.value
+"""
+SET_GLOBAL = """
+INSERT INTO stats (key, value) VALUES ('global', ?)
+ON CONFLICT (key) DO UPDATE SET value = excluded.value
+"""
+SELECT_MEMBER = "SELECT * FROM members WHERE guild_id = ? AND id = ?"
+# rowid breaks ties in insertion order, like the other backends.
+MEMBER_PAGE = """
+SELECT name, is_black, has_pass, nword_count FROM members
+WHERE guild_id = ? ORDER BY nword_count DESC, rowid LIMIT ? OFFSET ?
+"""
+TOP_COUNTS = """
+SELECT name, nword_count FROM members ORDER BY nword_count DESC, rowid LIMIT ?
+"""
+TOP_SERVERS = """
+SELECT guild_id, guild_name, nword_total FROM guilds
+ORDER BY nword_total DESC, rowid LIMIT ?
+"""
+
+# Updatable counters, the column name is formatted into the statement.
+COUNTER_FIELDS = ("nword_count", "passes")
+# WHERE matches the partial index of each flag, so only flagged rows are read.
+FLAGGED_NAMES = {
+    flag: f"SELECT name FROM members WHERE guild_id = ? AND {flag} = 1 "
+          f"ORDER BY nword_count DESC, rowid"
+    for flag in MEMBER_FLAGS
+}
+
+
+class SQLiteBackend(StorageBackend):
+    """SQLite database in WAL mode.
+
+    sqlite3 blocks, so every call runs on one dedicated thread, which also
+    serializes writes the way SQLite wants them. Multi-row writes share one
+    transaction.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor: ThreadPoolExecutor | None = None
+        self._conn: sqlite3.Connection | None = None
+
+    async def start(self) -> None:
+        # A new thread per start, close() shuts the last one down.
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="sqlite")
+        # Opened on the executor thread, the only one allowed to use it.
+        await self._run(self._connect)
+
+    def _connect(self) -> None:
+        self._conn = sqlite3.connect(self.path, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        # Safe in WAL mode, only the last commits can be lost on power loss.
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.executescript(SCHEMA)
+        logging.info(f"Opened SQLite database at {self.path}")
+
+    async def _run(self, func: Callable, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, partial(func, *args))
+
+    def _transaction(self, func: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Run func in one transaction, rolled back if it raises"""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = func(self._conn)
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+        return result
+
+    async def _write(self, func: Callable[[sqlite3.Connection], Any]) -> Any:
+        return await self._run(self._transaction, func)
+
+    async def _fetchall(self, sql: str, *params) -> list[sqlite3.Row]:
+        return await self._run(lambda: self._conn.execute(sql, params).fetchall())
+
+    async def _fetchone(self, sql: str, *params) -> sqlite3.Row | None:
+        return await self._run(lambda: self._conn.execute(sql, params).fetchone())
+
+    @staticmethod
+    def _member(row: sqlite3.Row | None) -> dict | None:
+        if row is None:
+            return None
+        member = dict(row)
+        member["is_black"] = bool(member["is_black"])
+        member["has_pass"] = bool(member["has_pass"])
+        member["voters"] = json.loads(member["voters"])
+        return member
+
+    @staticmethod
+    def _ranked(row: sqlite3.Row) -> dict:
+        return {
+            "name": row["name"],
+            "is_black": bool(row["is_black"]),
+            "has_pass": bool(row["has_pass"]),
+            "nword_count": row["nword_count"]
+        }
+
+    async def guild_exists(self, guild_id: int) -> bool:
+        return await self._fetchone(
+            "SELECT 1 FROM guilds WHERE guild_id = ?", guild_id) is not None
+
+    async def upsert_guilds(self, guilds: list[tuple[int, str]]) -> None:
+        if guilds:
+            await self._write(lambda conn: conn.executemany(UPSERT_GUILD, guilds))
+
+    async def rename_guild(self, guild_id: int, guild_name: str) -> None:
+        await self._write(lambda conn: conn.execute(
+            "UPDATE guilds SET guild_name = ? WHERE guild_id = ?",
+            (guild_name, guild_id)))
+
+    async def count_guilds(self) -> int:
+        return (await self._fetchone("SELECT COUNT(*) FROM guilds"))[0]
+
+    async def get_settings(self, guild_id: int) -> dict[str, Any]:
+        row = await self._fetchone(
+            "SELECT settings FROM guilds WHERE guild_id = ?", guild_id)
+        return json.loads(row["settings"]) if row else {}
+
+    async def set_settings(self, guild_id: int, values: dict[str, Any]) -> None:
+        await self._write(lambda conn: conn.execute(
+            "UPDATE guilds SET settings = ? WHERE guild_id = ?",
+            (json.dumps(values), guild_id)))
+
+    async def get_member(self, guild_id: int, member_id: int) -> dict | None:
+        return self._member(await self._fetchone(SELECT_MEMBER, guild_id, member_id))
+
+    async def create_member(
+            self, guild_id: int, member_id: int, member_name: str) -> None:
+        await self._write(lambda conn: conn.execute(
+            INSERT_MEMBER, (guild_id, member_id, member_name)))
+
+    async def increment_member(
+            self, guild_id: int, member_id: int, field: str, count: int) -> None:
+        if field not in COUNTER_FIELDS:
+            raise ValueError(f"{field} is not a member counter")
+        await self._write(lambda conn: conn.execute(
+            f"UPDATE members SET {field} = {field} + ? WHERE guild_id = ? AND id = ?",
+            (count, guild_id, member_id)))
+
+    async def record_occurrence(
+            self, guild_id: int, member_id: int, member_name: str,
+            count: int) -> dict:
+        def record(conn: sqlite3.Connection) -> sqlite3.Row:
+            conn.execute(RECORD_OCCURRENCE, (guild_id, member_id, member_name, count))
+            return conn.execute(SELECT_MEMBER, (guild_id, member_id)).fetchone()
+        return self._member(await self._write(record))
+
+    async def apply_increments(self, batch: Batch) -> None:
+        global_total = sum(batch.values())
+        guild_totals: dict[int, int] = {}
+        for (guild_id, _), count in batch.items():
+            if guild_id is not None:  # (None, None) is global only.
+                guild_totals[guild_id] = guild_totals.get(guild_id, 0) + count
+        if not batch:
+            return
+
+        def apply(conn: sqlite3.Connection) -> None:
+            conn.executemany(INCREMENT_MEMBER, [
+                (guild_id, member_id, count)
+                for (guild_id, member_id), count in batch.items()
+                if member_id is not None
+            ])
+            conn.executemany(INCREMENT_GUILD, [
+                (total, guild_id) for guild_id, total in guild_totals.items()])
+            conn.execute(INCREMENT_GLOBAL, (global_total,))
+        await self._write(apply)
+
+    async def member_page(
+            self, guild_id: int, skip: int = 0,
+            limit: int | None = None) -> list[dict]:
+        rows = await self._fetchall(
+            MEMBER_PAGE, guild_id, -1 if limit is None else limit, skip)
+        return [self._ranked(row) for row in rows]
+
+    async def flagged_names(self, guild_id: int, flag: str) -> list[str]:
+        if flag not in MEMBER_FLAGS:
+            raise ValueError(f"{flag} is not a member flag")
+        rows = await self._fetchall(FLAGGED_NAMES[flag], guild_id)
+        return [row["name"] for row in rows]
+
+    async def cast_vote(
+            self, type: str, guild_id: int, vote_threshold: int,
+            voter_id: int, votee_id: int) -> dict | None:
+        def vote(conn: sqlite3.Connection) -> dict | None:
+            # Read and write share the BEGIN IMMEDIATE transaction of _write.
+            row = conn.execute(
+                "SELECT voters FROM members WHERE guild_id = ? AND id = ?",
+                (guild_id, votee_id)).fetchone()
+            if row is None:  # User doesn't exist.
+                return None
+            voters = json.loads(row["voters"])
+            result = vote_result(type, voters, voter_id, vote_threshold)
+            if result["applied"] and type == "vote":
+                voters.append(voter_id)
+            elif result["applied"]:
+                voters.remove(voter_id)
+            conn.execute(
+                "UPDATE members SET voters = ?, is_black = ? WHERE guild_id = ? AND id = ?",
+                (json.dumps(voters), result["is_black"], guild_id, votee_id))
+            return result
+        return await self._write(vote)
+
+    async def get_guild_total(self, guild_id: int) -> int:
+        row = await self._fetchone(
+            "SELECT nword_total FROM guilds WHERE guild_id = ?", guild_id)
+        return row["nword_total"] if row else 0
+
+    async def get_global_total(self) -> int | None:
+        row = await self._fetchone("SELECT value FROM stats WHERE key = 'global'")
+        return row["value"] if row else None
+
+    async def guild_totals(self) -> dict[int, int]:
+        rows = await self._fetchall("SELECT guild_id, nword_total FROM guilds")
+        return {row["guild_id"]: row["nword_total"] for row in rows}
+
+    async def member_totals(self) -> dict[int, int]:
+        rows = await self._fetchall(
+            "SELECT guild_id, SUM(nword_count) AS total FROM members GROUP BY guild_id")
+        return {row["guild_id"]: row["total"] for row in rows}
+
+    async def set_totals(
+            self, guild_totals: dict[int, int], global_total: int) -> None:
+        def set_totals(conn: sqlite3.Connection) -> None:
+            conn.executemany(
+                "UPDATE guilds SET nword_total = ? WHERE guild_id = ?",
+                [(total, guild_id) for guild_id, total in guild_totals.items()])
+            conn.execute(SET_GLOBAL, (global_total,))
+        await self._write(set_totals)
+
+    async def top_servers(self, limit: int) -> list[dict]:
+        return [
+            {
+                "_id": {"guild_id": row["guild_id"], "guild_name": row["guild_name"]},
+                "nword_count": row["nword_total"]
+            }
+            for row in await self._fetchall(TOP_SERVERS, limit)
+        ]
+
+    async def top_counts(self, limit: int) -> list[dict]:
+        return [
+            {"member": row["name"], "nword_count": row["nword_count"]}
+            for row in await self._fetchall(TOP_COUNTS, limit)
+        ]
+
+    async def materialize_leaderboards(self, limit: int) -> None:
+        as_of = utcnow().isoformat()
+        snapshots = [
+            (name, json.dumps(entries), as_of)
+            for name, entries in (
+                ("guilds", await self.top_servers(limit)),
+                ("users", await self.top_counts(limit))
+            )
+            if entries  # Same as Mongo, nothing to snapshot.
+        ]
+        await self._write(lambda conn: conn.executemany(
+            "INSERT OR REPLACE INTO leaderboards (name, entries, as_of) VALUES (?, ?, ?)",
+            snapshots))
+
+    async def get_leaderboards(self) -> dict[str, dict]:
+        return {
+            row["name"]: {
+                "_id": row["name"],
+                "entries": json.loads(row["entries"]),
+                "as_of": datetime.fromisoformat(row["as_of"])
+            }
+            for row in await self._fetchall("SELECT * FROM leaderboards")
+        }
+
+    async def import_data(
+            self, guilds: list[dict], members: list[dict],
+            global_total: int | None) -> None:
+        """Bulk load guild and member rows in one transaction (import tool)"""
+        def load(conn: sqlite3.Connection) -> None:
+            conn.executemany(
+                "INSERT OR REPLACE INTO guilds (guild_id, guild_name, settings, nword_total) "
+                "VALUES (:guild_id, :guild_name, :settings, :nword_total)",
+                [{**guild, "settings": json.dumps(guild["settings"])} for guild in guilds])
+            conn.executemany(
+                "INSERT OR REPLACE INTO members "
+                "(guild_id, id, name, nword_count, is_black, has_pass, passes, voters) "
+                "VALUES (:guild_id, :id, :name, :nword_count, :is_black, :has_pass, "
+                ":passes, :voters)",
+                [{**member, "voters": json.dumps(member["voters"])} for member in members])
+            if global_total is not None:
+                conn.execute(SET_GLOBAL, (global_total,))
+        await self._write(load)
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None